@@ -0,0 +1,336 @@
+"""
+Asynchronous actor-learner training. Actor processes step their own environment with a copy of the policy weights,
+the learner (the training process) runs the updates of SACAlgorithm without waiting for the environments.
+
+The actors only need NumPy, they act with a NumpyPolicy whose weights are views of a local copy of SharedPolicyWeights.
+Finished episodes go through a queue to the learner, which adds them to its replay buffer with one add_batch. Like
+that the buffer, its episode index and the n-step returns stay in one process.
+"""
+import ctypes
+import logging
+import multiprocessing as mp
+import queue
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from SAC_Implementation.NumpyPolicy import NumpyPolicy
+from SAC_Implementation.VectorEnv import environment_seeds
+
+# One episode of an actor. version_lag is the mean number of learner updates the weights used for the actions were
+# behind the learner.
+ActorEpisode = namedtuple('ActorEpisode', ['actor', 'obs', 'action', 'reward', 'next_obs', 'done', 'timeout',
+                                           'ep_return', 'length', 'version_lag'])
+
+# Index of the shared learner state
+_UPDATES, _UPDATE_START, _STOP = 0, 1, 2
+
+
+def _policy_layers(policy):
+    """Linear layers of a PolicyNetwork in the order of NumpyPolicy"""
+    return [policy.linear1] + list(policy.hidden_layer) + [policy.mean_linear, policy.log_std_linear]
+
+
+class SharedPolicyWeights(object):
+    """
+    The weights of a PolicyNetwork as one float32 array in shared memory, written by the learner with publish and
+    read by the actors with read.
+
+    A sequence counter makes it a seqlock: publish makes it odd while the weights are copied and even again
+    afterwards, read retries until it got the same even sequence before and after the copy. version is the number of
+    learner updates of the published weights.
+    """
+
+    def __init__(self, policy, ctx):
+        """
+        :param policy: PolicyNetwork which is published, only its layer shapes are used here
+        :param ctx: multiprocessing context of the actors
+        """
+        # [out, in] like torch, NumpyPolicy gets the transposed views
+        self.shapes = []
+        for layer in _policy_layers(policy):
+            self.shapes += [tuple(layer.weight.shape), tuple(layer.bias.shape)]
+        self.size = int(sum(np.prod(shape) for shape in self.shapes))
+        self.log_std_min, self.log_std_max = policy.log_std_min, policy.log_std_max
+
+        self._raw = ctx.RawArray(ctypes.c_float, self.size)
+        # [sequence, version]
+        self._state = ctx.RawArray(ctypes.c_int64, 2)
+        self._views = None
+
+    def _arrays(self, flat):
+        arrays, offset = [], 0
+        for shape in self.shapes:
+            n = int(np.prod(shape))
+            arrays.append(flat[offset:offset + n].reshape(shape))
+            offset += n
+        return arrays
+
+    def __getstate__(self):
+        # The actors only get the shared arrays, not the views of the learner
+        return {**self.__dict__, '_views': None}
+
+    @property
+    def version(self):
+        return int(self._state[1])
+
+    def publish(self, policy, version):
+        """
+        Copy the weights of the policy into the shared memory.
+        :param version: Number of learner updates of the weights
+        """
+        if self._views is None:
+            self._views = self._arrays(np.frombuffer(self._raw, dtype=np.float32))
+
+        parameters = []
+        for layer in _policy_layers(policy):
+            parameters += [layer.weight, layer.bias]
+
+        self._state[0] += 1
+        for view, parameter in zip(self._views, parameters):
+            np.copyto(view, parameter.detach().cpu().numpy())
+        self._state[1] = version
+        self._state[0] += 1
+
+    def read(self, out):
+        """
+        Copy the published weights into out without a torn read.
+        :param out: float32 array of size self.size
+        :return: Version of the copied weights
+        """
+        shared = np.frombuffer(self._raw, dtype=np.float32)
+        while True:
+            sequence = self._state[0]
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            np.copyto(out, shared)
+            version = self._state[1]
+            if self._state[0] == sequence:
+                return int(version)
+
+    def numpy_policy(self, flat):
+        """NumpyPolicy whose weights are views of flat, so read(flat) updates it in place"""
+        arrays = self._arrays(flat)
+        weights, biases = arrays[0:-4:2], arrays[1:-4:2]
+        return NumpyPolicy(weights=[w.T for w in weights],
+                           biases=biases,
+                           mean_weight=arrays[-4].T,
+                           mean_bias=arrays[-3],
+                           log_std_weight=arrays[-2].T,
+                           log_std_bias=arrays[-1],
+                           log_std_min=self.log_std_min,
+                           log_std_max=self.log_std_max)
+
+
+def _actor(index, make_env, seed, max_steps, weights, episodes, steps, learner, config):
+    """
+    Runs one environment until the learner stops the actors.
+    :param episodes: Queue for the ActorEpisodes (or the exception of a failure)
+    :param steps: Shared steps of all actors, this actor only writes steps[index]
+    :param learner: Shared [updates, env steps at the first update (-1 before), stop]
+    :param config: dict with random_episodes, utd_ratio and max_actor_lead
+    """
+    env = None
+    try:
+        env = make_env(seed)
+        flat = np.empty(weights.size, dtype=np.float32)
+        policy = weights.numpy_policy(flat)
+        policy.seed(seed)
+        version = weights.read(flat)
+        rng = np.random.default_rng(seed)
+        low, high = env.action_space.low, env.action_space.high
+
+        state_dim, action_dim = env.observation_space.shape[0], env.action_space.shape[0]
+        obs, next_obs = np.empty((max_steps, state_dim)), np.empty((max_steps, state_dim))
+        action, reward = np.empty((max_steps, action_dim)), np.empty(max_steps)
+        done, timeout = np.zeros(max_steps, dtype=np.uint8), np.zeros(max_steps, dtype=np.uint8)
+        utd_ratio, max_lead = config['utd_ratio'], config['max_actor_lead']
+
+        episode = 0
+        while not learner[_STOP]:
+            state, ep_return, lag, length = env.reset(), 0.0, 0, 0
+            for t in range(max_steps):
+                # Wait for the learner if the actors are too far ahead of the update-to-data ratio
+                while utd_ratio > 0 and learner[_UPDATE_START] >= 0 and not learner[_STOP] and \
+                        sum(steps) - learner[_UPDATE_START] - learner[_UPDATES] / utd_ratio > max_lead:
+                    time.sleep(0.001)
+                if learner[_STOP]:
+                    break
+
+                if weights.version != version:
+                    version = weights.read(flat)
+                lag += learner[_UPDATES] - version
+
+                if episode < config['random_episodes']:
+                    a = rng.uniform(low, high)
+                else:
+                    a = policy.act(state, deterministic=True)
+                s1, r, d, _ = env.step(a)
+
+                obs[t], action[t], reward[t], next_obs[t] = state, a, r, s1
+                # The last done is fake therefore we set it to false again (like run_sac)
+                timeout[t] = t + 1 == max_steps
+                done[t] = bool(d) and not timeout[t]
+                ep_return += r
+                length = t + 1
+                steps[index] += 1
+
+                if d:
+                    break
+                state = s1
+
+            if length == 0 or learner[_STOP]:
+                break
+            episodes.put(ActorEpisode(index, obs[:length].copy(), action[:length].copy(), reward[:length].copy(),
+                                      next_obs[:length].copy(), done[:length].copy(), timeout[:length].copy(),
+                                      ep_return, length, lag / length))
+            episode += 1
+    except Exception as e:
+        episodes.put(e)
+    finally:
+        if env is not None and hasattr(env, 'close'):
+            env.close()
+
+
+class AsyncActors(object):
+    """
+    Actor processes stepping one environment each with the published policy weights.
+
+    The learner publishes the weights with publish, collects the finished episodes with poll and reports its updates
+    with set_updates. The actors pause while they are more than max_actor_lead environment steps ahead of
+    updates / utd_ratio, so a slow learner does not fall behind the update-to-data ratio.
+    """
+
+    def __init__(self, make_env, num_actors, seed, max_steps, policy, utd_ratio, max_actor_lead=1000,
+                 random_episodes=0, start_method='spawn'):
+        """
+        :param make_env: Picklable function seed -> environment, e.g. functools.partial of make_dmc_env
+        :param num_actors: Number of actor processes
+        :param seed: Seed the seeds of the environments are derived from
+        :param max_steps: Steps after which an episode is ended with a timeout
+        :param policy: PolicyNetwork of the learner, its weights are published before the actors start
+        :param utd_ratio: Updates per environment step
+        :param max_actor_lead: Environment steps the actors may be ahead of the update-to-data ratio
+        :param random_episodes: Episodes every actor starts with uniform random actions
+        :param start_method: Start method of the actor processes
+        """
+        self.num_actors = num_actors
+        self.utd_ratio = utd_ratio
+        self.seeds = environment_seeds(seed, num_actors)
+
+        # The spaces of the environments, e.g. for SACAlgorithm
+        probe = make_env(self.seeds[0])
+        self.observation_space, self.action_space = probe.observation_space, probe.action_space
+        if hasattr(probe, 'close'):
+            probe.close()
+
+        ctx = mp.get_context(start_method)
+        self.weights = SharedPolicyWeights(policy, ctx)
+        self.weights.publish(policy, version=0)
+        self._steps = ctx.RawArray(ctypes.c_int64, num_actors)
+        self._learner = ctx.RawArray(ctypes.c_int64, 3)
+        self._learner[_UPDATE_START] = -1
+        self._episodes = ctx.Queue()
+
+        config = {'random_episodes': random_episodes,
+                  'utd_ratio': utd_ratio,
+                  'max_actor_lead': max_actor_lead}
+        self._processes = []
+        for index in range(num_actors):
+            process = ctx.Process(target=_actor,
+                                  args=(index, make_env, self.seeds[index], max_steps, self.weights,
+                                        self._episodes, self._steps, self._learner, config),
+                                  name=f'actor-{index}',
+                                  daemon=True)
+            process.start()
+            self._processes.append(process)
+        logging.info(f"Started {num_actors} actors")
+
+    @property
+    def env_steps(self):
+        """Environment steps of all actors"""
+        return int(sum(self._steps))
+
+    @property
+    def update_start(self):
+        """Environment steps when the learner started to update, -1 before"""
+        return int(self._learner[_UPDATE_START])
+
+    def start_updates(self):
+        self._learner[_UPDATE_START] = self.env_steps
+
+    def set_updates(self, updates):
+        self._learner[_UPDATES] = updates
+
+    def publish(self, policy, version):
+        self.weights.publish(policy, version)
+
+    def poll(self, timeout=None):
+        """
+        The episodes the actors finished since the last poll.
+        :param timeout: Seconds to wait for the first episode, None returns at once
+        """
+        episodes = []
+        try:
+            if timeout is not None:
+                episodes.append(self._episodes.get(timeout=timeout))
+            while True:
+                episodes.append(self._episodes.get_nowait())
+        except queue.Empty:
+            pass
+
+        for episode in episodes:
+            if isinstance(episode, Exception):
+                raise episode
+        return episodes
+
+    def close(self):
+        if not self._processes:
+            return
+        self._learner[_STOP] = 1
+        # The queue has to be emptied, otherwise the actors cannot exit
+        deadline = time.time() + 5
+        while any(process.is_alive() for process in self._processes) and time.time() < deadline:
+            try:
+                self._episodes.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+class AsyncStats(object):
+    """Actor steps/sec, learner updates/sec and policy lag of the asynchronous training, per episode"""
+
+    def __init__(self):
+        self.actor_steps_per_sec = []
+        self.learner_updates_per_sec = []
+        self.policy_lag = []
+        self._last = (time.time(), 0, 0)
+
+    def add(self, env_steps, updates, policy_lags):
+        """
+        :param policy_lags: version_lag of every episode finished since the last add, they share the rates
+        """
+        now = time.time()
+        last_time, last_steps, last_updates = self._last
+        elapsed = max(now - last_time, 1e-9)
+        steps_per_sec, updates_per_sec = (env_steps - last_steps) / elapsed, (updates - last_updates) / elapsed
+        self._last = (now, env_steps, updates)
+
+        for policy_lag in policy_lags:
+            self.actor_steps_per_sec.append(steps_per_sec)
+            self.learner_updates_per_sec.append(updates_per_sec)
+            self.policy_lag.append(float(policy_lag))
+        logging.info(f"actor steps/s: {steps_per_sec:8.1f} | learner updates/s: {updates_per_sec:8.1f} | "
+                     f"policy lag: {np.mean(policy_lags):8.1f} updates")
+
+    def as_dict(self):
+        return {'actor_steps_per_sec': self.actor_steps_per_sec,
+                'learner_updates_per_sec': self.learner_updates_per_sec,
+                'policy_lag': self.policy_lag}
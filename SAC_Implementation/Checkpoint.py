@@ -0,0 +1,334 @@
+"""
+Checkpoints of a whole training run, so a preempted job continues where it stopped (see --resume).
+
+A checkpoint directory holds state.pt and the chunks of the replay buffer:
+    - state.pt: SACAlgorithm.state_dict, the small state of the buffer (and of the PrefetchingSampler), the lists of the
+      Plotter, the counters of the training loop and the states of the python, NumPy, torch and environment random
+      generators. It is written to a
+      temporary file and moved into place with os.replace, so it is always complete.
+    - buffer_<chunk>_<generation>.npz: chunk_size slots of the ring columns of the buffer, with the priorities of the
+      slots (prioritized buffer) and the stored next observations of the episode ends (compact buffer). A checkpoint
+      only writes the chunks with slots added since last_save or priorities updated since the last checkpoint, as
+      new files. The ones of the previous checkpoint are deleted after
+      the new state.pt replaced the old one, so a crash while saving leaves the previous checkpoint intact.
+
+The memory mapped buffer is checkpointed the same way. Its files keep changing after a checkpoint, on resume the
+chunks of the checkpoint are written back into them, so they match the restored idx and episode index again.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import random
+import time
+
+import numpy as np
+import torch
+
+from SAC_Implementation.PrefetchingSampler import PrefetchingSampler
+from SAC_Implementation.ReplayBuffer import (CompactReplayBuffer, MemmapReplayBuffer, PrioritizedReplayBuffer,
+                                             _to_numpy)
+from SAC_Implementation.VectorEnv import environment_rngs
+
+STATE_FILE = 'state.pt'
+
+# Keys of the hyperparameters which do not change the training
+_RUN_INDEPENDENT = ('log_level', 'log_file', 'resume', 'checkpoint_dir', 'checkpoint_interval', 'max_evals',
+                    'save_video', 'recording_interval', 'timing')
+
+
+def run_directory(checkpoint_dir: str, hyperparameter_space: dict) -> str:
+    """Directory of the checkpoints of one run, named after its hyperparameters"""
+    params = {key: value for key, value in hyperparameter_space.items() if key not in _RUN_INDEPENDENT}
+    key = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return os.path.join(checkpoint_dir, key)
+
+
+def fmin_rstate(seed: int, finished_trials: int):
+    """
+    Random state for hyperopt.fmin which continues a tuning after finished_trials trials: fmin draws one seed per
+    trial, so the interrupted trial gets the same hyperparameters (and checkpoint directory) again.
+    """
+    rstate = np.random.default_rng(seed)
+    for _ in range(finished_trials):
+        rstate.integers(2 ** 31 - 1)
+    return rstate
+
+
+def _rng_state(rng):
+    if isinstance(rng, np.random.RandomState):
+        return rng.get_state()
+    if isinstance(rng, np.random.Generator):
+        return rng.bit_generator.state
+    return None
+
+
+def _set_rng_state(rng, state):
+    if isinstance(rng, np.random.RandomState):
+        rng.set_state(state)
+    elif isinstance(rng, np.random.Generator):
+        rng.bit_generator.state = state
+
+
+def rng_states(env=None) -> dict:
+    states = {'python': random.getstate(),
+              'numpy': np.random.get_state(),
+              'torch': torch.get_rng_state(),
+              'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+    if env is not None:
+        states['env'] = {name: _rng_state(rng) for name, rng in environment_rngs(env).items()}
+    return states
+
+
+def set_rng_states(states: dict, env=None):
+    random.setstate(states['python'])
+    np.random.set_state(states['numpy'])
+    torch.set_rng_state(states['torch'])
+    if states['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(states['cuda'])
+    if env is not None:
+        rngs = environment_rngs(env)
+        for name, state in states.get('env', {}).items():
+            if name in rngs and state is not None:
+                _set_rng_state(rngs[name], state)
+
+
+def _ring_columns(buffer):
+    """Names of the columns of the buffer with one row per slot"""
+    if isinstance(buffer, CompactReplayBuffer):
+        # next_obs is not stored, next_ref points into the boundary ring
+        return ('obs', 'action', 'reward', 'done', 'done_no_max', 'next_ref')
+    return ('obs', 'next_obs', 'action', 'reward', 'done', 'done_no_max')
+
+
+def _rebuild_tree(tree):
+    """The inner nodes of a SumTree from its leaves, level by level like SumTree.update"""
+    level = tree.size // 2
+    while level >= 1:
+        nodes = np.arange(level, 2 * level)
+        tree.sum[nodes] = tree.sum[2 * nodes] + tree.sum[2 * nodes + 1]
+        tree.min[nodes] = np.minimum(tree.min[2 * nodes], tree.min[2 * nodes + 1])
+        level //= 2
+
+
+def _restore_boundaries(buffer, slots, boundary_obs):
+    """
+    Build the side ring of a CompactReplayBuffer again from the next observations stored with the chunks. The
+    entries get new positions, next_ref of the slots points to them.
+    """
+    slots = np.concatenate(slots) if slots else np.empty(0, dtype=np.int64)
+    n = len(slots)
+    size = max(16, buffer.capacity // 128)
+    while n > 0.75 * size:
+        size *= 2
+
+    buffer.boundary_obs = np.empty((size, buffer.obs.shape[1]), dtype=buffer.obs.dtype)
+    buffer.boundary_owner = np.full(size, -1, dtype=np.int64)
+    if n:
+        buffer.boundary_obs[:n] = np.concatenate(boundary_obs)
+        buffer.boundary_owner[:n] = slots
+        buffer.next_ref[slots] = np.arange(n)
+    buffer.boundary_idx = n % size
+
+
+def _fsync_write(path, write):
+    with open(path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class Checkpointer(object):
+    """
+    Writes and loads the checkpoints of a training run in one directory. The buffer chunks are written incrementally,
+    the chunks which did not change since the last checkpoint are kept.
+    """
+
+    def __init__(self, directory, chunk_size=2 ** 16):
+        """
+        :param directory: Directory of the checkpoints of this run
+        :param chunk_size: Slots of the replay buffer per chunk file
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        # Generation of the file of every chunk of the last checkpoint
+        self._chunks = {}
+        self._generation = 0
+        # total_added of the buffer at the last checkpoint
+        self._saved_total = 0
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, STATE_FILE)
+
+    def exists(self):
+        return os.path.exists(self.state_path)
+
+    def _chunk_path(self, chunk, generation):
+        return os.path.join(self.directory, f'buffer_{chunk:06d}_{generation:06d}.npz')
+
+    def _dirty_chunks(self, buffer):
+        """Chunks with slots written or priorities updated since the last checkpoint"""
+        chunks = set(self._written_chunks(buffer))
+        updated = getattr(buffer, 'priority_updated', None)
+        if updated is not None:
+            chunks.update((np.flatnonzero(updated) // self.chunk_size).tolist())
+        return sorted(chunks)
+
+    def _written_chunks(self, buffer):
+        new = buffer.total_added - self._saved_total
+        if new <= 0:
+            return []
+        if new >= buffer.length or not self._chunks:
+            # Everything which is filled, the slots behind idx of a buffer which is not full yet are never read
+            return list(range(-(-buffer.length // self.chunk_size)))
+
+        # The slot before the new ones can change as well (the boundary reference of the compact buffer)
+        first = (buffer.last_save - 1) % buffer.capacity
+        slots = [(first, first + new + 1)] if first + new + 1 <= buffer.capacity else \
+            [(first, buffer.capacity), (0, first + new + 1 - buffer.capacity)]
+        chunks = set()
+        for start, end in slots:
+            chunks.update(range(start // self.chunk_size, (end - 1) // self.chunk_size + 1))
+        return sorted(chunks)
+
+    def _save_buffer(self, buffer):
+        """Writes the dirty chunks and returns the state of the buffer for state.pt"""
+        state = {'capacity': buffer.capacity,
+                 'idx': buffer.idx,
+                 'full': buffer.full,
+                 'total_added': buffer.total_added,
+                 'episode_starts': list(buffer.episode_starts),
+                 'prune_at': buffer._prune_at}
+
+        columns = _ring_columns(buffer)
+        for chunk in self._dirty_chunks(buffer):
+            start, end = chunk * self.chunk_size, min((chunk + 1) * self.chunk_size, buffer.capacity)
+            arrays = {name: _to_numpy(getattr(buffer, name)[start:end]) for name in columns}
+            if isinstance(buffer, PrioritizedReplayBuffer):
+                tree = buffer.tree
+                arrays['priority_sum'] = tree.sum[tree.size + start:tree.size + end]
+                arrays['priority_min'] = tree.min[tree.size + start:tree.size + end]
+            if isinstance(buffer, CompactReplayBuffer):
+                # In the order of the slots which refer to them, the side ring is built again on load
+                refs = buffer.next_ref[start:end]
+                arrays['boundary_obs'] = buffer.boundary_obs[refs[refs >= 0]]
+            _fsync_write(self._chunk_path(chunk, self._generation), lambda f: np.savez(f, **arrays))
+            self._chunks[chunk] = self._generation
+        state['chunks'] = dict(self._chunks)
+
+        if isinstance(buffer, CompactReplayBuffer):
+            state['pending_next_obs'] = buffer.pending_next_obs
+        if isinstance(buffer, PrioritizedReplayBuffer):
+            state['max_priority'] = buffer.max_priority
+        return state
+
+    def _load_buffer(self, buffer, state):
+        if state['capacity'] != buffer.capacity:
+            raise ValueError(f"The checkpoint has a replay buffer of {state['capacity']} transitions, "
+                             f"not {buffer.capacity}")
+
+        if 'chunks' not in state:
+            raise ValueError("The checkpoint holds no replay buffer chunks, it was written by a version which only "
+                             "flushed the memory mapped buffer")
+        columns = _ring_columns(buffer)
+        # Slots with a stored next observation and the observations, of the compact buffer
+        boundary_slots, boundary_obs = [], []
+        for chunk, generation in state['chunks'].items():
+            start = chunk * self.chunk_size
+            with np.load(self._chunk_path(chunk, generation)) as data:
+                for name in columns:
+                    column, values = getattr(buffer, name), data[name]
+                    if torch.is_tensor(column):
+                        values = torch.as_tensor(values, dtype=column.dtype, device=column.device)
+                    column[start:start + len(values)] = values
+                if isinstance(buffer, PrioritizedReplayBuffer):
+                    leaves = buffer.tree.size + start
+                    buffer.tree.sum[leaves:leaves + len(data['priority_sum'])] = data['priority_sum']
+                    buffer.tree.min[leaves:leaves + len(data['priority_min'])] = data['priority_min']
+                if isinstance(buffer, CompactReplayBuffer):
+                    boundary_slots.append(start + np.flatnonzero(data['next_ref'] >= 0))
+                    boundary_obs.append(data['boundary_obs'])
+        self._chunks = dict(state['chunks'])
+
+        if isinstance(buffer, CompactReplayBuffer):
+            _restore_boundaries(buffer, boundary_slots, boundary_obs)
+            buffer.pending_next_obs = state['pending_next_obs']
+        if isinstance(buffer, PrioritizedReplayBuffer):
+            _rebuild_tree(buffer.tree)
+            buffer.max_priority = state['max_priority']
+            buffer.priority_updated[:] = False
+
+        buffer.idx = state['idx']
+        buffer.full = state['full']
+        buffer.last_save = state['idx']
+        buffer.total_added = state['total_added']
+        buffer.episode_starts = list(state['episode_starts'])
+        buffer._prune_at = state['prune_at']
+        self._saved_total = state['total_added']
+        if isinstance(buffer, MemmapReplayBuffer):
+            buffer.flush()
+
+    def _remove_stale_chunks(self):
+        current = {os.path.basename(self._chunk_path(chunk, generation)) for chunk, generation in self._chunks.items()}
+        for path in glob.glob(os.path.join(self.directory, 'buffer_*.npz')):
+            if os.path.basename(path) not in current:
+                os.remove(path)
+
+    def save(self, sac, plotter, env, counters: dict):
+        """
+        Write a checkpoint, at the end of an episode.
+        :param sac: SACAlgorithm
+        :param plotter: Plotter with the lists of the episodes
+        :param env: Environment, for the state of its random generators
+        :param counters: Counters of the training loop, e.g. the next episode and total_step
+        """
+        _start = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        buffer = sac.buffer.buffer if isinstance(sac.buffer, PrefetchingSampler) else sac.buffer
+
+        self._generation += 1
+        state = {'generation': self._generation,
+                 'sac': sac.state_dict(),
+                 'sampler': sac.buffer.state_dict() if isinstance(sac.buffer, PrefetchingSampler) else None,
+                 'buffer': self._save_buffer(buffer),
+                 'plotter': dict(vars(plotter)),
+                 'counters': dict(counters),
+                 'rng': rng_states(env)}
+
+        tmp_path = self.state_path + '.tmp'
+        _fsync_write(tmp_path, lambda f: torch.save(state, f, pickle_protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp_path, self.state_path)
+        self._remove_stale_chunks()
+
+        buffer.last_save = buffer.idx
+        self._saved_total = buffer.total_added
+        if getattr(buffer, 'priority_updated', None) is not None:
+            buffer.priority_updated[:] = False
+        logging.info(f"Checkpoint {self._generation} written to {self.directory} in {time.time() - _start:.2f}s")
+
+    def load(self, sac, plotter, env) -> dict:
+        """
+        Restore a run from the checkpoint. The random generators are restored last, so the run continues exactly.
+        :return: The counters passed to save
+        """
+        try:
+            state = torch.load(self.state_path, map_location='cpu', weights_only=False)
+        except TypeError:
+            # torch < 1.13
+            state = torch.load(self.state_path, map_location='cpu')
+        buffer = sac.buffer.buffer if isinstance(sac.buffer, PrefetchingSampler) else sac.buffer
+
+        sac.load_state_dict(state['sac'])
+        self._load_buffer(buffer, state['buffer'])
+        if isinstance(sac.buffer, PrefetchingSampler) and state.get('sampler') is not None:
+            sac.buffer.load_state_dict(state['sampler'])
+        vars(plotter).update(state['plotter'])
+        self._generation = state['generation']
+        set_rng_states(state['rng'], env)
+
+        logging.info(f"Resumed checkpoint {self._generation} of {self.directory}: {state['counters']}, "
+                     f"{buffer.length} transitions")
+        return state['counters']
@@ -0,0 +1,133 @@
+"""
+Evaluation of policy snapshots in background processes, so the training does not wait for the evaluation episodes.
+
+The workers only need NumPy: a snapshot is the arrays of policy_export.numpy_policy_arrays and the workers act with
+a NumpyPolicy. Every worker keeps its own environment, the episodes of a snapshot are split over the workers.
+"""
+import logging
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from SAC_Implementation.NumpyPolicy import NumpyPolicy
+from SAC_Implementation.VectorEnv import environment_seeds, seed_environment
+
+# Environment of the worker process, created by _init_worker
+_env = None
+
+# The workers run one thread each, the threads of the training stay free
+_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def _init_worker(make_env, seed):
+    global _env
+    _env = make_env(seed)
+
+
+def _evaluation_episodes(arrays, seeds, max_steps):
+    """
+    Deterministic episodes of a snapshot in the environment of the worker.
+    :param seeds: The environment is seeded again with each of them before its episode
+    :return: Returns of the episodes
+    """
+    policy = NumpyPolicy.from_arrays(arrays)
+    returns = []
+    for seed in seeds:
+        seed_environment(_env, int(seed))
+        state, ep_return = _env.reset(), 0.0
+        for _ in range(max_steps):
+            state, reward, done, _ = _env.step(policy.act(state, deterministic=True))
+            ep_return += reward
+            if done:
+                break
+        returns.append(float(ep_return))
+    return returns
+
+
+class BackgroundEvaluator(object):
+    """
+    Runs the evaluation episodes of policy snapshots in a pool of worker processes.
+
+    submit hands a snapshot to the workers and returns at once, poll gives back the evaluations which are done. Every
+    snapshot is evaluated on the same episode seeds, so the returns of different snapshots are comparable.
+    """
+
+    def __init__(self, make_env, seed, max_steps, episodes=10, workers=1, start_method='spawn'):
+        """
+        :param make_env: Picklable function seed -> environment, e.g. functools.partial of make_dmc_env
+        :param seed: Seed of the environments and the evaluation episodes
+        :param max_steps: Steps after which an evaluation episode ends
+        :param episodes: Episodes per snapshot
+        :param workers: Number of worker processes, the episodes of a snapshot run in parallel on them
+        :param start_method: Start method of the worker processes
+        """
+        self.max_steps = max_steps
+        self.workers = max(1, min(workers, episodes))
+        self.episode_seeds = environment_seeds(seed + 1, episodes)
+        self.results = []
+        self._pending = []
+
+        # Set while the workers start, they inherit the environment
+        previous = {name: os.environ.get(name) for name in _THREAD_VARIABLES}
+        os.environ.update({name: '1' for name in _THREAD_VARIABLES})
+        try:
+            self._pool = mp.get_context(start_method).Pool(self.workers,
+                                                           initializer=_init_worker,
+                                                           initargs=(make_env, seed))
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = value
+        logging.info(f"Started {self.workers} evaluation workers")
+
+    def submit(self, arrays, episode, total_step):
+        """
+        Evaluate a snapshot in the background.
+        :param arrays: Weights of the policy from policy_export.numpy_policy_arrays
+        :param episode: Training episode of the snapshot
+        :param total_step: Environment steps of the training at the snapshot
+        """
+        jobs = [self._pool.apply_async(_evaluation_episodes, (arrays, seeds, self.max_steps))
+                for seeds in np.array_split(np.array(self.episode_seeds), self.workers)]
+        self._pending.append((episode, total_step, jobs))
+
+    def poll(self, wait=False):
+        """
+        :param wait: Wait for all submitted snapshots
+        :return: The evaluations which finished since the last poll, as dicts with episode, total_step, returns and
+            mean_return
+        """
+        finished = []
+        while self._pending:
+            episode, total_step, jobs = self._pending[0]
+            if not wait and not all(job.ready() for job in jobs):
+                break
+            self._pending.pop(0)
+
+            returns = [ep_return for job in jobs for ep_return in job.get()]
+            result = {'episode': episode,
+                      'total_step': total_step,
+                      'returns': returns,
+                      'mean_return': float(np.mean(returns))}
+            logging.info(f"Evaluation of episode {episode} (step {total_step}): mean return "
+                         f"{result['mean_return']:.2f} over {len(returns)} episodes")
+            finished.append(result)
+        self.results += finished
+        return finished
+
+    def close(self, wait=True):
+        """
+        :param wait: Finish the submitted evaluations first
+        """
+        if self._pool is None:
+            return
+        if wait:
+            self.poll(wait=True)
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+        self._pool = None
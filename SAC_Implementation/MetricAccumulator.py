@@ -0,0 +1,51 @@
+import torch
+
+
+class MetricAccumulator(object):
+    """
+    Running sums of the training metrics on the device of the networks. The updates only add to preallocated
+    tensors, so the hot loop does not wait for the device. read gives the averages back once per episode.
+
+    The average is the mean of the means of the update bursts, like the lists of run_sac did it before. Updates which
+    skip the gradient step (odd steps) count with 0.
+    """
+    NAMES = ('policy_loss', 'q_loss', 'alpha', 'entropy')
+
+    def __init__(self, device):
+        self.device = device
+        self._sums = torch.zeros(len(self.NAMES), device=device)
+        self._burst = torch.zeros(len(self.NAMES), device=device)
+        self._burst_updates = 0
+        self._bursts = 0
+
+    def add(self, policy_loss=None, q_loss=None, alpha=None, entropy=None):
+        """Metrics of one update, tensors or numbers. None counts as 0."""
+        for i, value in enumerate((policy_loss, q_loss, alpha, entropy)):
+            if value is not None:
+                self._burst[i].add_(value)
+        self._burst_updates += 1
+
+    def end_burst(self):
+        """Adds the mean of the updates since the last burst to the sums."""
+        if self._burst_updates == 0:
+            return
+        self._sums.add_(self._burst, alpha=1 / self._burst_updates)
+        self._burst.zero_()
+        self._burst_updates = 0
+        self._bursts += 1
+
+    def read(self, reset=True):
+        """
+        :param reset: Start new sums for the next episode
+        :return: dict with the average of every metric, -1 if there was no update
+        """
+        self.end_burst()
+        if self._bursts == 0:
+            return {name: -1 for name in self.NAMES}
+
+        # The only transfer from the device
+        values = (self._sums / self._bursts).tolist()
+        if reset:
+            self._sums.zero_()
+            self._bursts = 0
+        return dict(zip(self.NAMES, values))
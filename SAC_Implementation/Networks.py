@@ -1,6 +1,8 @@
 import copy
 import logging
 import sys
+import warnings
+from typing import List
 
 import numpy as np
 import torch
@@ -9,7 +11,7 @@ import torch.nn.functional as F
 import torch.optim as optim
 from torch.distributions.normal import Normal
 
-from .ranger import Ranger  # this is from ranger.py
+from .ranger import Ranger, RangerForeach  # this is from ranger.py
 
 
 def weight_init(m):
@@ -20,6 +22,34 @@ def weight_init(m):
             m.bias.data.fill_(0.0)
 
 
+@torch.no_grad()
+def soft_update(target_params, params, tau):
+    """
+    Polyak averaging target = (1 - tau) * target + tau * param for all parameters at once. The multi-tensor
+    (foreach) ops update the whole network in place with one or two fused kernels and no temporaries.
+    """
+    target_params, params = list(target_params), list(params)
+    if hasattr(torch, '_foreach_lerp_'):
+        torch._foreach_lerp_(target_params, params, tau)
+    else:
+        torch._foreach_mul_(target_params, 1 - tau)
+        torch._foreach_add_(target_params, params, alpha=tau)
+
+
+OPTIMIZERS = {'adam': optim.Adam, 'ranger': Ranger, 'ranger_foreach': RangerForeach}
+
+
+def create_optimizer(params, name, lr):
+    """
+    :param params: Parameters to optimize
+    :param name: One of OPTIMIZERS, adam, ranger or ranger_foreach (Ranger with multi-tensor ops)
+    :param lr: Learning rate
+    """
+    if name not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {name}, choose one of {', '.join(OPTIMIZERS)}")
+    return OPTIMIZERS[name](params, lr=lr)
+
+
 # CRITIC
 class SoftQNetwork(nn.Module):
     """
@@ -35,7 +65,8 @@ class SoftQNetwork(nn.Module):
             gpu_device,
             output_dim=1,
             init_w=3e-3,
-            hidden_layers=2
+            hidden_layers=2,
+            optimizer='adam'
     ):
         super(SoftQNetwork, self).__init__()
         self.linear1 = nn.Linear(state_dim + action_dim, hidden_dim)
@@ -54,7 +85,7 @@ class SoftQNetwork(nn.Module):
 
         #self.optimizer = Ranger(self.parameters(), lr=lr_critic)
         #self.optimizer = optim.RMSprop(self.parameters(), lr=lr_critic)
-        self.optimizer = optim.Adam(self.parameters(), lr=lr_critic)
+        self.optimizer = create_optimizer(self.parameters(), optimizer, lr_critic)
 
         self.to(self.device)
 
@@ -69,18 +100,108 @@ class SoftQNetwork(nn.Module):
         return action_value_output
 
     def update_params(self, new_params, tau):
-        params = self.parameters()
-
-        for param, target_param in zip(new_params, params):
-            target_param.data.copy_(
-                tau * param.data + (1 - tau) * target_param.data
-            )
+        soft_update(self.parameters(), new_params, tau)
 
         # for k in params.keys():
         #     params[k] = params[k] * (1 - tau) + new_params[k] * tau
         # self.load_state_dict(params)
 
 
+class EnsembleSoftQNetwork(nn.Module):
+    """
+    An ensemble of E SoftQNetworks in one module. The weights of all members are stacked to [E, in, out], so every
+    layer of the whole ensemble is one batched matmul, and all members share one optimizer.
+    forward returns the Q values of all members as [E, batch, 1].
+    """
+
+    def __init__(
+            self,
+            state_dim,
+            action_dim,
+            hidden_dim,
+            lr_critic,
+            gpu_device,
+            ensemble_size=2,
+            output_dim=1,
+            hidden_layers=2,
+            optimizer='adam'
+    ):
+        super(EnsembleSoftQNetwork, self).__init__()
+        self.ensemble_size = ensemble_size
+        self.device = torch.device(f'cuda:{gpu_device}' if torch.cuda.is_available() else 'cpu')
+
+        # Same layers as the SoftQNetwork: input layer, hidden_layers hidden layers and the output layer
+        dims = [state_dim + action_dim] + [hidden_dim] * (hidden_layers + 1) + [output_dim]
+        self.weights = nn.ParameterList()
+        self.biases = nn.ParameterList()
+        for in_dim, out_dim in zip(dims[:-1], dims[1:]):
+            weight = torch.empty(ensemble_size, in_dim, out_dim)
+            for member in range(ensemble_size):
+                # Same init as weight_init, nn.Linear stores its weight as [out, in]
+                linear_weight = torch.empty(out_dim, in_dim)
+                nn.init.orthogonal_(linear_weight)
+                weight[member] = linear_weight.t()
+            self.weights.append(nn.Parameter(weight))
+            self.biases.append(nn.Parameter(torch.zeros(ensemble_size, 1, out_dim)))
+
+        self.optimizer = create_optimizer(self.parameters(), optimizer, lr_critic)
+
+        self.to(self.device)
+
+    def forward(self, state, action):
+        action_value = torch.cat([state.to(device=self.device), action.to(device=self.device)], 1)
+        action_value = action_value.unsqueeze(0).expand(self.ensemble_size, -1, -1)
+
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            action_value = F.relu(torch.baddbmm(bias, action_value, weight))
+
+        return torch.baddbmm(self.biases[-1], action_value, self.weights[-1])
+
+    def min(self, state, action):
+        """Smallest Q value of all members, [batch, 1]"""
+        return self.forward(state, action).min(dim=0)[0]
+
+    def update_params(self, new_params, tau):
+        soft_update(self.parameters(), new_params, tau)
+
+
+def _script(fn):
+    """TorchScript the function if this torch version can, the plain function otherwise."""
+    try:
+        with warnings.catch_warnings():
+            # Newer torch versions deprecate torch.jit in favour of torch.compile
+            warnings.simplefilter('ignore', FutureWarning)
+            return torch.jit.script(fn)
+    except Exception as e:
+        logging.debug(f"TorchScript is not available for {fn.__name__}, using eager mode: {e}")
+        return fn
+
+
+@_script
+def _policy_act(state: torch.Tensor,
+                weights: List[torch.Tensor],
+                biases: List[torch.Tensor],
+                mean_weight: torch.Tensor,
+                mean_bias: torch.Tensor,
+                log_std_weight: torch.Tensor,
+                log_std_bias: torch.Tensor,
+                log_std_min: float,
+                log_std_max: float,
+                deterministic: bool) -> torch.Tensor:
+    # Same computations as PolicyNetwork.forward and sample without the log probability
+    x = state
+    for i in range(len(weights)):
+        x = torch.relu(F.linear(x, weights[i], biases[i]))
+
+    mean = F.linear(x, mean_weight, mean_bias)
+    if deterministic:
+        return torch.tanh(mean)
+
+    log_std = torch.tanh(F.linear(x, log_std_weight, log_std_bias))
+    log_std = log_std_min + 0.5 * (log_std_max - log_std_min) * (log_std + 1)
+    return torch.tanh(mean + torch.randn_like(mean) * log_std.exp())
+
+
 # POLICY
 class PolicyNetwork(nn.Module):
     def __init__(
@@ -93,7 +214,8 @@ class PolicyNetwork(nn.Module):
             init_w=3e-3,
             log_std_min=-10,
             log_std_max=2,
-            hidden_layers=1
+            hidden_layers=1,
+            optimizer='adam'
     ):
         super(PolicyNetwork, self).__init__()
         self.log_std_min = log_std_min
@@ -118,7 +240,7 @@ class PolicyNetwork(nn.Module):
         self.apply(weight_init)
         #self.optimizer = Ranger(self.parameters(), lr=lr_policy)
         #self.optimizer = optim.RMSprop(self.parameters(), lr=lr_policy)
-        self.optimizer = optim.Adam(self.parameters(), lr=lr_policy)
+        self.optimizer = create_optimizer(self.parameters(), optimizer, lr_policy)
 
         self.to(self.device)
 
@@ -152,3 +274,43 @@ class PolicyNetwork(nn.Module):
         log_pi -= torch.log(F.relu(1 - pi.pow(2)) + 1e-6).sum(-1, keepdim=True)
         pi = torch.tanh(pi)
         return mean, pi, log_pi
+
+    def act(self, state, *, deterministic, out=None):
+        """
+        Action for acting in the environment. Unlike sample no autograd graph and no log probability is computed.
+        :param state: Observation(s) as numpy array or tensor. float32 arrays are used without a copy
+        :param deterministic: The squashed mean if True, a sampled squashed action otherwise. Keyword only without a
+            default, like SACAlgorithm.act and NumpyPolicy.act
+        :param out: Optional numpy array with the shape of the actions the result is written into
+        :return: The action(s) as numpy array, out if it is given
+        """
+        if isinstance(state, np.ndarray):
+            state = torch.from_numpy(state) if state.dtype == np.float32 else torch.from_numpy(state.astype(np.float32))
+
+        with torch.inference_mode():
+            if not isinstance(self.linear1, nn.Linear):
+                # Quantized layers (see policy_export) have no weight tensors for the scripted function and
+                # need a batch dimension
+                mean, log_std = self.forward(state.to(device=self.device, dtype=torch.float32).view(-1, state.shape[-1]))
+                action = torch.tanh(mean if deterministic else mean + torch.randn_like(mean) * log_std.exp())
+                action = action.view(state.shape[:-1] + action.shape[-1:])
+            else:
+                layers = [self.linear1] + list(self.hidden_layer)
+                action = _policy_act(state.to(device=self.device, dtype=torch.float32),
+                                     [layer.weight for layer in layers],
+                                     [layer.bias for layer in layers],
+                                     self.mean_linear.weight,
+                                     self.mean_linear.bias,
+                                     self.log_std_linear.weight,
+                                     self.log_std_linear.bias,
+                                     float(self.log_std_min),
+                                     float(self.log_std_max),
+                                     deterministic)
+
+        if out is None:
+            return action.cpu().numpy()
+        if out.dtype == np.float32:
+            torch.from_numpy(out).copy_(action)
+        else:
+            np.copyto(out, action.cpu().numpy())
+        return out
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class NumpyPolicy(object):
+    """
+    Runs a PolicyNetwork exported with policy_export.export_numpy_policy with NumPy only, so actors and evaluation
+    workers do not need to import torch. forward, sample and act work on a batch [N, state_dim] or on a
+    single observation like the ones of PolicyNetwork.
+    """
+
+    def __init__(self, weights, biases, mean_weight, mean_bias, log_std_weight, log_std_bias, log_std_min=-10,
+                 log_std_max=2, dtype=np.float32):
+        """
+        :param weights: Weights [in, out] of linear1 and the hidden layers
+        :param biases: Biases of linear1 and the hidden layers
+        """
+        self.weights = [np.asarray(w, dtype=dtype) for w in weights]
+        self.biases = [np.asarray(b, dtype=dtype) for b in biases]
+        self.mean_weight, self.mean_bias = np.asarray(mean_weight, dtype=dtype), np.asarray(mean_bias, dtype=dtype)
+        self.log_std_weight = np.asarray(log_std_weight, dtype=dtype)
+        self.log_std_bias = np.asarray(log_std_bias, dtype=dtype)
+        self.log_std_min, self.log_std_max = float(log_std_min), float(log_std_max)
+        self.dtype = dtype
+        self.rng = np.random.default_rng()
+
+    @property
+    def state_dim(self):
+        return self.weights[0].shape[0]
+
+    @property
+    def action_dim(self):
+        return self.mean_weight.shape[1]
+
+    @classmethod
+    def from_arrays(cls, arrays, dtype=np.float32):
+        """From the arrays of policy_export.numpy_policy_arrays (or the loaded .npz file)"""
+        n_layers = int(arrays['n_layers'])
+        return cls(weights=[arrays[f'weight_{i}'] for i in range(n_layers)],
+                   biases=[arrays[f'bias_{i}'] for i in range(n_layers)],
+                   mean_weight=arrays['mean_weight'],
+                   mean_bias=arrays['mean_bias'],
+                   log_std_weight=arrays['log_std_weight'],
+                   log_std_bias=arrays['log_std_bias'],
+                   log_std_min=arrays['log_std_min'],
+                   log_std_max=arrays['log_std_max'],
+                   dtype=dtype)
+
+    @classmethod
+    def load(cls, path, dtype=np.float32):
+        """Load the .npz file of policy_export.export_numpy_policy"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays(data, dtype=dtype)
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def forward(self, state):
+        x = np.asarray(state, dtype=self.dtype)
+        for weight, bias in zip(self.weights, self.biases):
+            x = np.maximum(x @ weight + bias, 0)
+
+        mean = x @ self.mean_weight + self.mean_bias
+
+        # Squash log std
+        log_std = np.tanh(x @ self.log_std_weight + self.log_std_bias)
+        log_std = self.log_std_min + 0.5 * (self.log_std_max - self.log_std_min) * (log_std + 1)
+        return mean, log_std
+
+    def sample(self, state, noise=None):
+        """
+        Same as PolicyNetwork.sample
+        :param noise: Standard normal noise with the shape of the actions, drawn from self.rng if None
+        :return: squashed mean, squashed sampled action, log probability of the sampled action
+        """
+        mean, log_std = self.forward(state)
+        std = np.exp(log_std)
+
+        if noise is None:
+            noise = self.rng.standard_normal(mean.shape).astype(self.dtype)
+        pi = mean + noise * std
+
+        residual = (-0.5 * noise ** 2 - log_std).sum(-1, keepdims=True)
+        log_pi = residual - 0.5 * np.log(2 * np.pi) * noise.shape[-1]
+
+        log_pi -= np.log(np.maximum(1 - pi ** 2, 0) + 1e-6).sum(-1, keepdims=True)
+        return np.tanh(mean), np.tanh(pi), log_pi
+
+    def act(self, state, *, deterministic, out=None):
+        """
+        :param deterministic: The squashed mean if True, a sampled squashed action otherwise
+        :param out: Optional array the actions are written into
+        """
+        mean, log_std = self.forward(state)
+        if not deterministic:
+            mean = mean + self.rng.standard_normal(mean.shape).astype(self.dtype) * np.exp(log_std)
+        return np.tanh(mean, out=out)
@@ -0,0 +1,233 @@
+import logging
+import queue
+import threading
+
+import numpy as np
+import torch
+
+
+class PrefetchingSampler(object):
+    """
+    Wraps a replay buffer and prepares the next batches in a worker thread while the networks are updated.
+
+    The worker samples into K + 1 preallocated staging slots (pinned memory if the batches go to a GPU). K of them
+    can wait in the queue, the last one belongs to the batch the caller is working with and is given back with the
+    next call of sample. Everything else is passed through to the buffer, the calls that change the buffer are
+    serialized with the sampling of the worker.
+    The copy of a pinned slot to the GPU is asynchronous, the worker waits for its event before it writes the slot
+    again.
+    Prefetched batches do not contain the transitions added after they were drawn.
+
+    The worker draws the indices with its own seeded generator, not with the global one of the training. The calls
+    that change the buffer wait until the worker has drawn the batches of the slots given back to it, so the batches
+    do not depend on the timing of the thread and a run with the same seed samples the same batches.
+    """
+    MUTATING = ('add', 'add_batch', 'update_priorities')
+
+    def __init__(self, buffer, batch_size, prefetch=2, device=None, seed=None):
+        """
+        :param seed: Seed of the generator of the sampled indices
+        """
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.device = device
+        self.rng = np.random.default_rng(seed)
+        self.hits = 0
+        self.stalls = 0
+        self._reset()
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self._thread = None
+        self._held = None
+        self._staging = None
+        self._events = None
+        # Batches of a checkpoint which are handed out before the worker draws new ones, see load_state_dict
+        self._restored = None
+
+    def __getattr__(self, name):
+        # Only called for attributes the sampler does not have itself
+        if name in ('buffer', 'lock') or name.startswith('__'):
+            raise AttributeError(name)
+
+        attr = getattr(self.buffer, name)
+        if name in self.MUTATING:
+            def locked(*args, **kwargs):
+                self._wait_for_worker()
+                with self.lock:
+                    return attr(*args, **kwargs)
+
+            return locked
+        return attr
+
+    def _wait_for_worker(self):
+        """Wait until the worker has drawn the batches of all slots it was given"""
+        if self._thread is not None:
+            self._free.join()
+
+    def _start(self):
+        self._ready = queue.Queue()
+        self._free = queue.Queue()
+
+        batches, held = self._restored or ([], False)
+        self._restored = None
+        if batches and self._staging is None:
+            self._allocate(batches[0])
+        for slot, batch in enumerate(batches):
+            self._ready.put((slot, self._stage(slot, batch)))
+        slots = list(range(len(batches), self.prefetch + 1))
+        if held and slots:
+            # Given back with the next sample, like the slot of the batch handed out before the checkpoint
+            self._held = slots.pop(0)
+        for slot in slots:
+            self._free.put(slot)
+
+        self._thread = threading.Thread(target=self._work, name='replay-prefetch', daemon=True)
+        self._thread.start()
+        logging.debug(f"Started prefetching of {self.prefetch} batches...")
+
+    def _allocate(self, batch):
+        pin = self.device is not None and torch.device(self.device).type == 'cuda'
+
+        def staging(item):
+            # Indices of the prioritized buffer and tensors which are already on a device are passed through
+            if not torch.is_tensor(item) or item.device.type != 'cpu':
+                return None
+            return torch.empty(item.shape, dtype=item.dtype, pin_memory=pin)
+
+        self._staging = [[staging(item) for item in batch] for _ in range(self.prefetch + 1)]
+        # Recorded after the transfer of a pinned slot to the GPU, None if there is no pending transfer
+        self._events = [None] * (self.prefetch + 1) if pin else None
+
+    def _stage(self, slot, batch):
+        """Copy a batch into its staging slot"""
+        if self._events is not None and self._events[slot] is not None:
+            # The previous batch of the slot may still be copied to the GPU
+            self._events[slot].synchronize()
+            self._events[slot] = None
+
+        staged = []
+        for target, item in zip(self._staging[slot], batch):
+            if target is None:
+                staged.append(item)
+            else:
+                staged.append(target.copy_(item))
+        return tuple(staged)
+
+    def _work(self):
+        error = None
+        while True:
+            slot = self._free.get()
+            try:
+                if slot is None:
+                    break
+                if error is None:
+                    try:
+                        with self.lock:
+                            batch = self.buffer.sample(self.batch_size, rng=self.rng)
+                        if self._staging is None:
+                            self._allocate(batch)
+                        self._ready.put((slot, self._stage(slot, batch)))
+                    except Exception as e:
+                        logging.error(f"Prefetching of the replay buffer failed: {e}")
+                        error = e
+                if error is not None:
+                    # Every slot given back after a failure raises it again in sample
+                    self._ready.put((None, error))
+            finally:
+                self._free.task_done()
+
+    def sample(self, batch_size=None):
+        if batch_size not in (None, self.batch_size):
+            with self.lock:
+                return self.buffer.sample(batch_size)
+
+        if self._thread is None:
+            self._start()
+
+        # The slot of the previous batch can be filled again
+        if self._held is not None:
+            self._free.put(self._held)
+            self._held = None
+
+        try:
+            slot, batch = self._ready.get_nowait()
+            self.hits += 1
+        except queue.Empty:
+            self.stalls += 1
+            slot, batch = self._ready.get()
+
+        if isinstance(batch, Exception):
+            raise batch
+        self._held = slot
+
+        if self.device is not None:
+            batch = tuple(item.to(device=self.device, non_blocking=True) if torch.is_tensor(item) else item
+                          for item in batch)
+            if self._events is not None:
+                self._events[slot] = torch.cuda.Event()
+                self._events[slot].record(torch.cuda.current_stream(self.device))
+        return batch
+
+    def stats(self):
+        requests = self.hits + self.stalls
+        return {'prefetch_hits': self.hits,
+                'prefetch_stalls': self.stalls,
+                'prefetch_hit_rate': self.hits / requests if requests > 0 else 0.0}
+
+    def state_dict(self):
+        """
+        State for a checkpoint: the generator and the batches which are drawn but not handed out yet, a restored
+        sampler hands out the same batches.
+        """
+        if self._restored is not None:
+            # Not started again since load_state_dict
+            batches, held = self._restored
+            return {'rng': self.rng.bit_generator.state, 'batches': list(batches), 'held': held}
+
+        batches = []
+        if self._thread is not None:
+            self._wait_for_worker()
+            with self._ready.mutex:
+                ready = list(self._ready.queue)
+            for _, batch in ready:
+                if isinstance(batch, Exception):
+                    raise batch
+                batches.append(tuple(item.clone() if torch.is_tensor(item) else np.copy(item) for item in batch))
+        return {'rng': self.rng.bit_generator.state,
+                'batches': batches,
+                'held': self._held is not None}
+
+    def load_state_dict(self, state):
+        self.close()
+        self.rng.bit_generator.state = state['rng']
+        self._restored = (list(state['batches']), state['held'])
+
+    def close(self):
+        if self._thread is not None:
+            self._free.put(None)
+            self._thread.join()
+            self._thread = None
+
+            stats = self.stats()
+            logging.info(f"Prefetching of {self.prefetch} batches: {stats['prefetch_hits']} hits, "
+                         f"{stats['prefetch_stalls']} stalls ({100 * stats['prefetch_hit_rate']:.1f}% hit rate)")
+        self._held = None
+
+    def __getstate__(self):
+        # The thread and the queues are not pickled, the worker starts again with the next sample
+        return {'buffer': self.buffer,
+                'batch_size': self.batch_size,
+                'prefetch': self.prefetch,
+                'device': self.device,
+                'rng': self.rng,
+                'hits': self.hits,
+                'stalls': self.stalls}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'rng' not in state:
+            # Pickled before the sampler had its own generator
+            self.rng = np.random.default_rng()
+        self._reset()
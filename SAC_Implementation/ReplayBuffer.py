@@ -1,11 +1,29 @@
+import bisect
+import json
+import os
+
 import numpy as np
 import torch
 import logging
 
+# Storage types of the compact buffer. Numpy has no bfloat16, therefore those columns keep the upper 16 bits of the
+# float32 value in an uint16 array.
+STORAGE_DTYPES = {
+    'float32': np.float32,
+    'float16': np.float16,
+    'bfloat16': np.uint16
+}
+
 
 class ReplayBuffer(object):
-    def __init__(self, obs_shape, action_shape, capacity):
+    # Class defaults keep buffers pickled before n-step returns existed working
+    n_step = 1
+    gamma = 1.0
+
+    def __init__(self, obs_shape, action_shape, capacity, n_step=1, gamma=0.99):
         self.capacity = capacity
+        self.n_step = n_step
+        self.gamma = gamma
 
         self.obs = np.empty((capacity, obs_shape))
         self.next_obs = np.empty((capacity, obs_shape))
@@ -17,6 +35,7 @@ class ReplayBuffer(object):
         self.idx = 0
         self.last_save = 0
         self.full = False
+        self._reset_episode_index()
 
         logging.debug("Initialized Replay Buffer...")
 
@@ -25,6 +44,11 @@ class ReplayBuffer(object):
         return self.capacity if self.full else self.idx
 
     def add(self, obs, action, reward, next_obs, done, done_no_max=0):
+        """
+        Insert a transition.
+        :param done: The episode ended in a terminal state, next_obs is not bootstrapped
+        :param done_no_max: The episode ended without a terminal state (max_steps), n-step returns stop here
+        """
         self.obs[self.idx] = obs
         self.next_obs[self.idx] = next_obs
         self.action[self.idx] = action
@@ -36,11 +60,47 @@ class ReplayBuffer(object):
         self.idx = (self.idx + 1) % self.capacity
 
         self.full = self.full or self.idx == 0
+        self._index_episodes(bool(done) or bool(done_no_max))
+
+    def add_batch(self, obs, action, reward, next_obs, done, done_no_max=None):
+        """
+        Insert N transitions with a few slice assignments, e.g. from vectorized environments or a stored dataset.
+        The transitions of an episode have to be consecutive and in order.
+        :param obs: [N, obs_shape], next_obs and action have N rows as well. reward and the flags can be [N]
+        """
+        n = len(obs)
+        done_no_max = np.zeros(n) if done_no_max is None else done_no_max
+
+        columns = ((self.obs, obs), (self.next_obs, next_obs), (self.action, action),
+                   (self.reward, reward), (self.done, done), (self.done_no_max, done_no_max))
+        for column, values in columns:
+            self._write_rows(column, values, n)
+
+        self._advance(n)
+        self._index_episodes((_to_numpy(done).reshape(n) != 0) | (_to_numpy(done_no_max).reshape(n) != 0))
 
-    def sample(self, batch_size):
-        idxs = np.random.randint(0,
-                                 self.capacity if self.full else self.idx,
-                                 size=batch_size)
+    def _write_rows(self, column, values, n):
+        values = np.asarray(values).reshape((n,) + column.shape[1:])
+        for target, source in self._ring_slices(n):
+            column[target] = values[source]
+
+    def sample(self, batch_size, rng=None):
+        """
+        :param rng: np.random.Generator of the indices, the global NumPy generator if None
+        """
+        idxs = _randint(rng, self.capacity if self.full else self.idx, batch_size)
+        return self._gather(idxs)
+
+    def sample_many(self, batch_size, n_batches):
+        """
+        Sample the batches of a whole update burst with one draw of indices and one gather.
+        :return: The tuple of sample, every element with the shape [n_batches, batch_size, ...]
+        """
+        return split_batches(self.sample(batch_size * n_batches), n_batches)
+
+    def _gather(self, idxs):
+        if self.n_step > 1:
+            return self._gather_n_step(idxs)
 
         obses = torch.as_tensor(self.obs[idxs]).float()
 
@@ -54,3 +114,695 @@ class ReplayBuffer(object):
         dones_no_max = torch.as_tensor(self.done_no_max[idxs])
 
         return obses, actions, rewards, next_obses, dones, dones_no_max
+
+    def _n_step(self, idxs):
+        """
+        Discounted n-step returns of the transitions at idxs. The sum stops after a done or done_no_max and at the
+        newest transition of the buffer.
+        :return: rewards [B, 1], slot of the last transition used [B], number of used transitions [B]
+        """
+        offsets = np.arange(self.n_step)
+        slots = (idxs[:, None] + offsets) % self.capacity
+
+        # Number of transitions which were written after each sampled one
+        newer = (self.idx - 1 - idxs) % self.capacity
+        ended = (np.asarray(self.done[slots, 0]) != 0) | (np.asarray(self.done_no_max[slots, 0]) != 0)
+
+        # Step k is used if none of the steps before ended the episode and it is already written
+        used = np.ones(slots.shape, dtype=bool)
+        used[:, 1:] = np.logical_and.accumulate(~ended[:, :-1], axis=1) & (offsets[1:] <= newer[:, None])
+
+        steps = used.sum(axis=1)
+        # np.where instead of a product, slots which are not written yet may hold anything (even nan)
+        rewards = np.where(used, np.asarray(self.reward[slots, 0]), 0.0)
+        rewards = (rewards * self.gamma ** offsets).sum(axis=1, keepdims=True)
+        last = slots[np.arange(len(idxs)), steps - 1]
+        return rewards, last, steps
+
+    def _next_obs(self, idxs):
+        return self.next_obs[idxs]
+
+    def _gather_n_step(self, idxs):
+        """
+        Batch with n-step returns. The reward is the discounted sum, next_obs and the done flags belong to the last
+        transition used, and the discount for the bootstrap (gamma ** steps) is appended to the usual tuple.
+        """
+        rewards, last, steps = self._n_step(idxs)
+
+        obses = torch.as_tensor(self._decode(self.obs[idxs])).float()
+        actions = torch.as_tensor(self._decode(self.action[idxs])).float()
+        next_obses = torch.as_tensor(self._decode(self._next_obs(last))).float()
+        dones = torch.as_tensor(np.asarray(self.done[last], dtype=np.float32))
+        dones_no_max = torch.as_tensor(np.asarray(self.done_no_max[last], dtype=np.float32))
+        discounts = torch.as_tensor(self.gamma ** steps, dtype=torch.float32).unsqueeze(1)
+
+        return (obses, actions, torch.as_tensor(rewards, dtype=torch.float32), next_obses, dones, dones_no_max,
+                discounts)
+
+    def _decode(self, x):
+        return np.asarray(x)
+
+    def bytes_per_transition(self):
+        columns = (self.obs, self.next_obs, self.action, self.reward, self.done, self.done_no_max)
+        return sum(column.nbytes for column in columns) / self.capacity
+
+    def flush(self):
+        """Write pending changes to disk. Only the disk-backed buffer has something to do here."""
+        pass
+
+    def _ring_slices(self, n):
+        """
+        Where n new transitions go in the ring.
+        :param n: Number of new transitions
+        :return: List of (buffer slice, batch slice), two entries if the batch wraps around
+        """
+        # Only the last capacity transitions of a huge batch survive
+        skip = max(0, n - self.capacity)
+        start = (self.idx + skip) % self.capacity
+        count = n - skip
+
+        first = min(count, self.capacity - start)
+        slices = [(slice(start, start + first), slice(skip, skip + first))]
+        if first < count:
+            slices.append((slice(0, count - first), slice(skip + first, n)))
+        return slices
+
+    def _advance(self, n):
+        self.full = self.full or self.idx + n >= self.capacity
+        self.idx = (self.idx + n) % self.capacity
+
+    def _reset_episode_index(self, total_added=0):
+        # total_added counts every transition ever added, transition t is in slot t % capacity. episode_starts
+        # holds the t of the first transition of every episode which can still be in the buffer, the last entry
+        # is the running episode.
+        self.total_added = total_added
+        self.episode_starts = [total_added]
+        self._prune_at = 1024
+
+    def _index_episodes(self, ended):
+        """
+        Update the episode index after new transitions were written.
+        :param ended: Bool (or bool array for a batch), true for the transitions that end an episode
+        """
+        if np.ndim(ended) == 0:
+            self.total_added += 1
+            if ended:
+                self.episode_starts.append(self.total_added)
+        else:
+            ends = np.flatnonzero(ended) + self.total_added + 1
+            self.episode_starts.extend(ends.tolist())
+            self.total_added += len(ended)
+
+        if len(self.episode_starts) > self._prune_at:
+            # Forget the episodes which are completely overwritten
+            oldest = self.total_added - self.length
+            del self.episode_starts[:bisect.bisect_right(self.episode_starts, oldest) - 1]
+            self._prune_at = 2 * len(self.episode_starts) + 1024
+
+    def _rebuild_episode_index(self):
+        """Build the episode index from the done flags, e.g. after the buffer was reopened."""
+        total_added = self.idx + (self.capacity if self.full else 0)
+        self._reset_episode_index(total_added - self.length)
+
+        slots = (self.total_added + np.arange(self.length)) % self.capacity
+        ended = (_to_numpy(self.done)[slots, 0] != 0) | (_to_numpy(self.done_no_max)[slots, 0] != 0)
+        self._index_episodes(ended)
+
+    def _episode_bounds(self):
+        oldest = self.total_added - self.length
+        starts = np.asarray(self.episode_starts, dtype=np.int64)
+        ends = np.append(starts[1:], self.total_added)
+
+        # The oldest episode can be partly overwritten
+        starts = np.maximum(starts, oldest)
+        keep = ends > starts
+        return starts[keep], ends[keep]
+
+    def episodes(self):
+        """
+        Episodes in the buffer, oldest first. The first one can be cut by the ring, the last one can still run.
+        :return: Start slots and lengths as int arrays
+        """
+        starts, ends = self._episode_bounds()
+        return starts % self.capacity, ends - starts
+
+    def episode_slots(self, idx):
+        """
+        Slots of the whole episode of a transition.
+        :param idx: Slot of the transition
+        :return: int array with the slots of the episode in the order they were added
+        """
+        starts, ends = self._episode_bounds()
+        oldest = self.total_added - self.length
+        t = oldest + (idx - oldest) % self.capacity
+        k = np.searchsorted(starts, t, side='right') - 1
+        return np.arange(starts[k], ends[k]) % self.capacity
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer with the same interface as the ReplayBuffer, but a smaller memory footprint:
+        - observations and actions are stored as float32 (or float16 / bfloat16 if requested),
+        - rewards as float32 and the done flags as uint8,
+        - next_obs is not stored twice. Within an episode next_obs[i] is obs[i + 1], only the transitions which
+          end an episode keep their next observation in a small side ring.
+    The episode boundaries are detected on insert by comparing the new observation with the next_obs of the
+    previous transition, so the caller does not need to mark them.
+    """
+
+    def __init__(self, obs_shape, action_shape, capacity, dtype='float32', n_step=1, gamma=0.99):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype {dtype}. Choose one of {list(STORAGE_DTYPES.keys())}")
+
+        self.capacity = capacity
+        self.n_step = n_step
+        self.gamma = gamma
+        self.dtype = dtype
+        storage = STORAGE_DTYPES[dtype]
+
+        self.obs = np.empty((capacity, obs_shape), dtype=storage)
+        self.action = np.empty((capacity, action_shape), dtype=storage)
+        self.reward = np.empty((capacity, 1), dtype=np.float32)
+        self.done = np.empty((capacity, 1), dtype=np.uint8)
+        self.done_no_max = np.empty((capacity, 1), dtype=np.uint8)
+
+        # Index into boundary_obs for transitions that end an episode, -1 means next_obs is obs[i + 1]
+        self.next_ref = np.full(capacity, -1, dtype=np.int32)
+
+        # The side ring grows if it runs out of live entries
+        boundaries = max(16, capacity // 128)
+        self.boundary_obs = np.empty((boundaries, obs_shape), dtype=storage)
+        self.boundary_owner = np.full(boundaries, -1, dtype=np.int64)
+        self.boundary_idx = 0
+
+        # next_obs of the newest transition. It is resolved when the next transition comes in.
+        self.pending_next_obs = None
+
+        self.idx = 0
+        self.last_save = 0
+        self.full = False
+        self._reset_episode_index()
+
+        logging.debug(f"Initialized compact Replay Buffer ({dtype})...")
+
+    def _encode(self, x):
+        if self.dtype != 'bfloat16':
+            return x
+        bits = np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+        # Round to nearest even before the lower 16 bits are dropped
+        bits = bits + np.uint32(0x7FFF) + ((bits >> np.uint32(16)) & np.uint32(1))
+        return (bits >> np.uint32(16)).astype(np.uint16)
+
+    def _decode(self, x):
+        if self.dtype != 'bfloat16':
+            return x.astype(np.float32, copy=False)
+        return (x.astype(np.uint32) << np.uint32(16)).view(np.float32)
+
+    def _boundary_alive(self):
+        owners = self.boundary_owner
+        return (owners >= 0) & (self.next_ref[np.maximum(owners, 0)] == np.arange(len(owners)))
+
+    def _free_boundary_slot(self):
+        k = self.boundary_idx
+        owner = self.boundary_owner[k]
+        if owner < 0 or self.next_ref[owner] != k:
+            return k
+
+        alive = self._boundary_alive()
+        if alive.mean() > 0.75:
+            # Double the side ring, the existing references stay valid
+            size = len(self.boundary_owner)
+            self.boundary_obs = np.concatenate([self.boundary_obs, np.empty_like(self.boundary_obs)])
+            self.boundary_owner = np.concatenate([self.boundary_owner, np.full(size, -1, dtype=np.int64)])
+            logging.debug(f"Grow boundary ring of the replay buffer to {2 * size}")
+            return size
+
+        dead = np.flatnonzero(~alive)
+        after = dead[dead > k]
+        return after[0] if len(after) else dead[0]
+
+    def _store_boundary(self, slot, next_obs):
+        k = self._free_boundary_slot()
+        self.boundary_obs[k] = self._encode(next_obs)
+        self.boundary_owner[k] = slot
+        self.next_ref[slot] = k
+        self.boundary_idx = (k + 1) % len(self.boundary_owner)
+
+    def add(self, obs, action, reward, next_obs, done, done_no_max=0):
+        # The previous transition ended an episode if its next_obs is not the observation we continue with
+        if self.pending_next_obs is not None and not np.array_equal(self.pending_next_obs, obs):
+            self._store_boundary((self.idx - 1) % self.capacity, self.pending_next_obs)
+
+        self.obs[self.idx] = self._encode(obs)
+        self.action[self.idx] = self._encode(action)
+        self.reward[self.idx] = reward
+        self.done[self.idx] = done
+        self.done_no_max[self.idx] = done_no_max
+        self.next_ref[self.idx] = -1
+        self.pending_next_obs = np.array(next_obs, dtype=np.float64)
+
+        # We use rewrite if buffer is full.
+        self.idx = (self.idx + 1) % self.capacity
+
+        self.full = self.full or self.idx == 0
+        self._index_episodes(bool(done) or bool(done_no_max))
+
+    def add_batch(self, obs, action, reward, next_obs, done, done_no_max=None):
+        n = len(obs)
+        obs = np.asarray(obs, dtype=np.float64).reshape(n, -1)
+        next_obs = np.asarray(next_obs, dtype=np.float64).reshape(n, -1)
+        done_no_max = np.zeros(n) if done_no_max is None else done_no_max
+
+        if self.pending_next_obs is not None and not np.array_equal(self.pending_next_obs, obs[0]):
+            self._store_boundary((self.idx - 1) % self.capacity, self.pending_next_obs)
+
+        start = self.idx
+        columns = ((self.obs, self._encode(obs)), (self.action, self._encode(np.asarray(action))),
+                   (self.reward, reward), (self.done, done), (self.done_no_max, done_no_max),
+                   (self.next_ref, np.full(n, -1)))
+        for column, values in columns:
+            self._write_rows(column, values, n)
+
+        # Boundaries inside the batch, there is one per episode at most
+        breaks = np.flatnonzero(np.any(next_obs[:-1] != obs[1:], axis=1))
+        for i in breaks[breaks >= n - self.capacity]:
+            self._store_boundary((start + i) % self.capacity, next_obs[i])
+        self.pending_next_obs = next_obs[-1].copy()
+
+        self._advance(n)
+        self._index_episodes((_to_numpy(done).reshape(n) != 0) | (_to_numpy(done_no_max).reshape(n) != 0))
+
+    def _next_obs(self, idxs):
+        next_obs = self.obs[(idxs + 1) % self.capacity]
+
+        ref = self.next_ref[idxs]
+        stored = ref >= 0
+        if stored.any():
+            next_obs[stored] = self.boundary_obs[ref[stored]]
+
+        newest = idxs == (self.idx - 1) % self.capacity
+        if newest.any():
+            next_obs[newest] = self._encode(self.pending_next_obs)
+        return next_obs
+
+    def _gather(self, idxs):
+        if self.n_step > 1:
+            return self._gather_n_step(idxs)
+
+        obses = torch.as_tensor(self._decode(self.obs[idxs]))
+        actions = torch.as_tensor(self._decode(self.action[idxs]))
+        rewards = torch.as_tensor(self.reward[idxs])
+        next_obses = torch.as_tensor(self._decode(self._next_obs(idxs)))
+        dones = torch.as_tensor(self.done[idxs].astype(np.float32))
+        dones_no_max = torch.as_tensor(self.done_no_max[idxs].astype(np.float32))
+
+        return obses, actions, rewards, next_obses, dones, dones_no_max
+
+    def bytes_per_transition(self):
+        columns = (self.obs, self.action, self.reward, self.done, self.done_no_max, self.next_ref,
+                   self.boundary_obs, self.boundary_owner)
+        return sum(column.nbytes for column in columns) / self.capacity
+
+
+class MemmapReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer whose columns are np.memmap files in a run directory. idx, full and last_save live in a small
+    header file as well, so a restarted job (or another process) reopens the experience of the directory instead of
+    collecting it again. The capacity is only limited by the disk, the OS keeps the hot pages in its cache.
+    """
+    COLUMNS = ('obs', 'next_obs', 'action', 'reward', 'done', 'done_no_max')
+
+    def __init__(self, obs_shape, action_shape, capacity, directory, dtype='float32', n_step=1, gamma=0.99):
+        if dtype not in ('float64', 'float32', 'float16'):
+            raise ValueError(f"The memory mapped buffer supports float64, float32 and float16, not {dtype}")
+
+        self.obs_shape = obs_shape
+        self.action_shape = action_shape
+        self.capacity = capacity
+        self.directory = directory
+        self.dtype = dtype
+        self.n_step = n_step
+        self.gamma = gamma
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+        meta = {'obs_shape': self.obs_shape,
+                'action_shape': self.action_shape,
+                'capacity': self.capacity,
+                'dtype': self.dtype}
+        meta_path = os.path.join(self.directory, 'meta.json')
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                existing = json.load(f)
+            if existing != meta:
+                raise ValueError(f"Replay buffer in {self.directory} was created with {existing}, not {meta}")
+            mode = 'r+'
+        else:
+            mode = 'w+'
+
+        shapes = {'obs': (self.capacity, self.obs_shape),
+                  'next_obs': (self.capacity, self.obs_shape),
+                  'action': (self.capacity, self.action_shape),
+                  'reward': (self.capacity, 1),
+                  'done': (self.capacity, 1),
+                  'done_no_max': (self.capacity, 1)}
+        for name in self.COLUMNS:
+            setattr(self, name, np.memmap(os.path.join(self.directory, f'{name}.bin'),
+                                          dtype=self.dtype, mode=mode, shape=shapes[name]))
+
+        # [idx, full, last_save]
+        self._header = np.memmap(os.path.join(self.directory, 'header.bin'), dtype=np.int64, mode=mode, shape=(3,))
+
+        if mode == 'w+':
+            # The meta file is written last, a directory without it is created again
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            self._reset_episode_index()
+            logging.debug(f"Initialized memory mapped Replay Buffer in {self.directory}...")
+        else:
+            self._rebuild_episode_index()
+            logging.info(f"Reopened Replay Buffer in {self.directory} with {self.length} transitions")
+
+    @property
+    def idx(self):
+        return int(self._header[0])
+
+    @idx.setter
+    def idx(self, value):
+        self._header[0] = value
+
+    @property
+    def full(self):
+        return bool(self._header[1])
+
+    @full.setter
+    def full(self, value):
+        self._header[1] = value
+
+    @property
+    def last_save(self):
+        return int(self._header[2])
+
+    @last_save.setter
+    def last_save(self, value):
+        self._header[2] = value
+
+    def add(self, obs, action, reward, next_obs, done, done_no_max=0):
+        idx = self.idx
+        self.obs[idx] = obs
+        self.next_obs[idx] = next_obs
+        self.action[idx] = action
+        self.reward[idx] = reward
+        self.done[idx] = done
+        self.done_no_max[idx] = done_no_max
+
+        # full has to be set before idx wraps to 0, otherwise a reader could see an empty buffer
+        if idx + 1 == self.capacity:
+            self.full = True
+        self.idx = (idx + 1) % self.capacity
+        self._index_episodes(bool(done) or bool(done_no_max))
+
+    def sample(self, batch_size, rng=None):
+        idxs = _randint(rng, self.length, batch_size)
+        # Sorted indices read the mapped files front to back
+        idxs.sort()
+        return self._gather(idxs)
+
+    def sample_many(self, batch_size, n_batches):
+        # Not sorted, otherwise every batch would only see a part of the buffer
+        idxs = np.random.randint(0, self.length, size=batch_size * n_batches)
+        return split_batches(self._gather(idxs), n_batches)
+
+    def _gather(self, idxs):
+        if self.n_step > 1:
+            return self._gather_n_step(idxs)
+
+        obses = torch.as_tensor(np.asarray(self.obs[idxs])).float()
+        actions = torch.as_tensor(np.asarray(self.action[idxs]))
+        rewards = torch.as_tensor(np.asarray(self.reward[idxs]))
+        next_obses = torch.as_tensor(np.asarray(self.next_obs[idxs])).float()
+        dones = torch.as_tensor(np.asarray(self.done[idxs]))
+        dones_no_max = torch.as_tensor(np.asarray(self.done_no_max[idxs]))
+
+        return obses, actions, rewards, next_obses, dones, dones_no_max
+
+    def flush(self):
+        for name in self.COLUMNS:
+            getattr(self, name).flush()
+        self._header.flush()
+
+    def __getstate__(self):
+        # Pickling (e.g. into the hyperopt trials) only keeps the reference to the directory
+        self.flush()
+        return {'obs_shape': self.obs_shape,
+                'action_shape': self.action_shape,
+                'capacity': self.capacity,
+                'directory': self.directory,
+                'dtype': self.dtype,
+                'n_step': self.n_step,
+                'gamma': self.gamma}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+
+class TorchReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer whose columns are preallocated float32 tensors on the training device. Indices are drawn with
+    torch.randint on the device as well, so sample() returns tensors which are ready for the networks without any
+    conversion or host to device copy. N-step returns are not supported.
+    """
+
+    def __init__(self, obs_shape, action_shape, capacity, device):
+        self.capacity = capacity
+        self.device = torch.device(device)
+
+        def column(width):
+            return torch.zeros((capacity, width), dtype=torch.float32, device=self.device)
+
+        self.obs = column(obs_shape)
+        self.next_obs = column(obs_shape)
+        self.action = column(action_shape)
+        self.reward = column(1)
+        self.done = column(1)
+        self.done_no_max = column(1)
+
+        self.idx = 0
+        self.last_save = 0
+        self.full = False
+        self._reset_episode_index()
+
+        logging.debug(f"Initialized Replay Buffer on {self.device}...")
+
+    def _as_tensor(self, x):
+        return torch.as_tensor(x, dtype=torch.float32, device=self.device)
+
+    def add(self, obs, action, reward, next_obs, done, done_no_max=0):
+        self.obs[self.idx] = self._as_tensor(obs)
+        self.next_obs[self.idx] = self._as_tensor(next_obs)
+        self.action[self.idx] = self._as_tensor(action)
+        self.reward[self.idx] = float(reward)
+        self.done[self.idx] = float(done)
+        self.done_no_max[self.idx] = float(done_no_max)
+
+        # We use rewrite if buffer is full.
+        self.idx = (self.idx + 1) % self.capacity
+
+        self.full = self.full or self.idx == 0
+        self._index_episodes(bool(done) or bool(done_no_max))
+
+    def _write_rows(self, column, values, n):
+        values = self._as_tensor(values).reshape((n,) + column.shape[1:])
+        for target, source in self._ring_slices(n):
+            column[target] = values[source]
+
+    def sample(self, batch_size, rng=None):
+        if rng is None:
+            idxs = torch.randint(0, self.length, (batch_size,), device=self.device)
+        else:
+            idxs = torch.as_tensor(rng.integers(0, self.length, size=batch_size), device=self.device)
+        return self._gather(idxs)
+
+    def _gather(self, idxs):
+        return (self.obs[idxs], self.action[idxs], self.reward[idxs],
+                self.next_obs[idxs], self.done[idxs], self.done_no_max[idxs])
+
+    def bytes_per_transition(self):
+        columns = (self.obs, self.next_obs, self.action, self.reward, self.done, self.done_no_max)
+        return sum(column.element_size() * column.nelement() for column in columns) / self.capacity
+
+
+class SumTree(object):
+    """
+    Array based sum tree over the priorities of the buffer slots, together with a min tree for the normalization of
+    the importance sampling weights. The leaves are at [size, 2 * size). Batched lookups and updates walk the tree
+    one level at a time with vectorized numpy operations, so a batch costs O(log N) numpy calls.
+    """
+
+    def __init__(self, capacity):
+        self.size = 2
+        while self.size < capacity:
+            self.size *= 2
+
+        self.sum = np.zeros(2 * self.size)
+        self.min = np.full(2 * self.size, np.inf)
+
+    @property
+    def total(self):
+        return self.sum[1]
+
+    @property
+    def min_priority(self):
+        return self.min[1]
+
+    def get(self, idxs):
+        return self.sum[idxs + self.size]
+
+    def update_one(self, idx, priority):
+        node = idx + self.size
+        self.sum[node] = priority
+        self.min[node] = priority
+        node //= 2
+        while node >= 1:
+            self.sum[node] = self.sum[2 * node] + self.sum[2 * node + 1]
+            self.min[node] = min(self.min[2 * node], self.min[2 * node + 1])
+            node //= 2
+
+    def update(self, idxs, priorities):
+        # For duplicated indices the last priority wins
+        nodes = np.asarray(idxs, dtype=np.int64) + self.size
+        self.sum[nodes] = priorities
+        self.min[nodes] = priorities
+
+        # All leaves have the same depth, so every step handles exactly one level of the tree. The parents of a
+        # sorted level stay sorted, so the duplicates are neighbours and can be dropped without sorting again.
+        nodes = np.unique(nodes >> 1)
+        while True:
+            left = 2 * nodes
+            self.sum[nodes] = self.sum[left] + self.sum[left + 1]
+            self.min[nodes] = np.minimum(self.min[left], self.min[left + 1])
+            if nodes[0] == 1:
+                break
+            nodes >>= 1
+            keep = np.empty(len(nodes), dtype=bool)
+            keep[0] = True
+            np.not_equal(nodes[1:], nodes[:-1], out=keep[1:])
+            nodes = nodes[keep]
+
+    def find(self, values):
+        """Return the leaf index for each value in [0, total) of the cumulative priorities."""
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            left_sum = self.sum[left]
+            # Never step into an empty subtree because of floating point errors
+            go_right = (values >= left_sum) & (self.sum[left + 1] > 0)
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer with proportional prioritized sampling (Schaul et al., 2016). New transitions get the highest
+    priority seen so far. sample() returns the usual tuple (with the discounts of n-step returns) followed by the
+    importance sampling weights and the indices, which are needed to update the priorities with the new TD errors.
+    """
+    # Class default keeps buffers pickled before the tracking existed working
+    priority_updated = None
+
+    def __init__(self, obs_shape, action_shape, capacity, alpha=0.6, beta=0.4, eps=1e-6, n_step=1, gamma=0.99):
+        super().__init__(obs_shape, action_shape, capacity, n_step=n_step, gamma=gamma)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.max_priority = 1.0
+        # Slots whose priority was set by update_priorities since the last checkpoint, see Checkpoint
+        self.priority_updated = np.zeros(capacity, dtype=bool)
+
+        logging.debug("Initialized prioritized Replay Buffer...")
+
+    def add(self, obs, action, reward, next_obs, done, done_no_max=0):
+        idx = self.idx
+        super().add(obs, action, reward, next_obs, done, done_no_max)
+        self.tree.update_one(idx, self.max_priority ** self.alpha)
+
+    def add_batch(self, obs, action, reward, next_obs, done, done_no_max=None):
+        n = len(obs)
+        slots = (self.idx + np.arange(max(0, n - self.capacity), n)) % self.capacity
+        super().add_batch(obs, action, reward, next_obs, done, done_no_max)
+        self.tree.update(slots, np.full(len(slots), self.max_priority ** self.alpha))
+
+    def sample(self, batch_size, rng=None):
+        return self._sample(batch_size, rng=rng)
+
+    def sample_many(self, batch_size, n_batches):
+        # The stratified indices are ordered, they are shuffled so every batch covers all priorities
+        return split_batches(self._sample(batch_size * n_batches, shuffle=True), n_batches)
+
+    def _sample(self, batch_size, shuffle=False, rng=None):
+        # Stratified sampling: one value out of each of batch_size equal segments of the total priority
+        total = self.tree.total
+        offsets = np.random.random_sample(batch_size) if rng is None else rng.random(batch_size)
+        values = (np.arange(batch_size) + offsets) * (total / batch_size)
+        if shuffle:
+            np.random.shuffle(values)
+        idxs = self.tree.find(values)
+
+        # w_i = (N * P(i)) ** -beta, normalized by the largest possible weight
+        probs = self.tree.get(idxs) / total
+        weights = (probs / (self.tree.min_priority / total)) ** -self.beta
+
+        return self._gather(idxs) + (torch.as_tensor(weights, dtype=torch.float32).unsqueeze(1), idxs)
+
+    def update_priorities(self, idxs, td_errors):
+        """
+        Set the priorities of sampled transitions.
+        :param idxs: Indices returned by sample
+        :param td_errors: Absolute TD errors of the transitions, same length as idxs
+        """
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idxs, priorities ** self.alpha)
+        if self.priority_updated is not None:
+            self.priority_updated[idxs] = True
+
+
+def _randint(rng, high, size):
+    """Indices in [0, high) from rng, from the global NumPy generator without one"""
+    return np.random.randint(0, high, size=size) if rng is None else rng.integers(0, high, size=size)
+
+
+def _to_numpy(x):
+    return x.detach().cpu().numpy() if torch.is_tensor(x) else np.asarray(x)
+
+
+def split_batches(batch, n_batches):
+    """Reshape every element of a sampled batch (tensors or index arrays) to [n_batches, batch_size, ...]."""
+    return tuple(item.reshape(n_batches, -1, *item.shape[1:]) for item in batch)
+
+
+def memory_report(buffer: ReplayBuffer) -> dict:
+    """
+    Compare the memory usage of a buffer with the float64 layout of the ReplayBuffer.
+    :param buffer: Any replay buffer
+    :return: dict with the bytes per transition of both layouts and the total size in MB
+    """
+    obs_dim, action_dim = buffer.obs.shape[1], buffer.action.shape[1]
+    # obs, next_obs, action, reward, done and done_no_max as float64
+    legacy_bytes = 8 * (2 * obs_dim + action_dim + 3)
+    current_bytes = buffer.bytes_per_transition()
+
+    return {
+        'bytes_per_transition': current_bytes,
+        'legacy_bytes_per_transition': legacy_bytes,
+        'ratio': current_bytes / legacy_bytes,
+        'total_mb': current_bytes * buffer.capacity / 2 ** 20,
+        'legacy_total_mb': legacy_bytes * buffer.capacity / 2 ** 20
+    }
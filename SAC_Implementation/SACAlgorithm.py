@@ -1,3 +1,4 @@
+import contextlib
 import logging
 import math
 from copy import deepcopy
@@ -5,8 +6,13 @@ from copy import deepcopy
 import LogHelper
 import torch
 
+from SAC_Implementation.MetricAccumulator import MetricAccumulator
 from SAC_Implementation.Networks import *
-from SAC_Implementation.ReplayBuffer import ReplayBuffer
+from SAC_Implementation.PrefetchingSampler import PrefetchingSampler
+from SAC_Implementation.ReplayBuffer import (ReplayBuffer, CompactReplayBuffer, MemmapReplayBuffer,
+                                               PrioritizedReplayBuffer, TorchReplayBuffer, memory_report)
+from SAC_Implementation.Scheduler import UpdateScheduler
+from SAC_Implementation.Timing import NULL_TIMER
 
 
 def initialize_nets_and_buffer(state_dim: int,
@@ -17,7 +23,15 @@ def initialize_nets_and_buffer(state_dim: int,
                                replay_buffer_size: int,
                                gpu_device: int,
                                q_layers: int,
-                               policy_layers: int
+                               policy_layers: int,
+                               buffer_dtype: str = 'float64',
+                               buffer_dir: str = None,
+                               prioritized: dict = None,
+                               buffer_on_device: bool = False,
+                               n_step: int = 1,
+                               gamma: float = 0.99,
+                               ensemble_size: int = 0,
+                               optimizer: str = 'adam'
                                ) -> (
         SoftQNetwork, SoftQNetwork, SoftQNetwork, SoftQNetwork, PolicyNetwork, ReplayBuffer):
     """
@@ -31,41 +45,163 @@ def initialize_nets_and_buffer(state_dim: int,
     :param policy_hidden: Hidden Size of the Policy Network
     :param learning_rates: Learning Rates in an dict with keys "critic"(q-networks) and "actor"(policy)
     :param replay_buffer_size: Size of the replayBuffer
+    :param buffer_dtype: float64 for the plain ReplayBuffer, float32/float16/bfloat16 for the compact one
+    :param buffer_dir: If set, the buffer is memory mapped into this directory and reopened if it exists
+    :param prioritized: If set, a prioritized buffer is used. Dict with the keys "alpha" and "beta"
+    :param buffer_on_device: Keep the buffer as float32 tensors on the device of the networks
+    :param n_step: Number of steps of the returns the buffer samples
+    :param gamma: Discount factor of the n-step returns
+    :param ensemble_size: If > 0, one EnsembleSoftQNetwork with this many members replaces the two Q networks. It
+        is returned as Soft1 and target1, Soft2 and target2 are None then
+    :param optimizer: Optimizer of all networks, see Networks.OPTIMIZERS
     :return: Returns the networks (Soft1, soft2, target1,target2, Policy, Buffer)
     """
+    if ensemble_size:
+        soft_q1 = EnsembleSoftQNetwork(state_dim,
+                                       action_dim,
+                                       q_hidden,
+                                       learning_rates.get('critic'),
+                                       gpu_device,
+                                       ensemble_size=ensemble_size,
+                                       hidden_layers=q_layers,
+                                       optimizer=optimizer)
+        soft_q2 = None
+        soft_q1_targets = deepcopy(soft_q1)
+        soft_q2_targets = None
+
     # We need to networks: 1 for the value function first
+    else:
+        soft_q1, soft_q2, soft_q1_targets, soft_q2_targets = initialize_q_networks(state_dim,
+                                                                                   action_dim,
+                                                                                   q_hidden,
+                                                                                   learning_rates,
+                                                                                   gpu_device,
+                                                                                   q_layers,
+                                                                                   optimizer)
+
+    policy = PolicyNetwork(state_dim,
+                           action_dim,
+                           policy_hidden,
+                           learning_rates.get('actor'),
+                           gpu_device,
+                           hidden_layers=policy_layers,
+                           optimizer=optimizer)
+
+    buffer = initialize_buffer(state_dim, action_dim,
+                               replay_buffer_size,
+                               policy.device,
+                               buffer_dtype=buffer_dtype,
+                               buffer_dir=buffer_dir,
+                               prioritized=prioritized,
+                               buffer_on_device=buffer_on_device,
+                               n_step=n_step,
+                               gamma=gamma)
+
+    return soft_q1, soft_q2, soft_q1_targets, soft_q2_targets, policy, buffer
+
+
+def initialize_q_networks(state_dim: int,
+                          action_dim: int,
+                          q_hidden: int,
+                          learning_rates: dict,
+                          gpu_device: int,
+                          q_layers: int,
+                          optimizer: str = 'adam') -> (SoftQNetwork, SoftQNetwork, SoftQNetwork, SoftQNetwork):
+    """
+    Method to initialize the two Q networks and their targets
+    """
     soft_q1 = SoftQNetwork(state_dim,
                            action_dim,
                            q_hidden,
                            learning_rates.get('critic'),
                            gpu_device,
-                           hidden_layers=q_layers)
+                           hidden_layers=q_layers,
+                           optimizer=optimizer)
     soft_q2 = SoftQNetwork(state_dim,
                            action_dim,
                            q_hidden,
                            learning_rates.get('critic'),
                            gpu_device,
-                           hidden_layers=q_layers)
+                           hidden_layers=q_layers,
+                           optimizer=optimizer)
 
     # Then another one for calculating the targets
     soft_q1_targets = deepcopy(soft_q1)
     soft_q2_targets = deepcopy(soft_q1)
 
-    policy = PolicyNetwork(state_dim,
-                           action_dim,
-                           policy_hidden,
-                           learning_rates.get('actor'),
-                           gpu_device,
-                           hidden_layers=policy_layers)
+    return soft_q1, soft_q2, soft_q1_targets, soft_q2_targets
 
-    # Initialize the Replay Buffer
-    buffer = ReplayBuffer(state_dim, action_dim,
-                          replay_buffer_size)
 
-    return soft_q1, soft_q2, soft_q1_targets, soft_q2_targets, policy, buffer
+def initialize_buffer(state_dim: int,
+                      action_dim: int,
+                      replay_buffer_size: int,
+                      device: torch.device,
+                      buffer_dtype: str = 'float64',
+                      buffer_dir: str = None,
+                      prioritized: dict = None,
+                      buffer_on_device: bool = False,
+                      n_step: int = 1,
+                      gamma: float = 0.99) -> ReplayBuffer:
+    """
+    Method to initialize the replay buffer. See initialize_nets_and_buffer for the parameters.
+    """
+    # Initialize the Replay Buffer
+    if prioritized is not None:
+        if buffer_dir is not None or buffer_dtype not in (None, 'float64'):
+            raise ValueError("The prioritized replay buffer only supports the plain float64 storage")
+        buffer = PrioritizedReplayBuffer(state_dim, action_dim,
+                                         replay_buffer_size,
+                                         alpha=prioritized.get('alpha'),
+                                         beta=prioritized.get('beta'),
+                                         n_step=n_step,
+                                         gamma=gamma)
+    elif buffer_on_device:
+        if n_step > 1:
+            raise ValueError("The replay buffer on the device does not support n-step returns")
+        buffer = TorchReplayBuffer(state_dim, action_dim,
+                                   replay_buffer_size,
+                                   device=device)
+    elif buffer_dir is not None:
+        buffer = MemmapReplayBuffer(state_dim, action_dim,
+                                    replay_buffer_size,
+                                    directory=buffer_dir,
+                                    dtype=buffer_dtype or 'float64',
+                                    n_step=n_step,
+                                    gamma=gamma)
+    elif buffer_dtype in (None, 'float64'):
+        buffer = ReplayBuffer(state_dim, action_dim,
+                              replay_buffer_size,
+                              n_step=n_step,
+                              gamma=gamma)
+    else:
+        buffer = CompactReplayBuffer(state_dim, action_dim,
+                                     replay_buffer_size,
+                                     dtype=buffer_dtype,
+                                     n_step=n_step,
+                                     gamma=gamma)
+
+    report = memory_report(buffer)
+    logging.info(f"Replay Buffer: {report['bytes_per_transition']:.1f} bytes per transition "
+                 f"({report['total_mb']:.1f} MB), float64 layout: {report['legacy_bytes_per_transition']} bytes "
+                 f"({report['legacy_total_mb']:.1f} MB)")
+
+    return buffer
 
 
 class SACAlgorithm:
+    # Timing of the phases of the updates (a Timing.PhaseTimer), set by the training if the timing is on
+    timer = NULL_TIMER
+
+    # With bfloat16 autocast a Q loss above this factor times its running average counts as diverged, checked after
+    # the warmup updates, the average decays with BF16_LOSS_DECAY per update
+    BF16_DIVERGENCE_FACTOR = 100.0
+    BF16_LOSS_DECAY = 0.99
+    BF16_WARMUP_UPDATES = 200
+    # Running average and limit of the Q loss on the device, set by the first update with bfloat16 autocast
+    _q_loss_average = None
+    _q_loss_limit = None
+    _q_loss_updates = 0
+
     def __init__(self, env, param: dict):
         """
 
@@ -90,12 +226,35 @@ class SACAlgorithm:
                 'actor': param.get('lr_actor')
             },
             replay_buffer_size=param.get('replay_buffer_size'),
-            gpu_device=param.get('gpu_device')
+            gpu_device=param.get('gpu_device'),
+            buffer_dtype=param.get('buffer_dtype'),
+            buffer_dir=param.get('buffer_dir'),
+            prioritized={
+                'alpha': param.get('per_alpha'),
+                'beta': param.get('per_beta')
+            } if param.get('prioritized_replay') else None,
+            buffer_on_device=param.get('buffer_on_device'),
+            n_step=param.get('n_step') or 1,
+            gamma=param.get('gamma'),
+            ensemble_size=param.get('num_critics') if param.get('ensemble_critic') else 0,
+            optimizer=param.get('optimizer') or 'adam'
         )
+        # The critics are either the two SoftQNetworks or one EnsembleSoftQNetwork
+        self.critics = [q for q in (self.soft_q1, self.soft_q2) if q is not None]
+        self.critic_targets = [q for q in (self.soft_q1_targets, self.soft_q2_targets) if q is not None]
+        self.prioritized = isinstance(self.buffer, PrioritizedReplayBuffer)
+        self.n_step = param.get('n_step') or 1
+        if param.get('prefetch_batches'):
+            # Sample the next batches in the background while the networks are updated
+            self.buffer = PrefetchingSampler(self.buffer,
+                                             batch_size=param.get('sample_batch_size'),
+                                             prefetch=param.get('prefetch_batches'),
+                                             device=self.device,
+                                             seed=param.get('seed'))
 
         self.alpha_decay_activated = not param.get('alpha_decay_deactivate')
         if self.alpha_decay_activated:
-            self.log_alpha = torch.tensor(np.log(param.get('init_alpha'))).to(self.device)
+            self.log_alpha = torch.tensor(np.log(param.get('init_alpha')), dtype=torch.float32, device=self.device)
             self.log_alpha.requires_grad = True
             # set target entropy to -|A|
             self.target_entropy = -np.prod(self.action_dim)
@@ -109,33 +268,85 @@ class SACAlgorithm:
                                                         param.get('tau'),
                                                         param.get('gamma'))
 
-    def _update_critic(self, state, action, y_hat):
-        q1_forward = self.soft_q1(state.float(), action.float())
-        q2_forward = self.soft_q2(state.float(), action.float())
+        # Forward and backward passes of the networks in bfloat16, the weights, alpha and the targets stay float32
+        self.bf16_autocast = bool(param.get('bf16_autocast'))
+        # Capture train_step with torch.compile, compiled with the first update
+        self.compile_update = bool(param.get('compile_update'))
+        self._compiled_train_step = None
+
+        # Averages of the losses, alpha and the entropy of the updates, read once per episode
+        self.metrics = MetricAccumulator(self.device)
+
+        # When the updates run, which of them make gradient steps and how often the policy follows the critics
+        self.scheduler = UpdateScheduler.from_param(param)
+        self.gradient_steps = 0
+
+    def _autocast(self):
+        if self.bf16_autocast:
+            return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _critic_values(critics, state, action):
+        """Q values of all critics (or all members of the ensemble) stacked to [critics, batch, 1]"""
+        return torch.cat([q(state, action).view(-1, state.shape[0], 1) for q in critics])
+
+    def _update_critic(self, state, action, y_hat, weights=None):
+        with self._autocast():
+            q_forward = self._critic_values(self.critics, state, action)
+
+        # Sum of the mean squared errors of all critics
+        td = q_forward.float() - y_hat
+        if weights is None:
+            q_loss = td.pow(2).mean(dim=(1, 2)).sum()
+        else:
+            # Prioritized replay: the importance sampling weights correct the bias of the sampling
+            q_loss = (weights * td.pow(2)).mean(dim=(1, 2)).sum()
 
-        # Q1 Network
-        q_loss = F.mse_loss(q1_forward.float(), y_hat.float().to(device=self.device)) + \
-                 F.mse_loss(q2_forward.float(), y_hat.float().to(device=self.device))
+        if self.bf16_autocast and not self._q_loss_plausible(q_loss):
+            # Diverged in bfloat16, nothing is updated and update runs again in float32
+            return None, None
 
-        self.soft_q1.optimizer.zero_grad()
-        self.soft_q2.optimizer.zero_grad()
+        for q in self.critics:
+            q.optimizer.zero_grad()
         q_loss.backward()
-        self.soft_q1.optimizer.step()
-        self.soft_q2.optimizer.step()
-        return q_loss
+        for q in self.critics:
+            q.optimizer.step()
+
+        # The mean absolute TD errors of all critics are the new priorities of prioritized replay
+        return q_loss.detach(), td.detach().abs().mean(dim=0)
+
+    def _q_loss_plausible(self, q_loss):
+        """False if the Q loss is not finite or far above its running average, one synchronization with the device"""
+        plausible = torch.isfinite(q_loss)
+        if self._q_loss_limit is not None:
+            plausible = plausible & (q_loss <= self._q_loss_limit)
+        return bool(plausible)
+
+    def _track_q_loss(self, q_loss):
+        """Running average of the Q loss for _q_loss_plausible, updated in place on the device"""
+        if self._q_loss_average is None:
+            self._q_loss_average = q_loss.detach().clone()
+            self._q_loss_updates = 0
+        else:
+            self._q_loss_average.lerp_(q_loss.detach(), 1 - self.BF16_LOSS_DECAY)
+        self._q_loss_updates += 1
+
+        if self._q_loss_updates >= self.BF16_WARMUP_UPDATES:
+            if self._q_loss_limit is None:
+                self._q_loss_limit = torch.empty_like(self._q_loss_average)
+            torch.mul(self._q_loss_average, self.BF16_DIVERGENCE_FACTOR, out=self._q_loss_limit)
 
     def _calculate_target(self, state, action):
         with torch.no_grad():
-            y_hat_q1 = self.soft_q1_targets(state.float(), action.float())
-            y_hat_q2 = self.soft_q2_targets(state.float(), action.float())
-            min_ = torch.min(y_hat_q1, y_hat_q2)
+            min_ = self._critic_values(self.critic_targets, state, action).min(dim=0)[0]
         return min_
 
     def _update_policy_alpha(self, state):
-        action_new, _, log_pi = self.policy.sample(torch.Tensor(state))
-        q1_forward = self.soft_q1(state.float(), action_new.float())
-        q2_forward = self.soft_q2(state.float(), action_new.float())
-        q_forward = torch.min(q1_forward, q2_forward)
+        with self._autocast():
+            action_new, _, log_pi = self.policy.sample(state)
+            q_forward = self._critic_values(self.critics, state, action_new).min(dim=0)[0]
+        q_forward, log_pi = q_forward.float(), log_pi.float()
 
         # Changed to an F.mse_loss from simple mean
         # policy_loss = F.mse_loss((self.alpha * action_entropy_new), q_forward)
@@ -151,7 +362,7 @@ class SACAlgorithm:
         self.policy.optimizer.step()
 
         if self.alpha_decay_activated:
-            alpha_applied = deepcopy(self.log_alpha).exp()
+            alpha_applied = self.log_alpha.detach().exp()
             self.log_alpha_optimizer.zero_grad()
             alpha_loss = (self.log_alpha * (-log_pi - self.target_entropy).detach()).mean()
 
@@ -162,47 +373,197 @@ class SACAlgorithm:
             alpha_loss = 0
             alpha_applied = self.alpha
 
-        return policy_loss.item(), alpha_applied  # alpha_loss
+        return policy_loss.detach(), alpha_applied, -log_pi.detach().mean()  # alpha_loss
 
-    def update(self, step):
+    def _prepare_batch(self, batch):
+        """
+        Move a sampled batch to the device of the networks as float32. This is the only conversion of an update.
+        :return: state, action, reward, new_state, done, discount, weights, idxs
+        """
+        def prepare(item):
+            return torch.as_tensor(item).to(device=self.device, dtype=torch.float32, non_blocking=True)
 
-        # Sample from Replay buffer
-        # logging.warning("STEEEEEP 11")
-        state, action, reward, new_state, done, _ = self.buffer.sample(batch_size=self.sample_batch_size)
-        policy_loss, q_loss, alpha_loss = 0, 0, 0
+        state, action, reward, new_state, done = (prepare(item) for item in batch[:5])
 
+        # n-step returns bring their own discount (gamma ** steps), prioritized replay the weights and indices
+        if self.n_step > 1:
+            discount, extras = prepare(batch[6]), batch[7:]
+        else:
+            discount, extras = self.gamma, batch[6:]
+        weights, idxs = (prepare(extras[0]), extras[1]) if self.prioritized else (None, None)
+        return state, action, reward, new_state, done, discount, weights, idxs
+
+    def train_step(self, state, action, reward, new_state, done, discount, weights=None, update_policy=True):
+        """
+        One gradient step of the critics, the policy and alpha. All tensors are float32 on the device of the networks,
+        nothing is copied to the host, so the step can be captured with torch.compile (see compile_update).
+        :param update_policy: Update the policy and alpha as well, False for the delayed policy updates
+        :return: (policy_loss, q_loss, alpha, entropy, td_error) or None if the Q loss diverged with bfloat16 autocast.
+            policy_loss, alpha and entropy are None without the policy update
+        """
         # Computation of targets
         # Here we are using 2 different Q Networks and afterwards choose the lower reward as regulator.
-        if step % 2 == 0:
-            # logging.warning("STEEEEEP 12")
+        # time.perf_counter cannot be captured by torch.compile, the compiled step is only timed as a whole by update
+        timer = NULL_TIMER if self.compile_update else self.timer
+        with timer['critic_update']:
+            with torch.no_grad(), self._autocast():
+                action_sample, _, log_pi = self.policy.sample(new_state)
+                y_hat_q = self._calculate_target(new_state, action_sample)
+
+            with torch.no_grad():
+                if self.alpha_decay_activated:
+                    entropy = -self.log_alpha.exp() * log_pi.float()
+                else:
+                    entropy = -math.exp(self.alpha) * log_pi.float()
+
+                # We calculate the estimated reward for the next state
+                # DISCOUNT FACTOR
+                y_hat = reward + discount * (1 - done) * (y_hat_q.float() + entropy)
 
-            action_sample, _, log_pi = self.policy.sample(torch.Tensor(new_state))
+            # # UPDATES OF THE CRITIC NETWORK
+            q_loss, td_error = self._update_critic(state, action, y_hat, weights)
+        if q_loss is None:
+            return None
 
-            if self.alpha_decay_activated:
-                entropy = -self.log_alpha.exp() * log_pi
-            else:
-                entropy = -math.exp(self.alpha) * log_pi
-            y_hat_q = self._calculate_target(new_state, action_sample)
+        # Update Policy Network (ACTOR) and alpha
+        with timer['policy_update']:
+            policy_loss, alpha_loss, entropy = self._update_policy_alpha(state) if update_policy else (None, None, None)
+        return policy_loss, q_loss, alpha_loss, entropy, td_error
 
-            # We calculate the estimated reward for the next state
-            # DISCOUNT FACTOR
-            y_hat = reward + self.gamma * (1 - done) * (y_hat_q.cpu() + entropy.cpu())
+    def _train_step_fn(self):
+        if not self.compile_update:
+            return self.train_step
+        if self._compiled_train_step is None:
+            self._compiled_train_step = torch.compile(self.train_step)
+        return self._compiled_train_step
 
-            # # UPDATES OF THE CRITIC NETWORK
-            # logging.warning("STEEEEEP 13")
-            q_loss = self._update_critic(state, action, y_hat)
+    def update(self, step, batch=None):
+        with self.timer['update']:
+            return self._update(step, batch)
 
-        # Update Policy Network (ACTOR) and alpha
-        if step % 2 == 0:
-            policy_loss, alpha_loss = self._update_policy_alpha(state)
+    def _update(self, step, batch=None):
+
+        # Sample from Replay buffer
+        # logging.warning("STEEEEEP 11")
+        if batch is None:
+            with self.timer['buffer_sample']:
+                batch = self.buffer.sample(batch_size=self.sample_batch_size)
+        with self.timer['batch_transfer']:
+            state, action, reward, new_state, done, discount, weights, idxs = self._prepare_batch(batch)
+        policy_loss, q_loss, alpha_loss, entropy = 0, 0, 0, None
+
+        # The critics, the policy and alpha are updated every update_period-th step (every second by default)
+        if self.scheduler.gradient_step(step):
+            update_policy = self.scheduler.policy_step(self.gradient_steps)
+            result = self._train_step_fn()(state, action, reward, new_state, done, discount, weights, update_policy)
+            if result is None:
+                logging.warning("The Q loss diverged with bfloat16 autocast, continuing in float32")
+                self.bf16_autocast = False
+                self._compiled_train_step = None
+                return self._update(step, batch=batch)
+
+            policy_loss, q_loss, alpha_loss, entropy, td_error = result
+            self.gradient_steps += 1
+            if self.bf16_autocast:
+                self._track_q_loss(q_loss)
+            if idxs is not None:
+                self.buffer.update_priorities(idxs, td_error.cpu().numpy().ravel())
 
         # if step % 200 == 0:
-        self.soft_q1_targets.update_params(self.soft_q1.parameters(), self.tau)
-        self.soft_q2_targets.update_params(self.soft_q2.parameters(), self.tau)
+        with self.timer['polyak_update']:
+            for q_target, q in zip(self.critic_targets, self.critics):
+                q_target.update_params(q.parameters(), self.tau)
 
-        # for graph
+        # for graph, the metrics stay on the device until the end of the episode
+        self.metrics.add(policy_loss, q_loss, alpha_loss, entropy)
         return policy_loss, q_loss, alpha_loss
 
+    def update_many(self, step, n_updates):
+        """
+        Run an update burst. The batches of all updates are sampled at once with sample_many of the buffer.
+        :param step: Step of the episode, like for update
+        :param n_updates: Number of updates
+        :return: List with the metrics of every update
+        """
+        if n_updates == 1 or isinstance(self.buffer, PrefetchingSampler):
+            # The prefetcher already prepares the batches one by one
+            results = [self.update(step) for _ in range(n_updates)]
+        else:
+            with self.timer['buffer_sample']:
+                batches = self.buffer.sample_many(self.sample_batch_size, n_updates)
+            results = [self.update(step, batch=tuple(item[i] for item in batches)) for i in range(n_updates)]
+
+        # The average of an episode is the mean of the means of the bursts
+        self.metrics.end_burst()
+        return results
+
+    # Networks of the state dict, the ones which are None (soft_q2 with the ensemble critic) are skipped
+    NETWORKS = ('soft_q1', 'soft_q2', 'soft_q1_targets', 'soft_q2_targets', 'policy')
+
+    def state_dict(self) -> dict:
+        """
+        Everything the updates change: the networks with their optimizers, alpha and the state of the scheduler.
+        The replay buffer is saved by the Checkpointer.
+        """
+        networks = {name: getattr(self, name) for name in self.NETWORKS if getattr(self, name) is not None}
+        state = {'networks': {name: network.state_dict() for name, network in networks.items()},
+                 'optimizers': {name: network.optimizer.state_dict() for name, network in networks.items()
+                                if getattr(network, 'optimizer', None) is not None},
+                 'scheduler': self.scheduler.state_dict(),
+                 'gradient_steps': self.gradient_steps,
+                 'bf16_autocast': self.bf16_autocast,
+                 'q_loss_average': None if self._q_loss_average is None else self._q_loss_average.clone(),
+                 'q_loss_updates': self._q_loss_updates}
+        if self.alpha_decay_activated:
+            state['log_alpha'] = self.log_alpha.detach().clone()
+            state['log_alpha_optimizer'] = self.log_alpha_optimizer.state_dict()
+        return state
+
+    def load_state_dict(self, state: dict):
+        for name, network_state in state['networks'].items():
+            getattr(self, name).load_state_dict(network_state)
+        for name, optimizer_state in state['optimizers'].items():
+            getattr(self, name).optimizer.load_state_dict(optimizer_state)
+        self.scheduler.load_state_dict(state['scheduler'])
+        self.gradient_steps = state['gradient_steps']
+        self.bf16_autocast = state['bf16_autocast']
+        # Saved by checkpoints before the running average of the Q loss as well, it starts again then
+        self._q_loss_average = state.get('q_loss_average')
+        if self._q_loss_average is not None:
+            self._q_loss_average = self._q_loss_average.to(self.device, copy=True)
+        self._q_loss_updates = state.get('q_loss_updates', 0)
+        self._q_loss_limit = None
+        if self._q_loss_average is not None and self._q_loss_updates >= self.BF16_WARMUP_UPDATES:
+            self._q_loss_limit = self._q_loss_average * self.BF16_DIVERGENCE_FACTOR
+        self._compiled_train_step = None
+        if self.alpha_decay_activated:
+            with torch.no_grad():
+                # In place, the optimizer keeps the tensor
+                self.log_alpha.copy_(state['log_alpha'])
+            self.log_alpha_optimizer.load_state_dict(state['log_alpha_optimizer'])
+
+    def close(self):
+        """Stop the prefetching of the buffer and write a disk-backed buffer to disk."""
+        if isinstance(self.buffer, PrefetchingSampler):
+            self.buffer.close()
+        self.buffer.flush()
+
+    def __getstate__(self):
+        # The compiled step is not picklable, it is compiled again after loading
+        state = self.__dict__.copy()
+        state['_compiled_train_step'] = None
+        return state
+
+    def act(self, obs_batch: np.ndarray, *, deterministic: bool, out: np.ndarray = None) -> np.ndarray:
+        """
+        Actions for many observations with one forward pass of the policy, without autograd and log probabilities.
+        :param obs_batch: Observations as [N, state_dim] numpy array (or a single [state_dim] observation)
+        :param deterministic: The squashed mean of the policy if True, sampled actions otherwise
+        :param out: Optional [N, action_dim] array the actions are written into, e.g. reused for every step
+        :return: The actions, out if it is given
+        """
+        return self.policy.act(obs_batch, deterministic=deterministic, out=out)
+
     def sample_action(self, state: torch.Tensor):
         action, _, log_pi = self.policy.sample(state)
         return action.detach().cpu().data.numpy(), log_pi
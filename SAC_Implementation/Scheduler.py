@@ -0,0 +1,93 @@
+class UpdateScheduler(object):
+    """
+    When and how many updates run, instead of the fixed schedule in the training loops.
+
+    - No updates until the replay buffer holds more than warmup transitions.
+    - Every environment step earns utd_ratio updates (fractional or > 1). They are run as one burst every
+      burst_interval steps, the fraction which is left waits for the next burst.
+    - The step which reaches initial_burst total steps runs initial_burst updates instead.
+    - Only every update_period-th step of an episode makes gradient steps, the other updates only move the targets.
+    - The policy and alpha are updated with every policy_delay-th gradient step of the critics.
+
+    The defaults are the former schedule of run_sac: warmup 1000, num_updates per step, a burst every step,
+    max_steps updates at total step max_steps and the gradient steps on the even steps.
+    """
+
+    def __init__(self, warmup=1000, utd_ratio=1.0, burst_interval=1, initial_burst=0, update_period=2,
+                 policy_delay=1):
+        """
+        :param warmup: Transitions in the buffer before the first update
+        :param utd_ratio: Updates per environment step
+        :param burst_interval: Environment steps between two update bursts
+        :param initial_burst: Total step with a burst of initial_burst updates, 0 for none
+        :param update_period: Steps of an episode between two steps with gradient steps
+        :param policy_delay: Gradient steps of the critics per update of the policy and alpha
+        """
+        if utd_ratio < 0:
+            raise ValueError(f"The update-to-data ratio must not be negative, got {utd_ratio}")
+        self.warmup = warmup
+        self.utd_ratio = utd_ratio
+        self.burst_interval = max(1, burst_interval)
+        self.initial_burst = initial_burst
+        self.update_period = max(1, update_period)
+        self.policy_delay = max(1, policy_delay)
+
+        # Updates earned but not run yet
+        self._credit = 0.0
+
+    @classmethod
+    def from_param(cls, param: dict):
+        """Scheduler of the SACAlgorithm parameters, the missing ones keep the former schedule"""
+
+        def get(name, default):
+            value = param.get(name)
+            return default if value is None else value
+
+        return cls(warmup=int(get('warmup', 1000)),
+                   utd_ratio=float(get('utd_ratio', get('num_updates', 1))),
+                   burst_interval=int(get('burst_interval', 1)),
+                   initial_burst=int(get('initial_burst', get('max_steps', 0))),
+                   update_period=int(get('update_period', 2)),
+                   policy_delay=int(get('policy_delay', 1)))
+
+    def updates(self, total_step, buffer_length, env_steps=1):
+        """
+        Number of updates to run after an environment step.
+        :param total_step: Environment steps so far, including this one
+        :param buffer_length: Transitions in the replay buffer
+        :param env_steps: Transitions of this step, e.g. the number of vectorized environments
+        """
+        if buffer_length <= self.warmup:
+            return 0
+
+        if self.initial_burst and total_step - env_steps < self.initial_burst <= total_step:
+            return self.initial_burst
+
+        self._credit += self.utd_ratio * env_steps
+        if total_step % self.burst_interval >= env_steps:
+            # No burst at this step (with several environments one of their steps has to hit the interval)
+            return 0
+
+        n_updates = int(self._credit)
+        self._credit -= n_updates
+        return n_updates
+
+    def state_dict(self):
+        return {'credit': self._credit}
+
+    def load_state_dict(self, state):
+        self._credit = state['credit']
+
+    def gradient_step(self, step):
+        """
+        :param step: Step of the episode the update belongs to
+        :return: True if the update makes gradient steps
+        """
+        return step % self.update_period == 0
+
+    def policy_step(self, gradient_steps):
+        """
+        :param gradient_steps: Gradient steps of the critics before this one
+        :return: True if the policy and alpha are updated with this gradient step
+        """
+        return gradient_steps % self.policy_delay == 0
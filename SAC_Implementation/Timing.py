@@ -0,0 +1,146 @@
+"""
+Timing of the phases of the training loop and the updates.
+
+    with timer['env_step']:
+        env.step(action)
+
+The spans are preallocated per phase and add their time (time.perf_counter) to preallocated counters, end_episode
+closes the breakdown of an episode. NULL_TIMER has the same interface and does nothing, it is used when the timing is
+off. The phases of the updates are inside 'updates' (all updates of a step) and 'update' (one update), so they are
+not added up with the phases of the loop.
+"""
+import logging
+from time import perf_counter
+
+import numpy as np
+
+# The training loop
+LOOP_PHASES = ('act', 'env_step', 'log_step', 'buffer_add', 'video_record', 'updates')
+# Inside updates, buffer_sample is inside update unless a burst is sampled at once
+UPDATE_PHASES = ('update', 'buffer_sample', 'batch_transfer', 'critic_update', 'policy_update', 'polyak_update')
+PHASES = LOOP_PHASES + UPDATE_PHASES
+
+PERCENTILES = (50, 90, 99)
+
+
+class _Span(object):
+    __slots__ = ('_timer', '_index', '_start')
+
+    def __init__(self, timer, index):
+        self._timer = timer
+        self._index = index
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timer = self._timer
+        if timer.synchronize is not None:
+            timer.synchronize()
+        timer._add(self._index, perf_counter() - self._start)
+
+
+class PhaseTimer(object):
+    """
+    Time per phase and episode and the latencies of the single updates.
+
+    CUDA kernels run asynchronously, with synchronize (e.g. torch.cuda.synchronize) every span waits for them, so the
+    time of the kernels belongs to the phase which launched them.
+    """
+
+    def __init__(self, phases=PHASES, latency_phase='update', synchronize=None, expected_updates=4096):
+        """
+        :param phases: Names of the phases
+        :param latency_phase: Phase whose single durations are kept for the percentiles
+        :param synchronize: Called at the end of every span, None for none
+        :param expected_updates: Initial size of the latency array of an episode, it grows if needed
+        """
+        self.phases = tuple(phases)
+        self.synchronize = synchronize
+        self._spans = {name: _Span(self, i) for i, name in enumerate(self.phases)}
+        self._latency_index = self.phases.index(latency_phase)
+
+        # Time and calls of the running episode
+        self._time = [0.0] * len(self.phases)
+        self._calls = [0] * len(self.phases)
+        self._latencies = np.empty(expected_updates)
+        self._n_latencies = 0
+
+        # Per episode
+        self.episodes = []
+        self.episode_time = {name: [] for name in self.phases}
+        self.episode_calls = {name: [] for name in self.phases}
+        self.update_latency_ms = {f'p{q}': [] for q in PERCENTILES}
+
+    def __getitem__(self, name):
+        return self._spans[name]
+
+    def _add(self, index, elapsed):
+        self._time[index] += elapsed
+        self._calls[index] += 1
+        if index == self._latency_index:
+            if self._n_latencies == len(self._latencies):
+                self._latencies = np.concatenate([self._latencies, np.empty_like(self._latencies)])
+            self._latencies[self._n_latencies] = elapsed
+            self._n_latencies += 1
+
+    def end_episode(self, episode):
+        """
+        Close the breakdown of an episode and start the next one.
+        :return: dict phase -> seconds of the episode
+        """
+        breakdown = dict(zip(self.phases, self._time))
+        self.episodes.append(episode)
+        for name, elapsed, calls in zip(self.phases, self._time, self._calls):
+            self.episode_time[name].append(elapsed)
+            self.episode_calls[name].append(calls)
+
+        latencies = self._latencies[:self._n_latencies]
+        values = np.percentile(latencies, PERCENTILES) * 1e3 if len(latencies) else [float('nan')] * len(PERCENTILES)
+        for q, value in zip(PERCENTILES, values):
+            self.update_latency_ms[f'p{q}'].append(float(value))
+
+        self._time = [0.0] * len(self.phases)
+        self._calls = [0] * len(self.phases)
+        self._n_latencies = 0
+
+        logging.debug("Timing: " + " | ".join(f"{name} {elapsed * 1e3:.1f}ms"
+                                              for name, elapsed in breakdown.items() if elapsed > 0))
+        return breakdown
+
+    def as_dict(self):
+        """The per episode times (seconds), calls and update latency percentiles (ms) for the result dict"""
+        return {'episodes': self.episodes,
+                'time': self.episode_time,
+                'calls': self.episode_calls,
+                'total': {name: float(sum(times)) for name, times in self.episode_time.items()},
+                'update_latency_ms': self.update_latency_ms}
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+class _NullTimer(object):
+    """PhaseTimer which measures nothing"""
+    _span = _NullSpan()
+
+    def __getitem__(self, name):
+        return self._span
+
+    def end_episode(self, episode):
+        return {}
+
+    def as_dict(self):
+        return {}
+
+
+NULL_TIMER = _NullTimer()
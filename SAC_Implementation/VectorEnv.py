@@ -0,0 +1,264 @@
+import ctypes
+import logging
+import multiprocessing as mp
+from collections import namedtuple
+
+import numpy as np
+
+# One batched step of all environments. obs are the observations the actions were taken in, next_obs the
+# observations after the actions (before an automatic reset). finished lists (env index, return, length) of the
+# episodes which ended with this step.
+VectorStep = namedtuple('VectorStep', ['obs', 'action', 'reward', 'next_obs', 'done', 'timeout', 'finished'])
+
+_CTYPES = {np.float64: ctypes.c_double, np.uint8: ctypes.c_uint8}
+
+
+def make_dmc_env(seed, domain_name, task_name, frame_skip):
+    """Creates a dmc2gym environment, imported here so only the workers need it"""
+    import dmc2gym
+
+    return dmc2gym.make(domain_name=domain_name,
+                        task_name=task_name,
+                        seed=seed,
+                        frame_skip=frame_skip)
+
+
+def environment_seeds(seed, num_envs):
+    """Independent seeds of the environments derived from one seed"""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(num_envs)]
+
+
+def environment_rngs(env) -> dict:
+    """
+    Random generators of a dmc2gym environment which carry over from one episode to the next: the one of the task
+    (initial states) and the one of the action space (the random actions of the init rounds).
+    """
+    rngs = {}
+    task = getattr(getattr(getattr(env, 'unwrapped', env), '_env', None), 'task', None)
+    if task is not None and getattr(task, 'random', None) is not None:
+        rngs['task'] = task.random
+    action_space = getattr(env, 'action_space', None)
+    if getattr(action_space, 'np_random', None) is not None:
+        rngs['action_space'] = action_space.np_random
+    return rngs
+
+
+def seed_environment(env, seed):
+    """Seed a dmc2gym environment again, e.g. to start evaluation episodes from the same initial states"""
+    if hasattr(env, 'seed'):
+        env.seed(seed)
+    for rng in environment_rngs(env).values():
+        if isinstance(rng, np.random.RandomState):
+            rng.seed(seed)
+        elif isinstance(rng, np.random.Generator):
+            rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+
+
+def _shared_array(ctx, shape, dtype):
+    raw = ctx.RawArray(_CTYPES[dtype], int(np.prod(shape)))
+    return raw, _as_array(raw, shape, dtype)
+
+
+def _as_array(raw, shape, dtype):
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _worker(index, make_env, seed, max_steps, pipe, shared):
+    """
+    Runs one environment. The commands come through the pipe, the observations, actions, rewards and dones are
+    read from and written to the row index of the shared arrays.
+    """
+    # Views of the row of this environment, slices so that the 1-d arrays give views as well
+    arrays = {name: _as_array(raw, shape, dtype)[index:index + 1] for name, (raw, shape, dtype) in shared.items()}
+    obs, next_obs, action = arrays['obs'], arrays['next_obs'], arrays['action']
+    reward, done, timeout = arrays['reward'], arrays['done'], arrays['timeout']
+
+    env, t, ep_return = None, 0, 0.0
+    try:
+        env = make_env(seed)
+        while True:
+            command = pipe.recv()
+            if command == 'step':
+                state, r, d, _ = env.step(action[0].copy())
+                t += 1
+                ep_return += r
+
+                # The last done is fake therefore we set it to false again (like run_sac)
+                is_timeout = t == max_steps
+                timeout[...] = is_timeout
+                done[...] = bool(d) and not is_timeout
+                next_obs[...] = state
+                reward[...] = r
+
+                finished = None
+                if d or is_timeout:
+                    finished = (ep_return, t)
+                    obs[...] = env.reset()
+                    t, ep_return = 0, 0.0
+                else:
+                    obs[...] = state
+                pipe.send(finished)
+            elif command == 'reset':
+                obs[...] = env.reset()
+                t, ep_return = 0, 0.0
+                pipe.send(None)
+            elif command == 'close':
+                pipe.send(None)
+                break
+    except Exception as e:
+        pipe.send(e)
+    finally:
+        if env is not None and hasattr(env, 'close'):
+            env.close()
+        pipe.close()
+
+
+class VectorEnv(object):
+    """
+    N environments in worker processes, stepped together with one batched step(actions).
+
+    The observations, actions, rewards and dones are exchanged through shared memory arrays, the pipes only carry
+    the commands and the returns of finished episodes. Every environment gets its own seed derived from seed and is
+    reset automatically at the end of an episode or after max_steps steps.
+    """
+
+    def __init__(self, make_env, num_envs, seed, max_steps, start_method='spawn'):
+        """
+        :param make_env: Picklable function seed -> environment, e.g. functools.partial of make_dmc_env
+        :param num_envs: Number of environments (and worker processes)
+        :param seed: Seed the seeds of the environments are derived from
+        :param max_steps: Steps after which an episode is ended with a timeout
+        :param start_method: Start method of the worker processes
+        """
+        self.num_envs = num_envs
+        self.max_steps = max_steps
+        self.seeds = environment_seeds(seed, num_envs)
+
+        # The spaces of the environments, e.g. for SACAlgorithm
+        probe = make_env(self.seeds[0])
+        self.observation_space, self.action_space = probe.observation_space, probe.action_space
+        if hasattr(probe, 'close'):
+            probe.close()
+        state_dim, action_dim = self.observation_space.shape[0], self.action_space.shape[0]
+
+        ctx = mp.get_context(start_method)
+        shapes = {'obs': ((num_envs, state_dim), np.float64),
+                  'next_obs': ((num_envs, state_dim), np.float64),
+                  'action': ((num_envs, action_dim), np.float64),
+                  'reward': ((num_envs,), np.float64),
+                  'done': ((num_envs,), np.uint8),
+                  'timeout': ((num_envs,), np.uint8)}
+        shared = {}
+        for name, (shape, dtype) in shapes.items():
+            raw, array = _shared_array(ctx, shape, dtype)
+            shared[name] = (raw, shape, dtype)
+            setattr(self, f'_{name}', array)
+
+        # Observations the last actions were taken in, the shared ones are overwritten by the workers
+        self._last_obs = np.empty((num_envs, state_dim))
+
+        self._pipes, self._processes = [], []
+        for index in range(num_envs):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_worker,
+                                  args=(index, make_env, self.seeds[index], max_steps, child, shared),
+                                  name=f'env-worker-{index}',
+                                  daemon=True)
+            process.start()
+            child.close()
+            self._pipes.append(parent)
+            self._processes.append(process)
+        logging.info(f"Started {num_envs} environment workers")
+
+    @property
+    def obs(self):
+        """Observations for the next actions, already reset where an episode ended"""
+        return self._obs
+
+    def _command(self, command):
+        for pipe in self._pipes:
+            pipe.send(command)
+        results = [pipe.recv() for pipe in self._pipes]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def reset(self):
+        self._command('reset')
+        return self._obs
+
+    def step(self, actions) -> VectorStep:
+        """
+        Step all environments.
+        :param actions: [num_envs, action_dim]
+        :return: VectorStep, its arrays are overwritten by the next step
+        """
+        np.copyto(self._last_obs, self._obs)
+        self._action[...] = actions
+        results = self._command('step')
+
+        finished = [(index, result[0], result[1]) for index, result in enumerate(results) if result is not None]
+        return VectorStep(self._last_obs, self._action, self._reward, self._next_obs,
+                          self._done, self._timeout, finished)
+
+    def close(self):
+        if not self._processes:
+            return
+        try:
+            self._command('close')
+        except (BrokenPipeError, EOFError):
+            pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes, self._pipes = [], []
+
+
+class EpisodeCollector(object):
+    """
+    Collects the transitions of a VectorEnv per environment and adds every episode with one add_batch to the replay
+    buffer when it ends. The episodes stay contiguous in the buffer, which the n-step returns and the episode index
+    of the buffer need.
+    """
+
+    def __init__(self, buffer, num_envs, max_steps, state_dim, action_dim):
+        self.buffer = buffer
+        self.obs = np.empty((num_envs, max_steps, state_dim))
+        self.next_obs = np.empty((num_envs, max_steps, state_dim))
+        self.action = np.empty((num_envs, max_steps, action_dim))
+        self.reward = np.empty((num_envs, max_steps))
+        self.done = np.empty((num_envs, max_steps), dtype=np.uint8)
+        self.timeout = np.empty((num_envs, max_steps), dtype=np.uint8)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self._envs = np.arange(num_envs)
+
+    def add(self, step: VectorStep) -> int:
+        """
+        :return: Number of transitions added to the buffer
+        """
+        t = self.steps
+        self.obs[self._envs, t] = step.obs
+        self.action[self._envs, t] = step.action
+        self.reward[self._envs, t] = step.reward
+        self.next_obs[self._envs, t] = step.next_obs
+        self.done[self._envs, t] = step.done
+        self.timeout[self._envs, t] = step.timeout
+        self.steps += 1
+
+        added = 0
+        for index, _, _ in step.finished:
+            added += self._flush(index)
+        return added
+
+    def _flush(self, index):
+        n = int(self.steps[index])
+        self.buffer.add_batch(obs=self.obs[index, :n],
+                              action=self.action[index, :n],
+                              reward=self.reward[index, :n],
+                              next_obs=self.next_obs[index, :n],
+                              done=self.done[index, :n],
+                              done_no_max=self.timeout[index, :n])
+        self.steps[index] = 0
+        return n
@@ -0,0 +1,241 @@
+"""
+Export of a trained PolicyNetwork for deployment, without the pickled SACAlgorithm of the hyperopt trials.
+
+The int8 export quantizes linear1, hidden_layer, mean_linear and log_std_linear dynamically (int8 weights, the
+activations are quantized on the fly) and is loaded again with load_quantized_policy.
+The NumPy export writes the weights to a .npz file for NumpyPolicy, which runs without torch.
+"""
+import io
+import logging
+import pickle
+import time
+from copy import deepcopy
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from SAC_Implementation.Networks import PolicyNetwork
+from SAC_Implementation.NumpyPolicy import NumpyPolicy
+from SAC_Implementation.VectorEnv import environment_seeds, seed_environment
+
+try:
+    from torch.ao.quantization import quantize_dynamic
+except ImportError:
+    # torch < 1.10
+    from torch.quantization import quantize_dynamic
+
+
+def load_trial(trials_file: str, trial: int = None) -> dict:
+    """
+    Load a result of the hyperparameter tuning (see train.prepare_hyperparameter_tuning).
+    :param trials_file: Path of the *.model file with the pickled hyperopt Trials
+    :param trial: Index of the trial, the trial with the lowest loss if None
+    :return: Result dict of run_sac with the keys model (the SACAlgorithm) and params
+    """
+    with open(trials_file, 'rb') as f:
+        trials = pickle.load(f)
+
+    results = trials.results
+    if trial is None:
+        trial = int(np.argmin([result['loss'] for result in results]))
+    logging.info(f"Using trial {trial} of {len(results)} with loss {results[trial]['loss']}")
+    return results[trial]
+
+
+def policy_config(policy: PolicyNetwork) -> dict:
+    """Arguments to build a PolicyNetwork with the same layers"""
+    return {'input_dim': policy.linear1.in_features,
+            'action_dim': policy.mean_linear.out_features,
+            'hidden_dim': policy.linear1.out_features,
+            'hidden_layers': len(policy.hidden_layer),
+            'log_std_min': policy.log_std_min,
+            'log_std_max': policy.log_std_max}
+
+
+def _build_policy(config: dict) -> PolicyNetwork:
+    policy = PolicyNetwork(config['input_dim'],
+                           config['action_dim'],
+                           config['hidden_dim'],
+                           lr_policy=1e-3,
+                           gpu_device=0,
+                           log_std_min=config['log_std_min'],
+                           log_std_max=config['log_std_max'],
+                           hidden_layers=config['hidden_layers'])
+    # Exported policies only act
+    policy.optimizer = None
+    return policy.cpu().eval()
+
+
+def quantize_policy(policy: PolicyNetwork) -> PolicyNetwork:
+    """
+    int8 dynamic quantization of all linear layers of a copy of the policy on the CPU.
+    PolicyNetwork.act works with the quantized copy.
+    """
+    policy = deepcopy(policy).cpu().eval()
+    policy.device = torch.device('cpu')
+    policy.optimizer = None
+    return quantize_dynamic(policy, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized_policy(policy: PolicyNetwork, path: str) -> PolicyNetwork:
+    """
+    Quantize the policy and save it with the configuration of its layers.
+    :return: The quantized policy
+    """
+    quantized = quantize_policy(policy)
+    torch.save({'config': policy_config(policy), 'state_dict': quantized.state_dict()}, path)
+    return quantized
+
+
+def load_quantized_policy(path: str) -> PolicyNetwork:
+    """Load a policy saved with save_quantized_policy"""
+    checkpoint = torch.load(path, map_location='cpu')
+    quantized = quantize_dynamic(_build_policy(checkpoint['config']), {nn.Linear}, dtype=torch.qint8)
+    quantized.load_state_dict(checkpoint['state_dict'])
+    quantized.device = torch.device('cpu')
+    return quantized
+
+
+def numpy_policy_arrays(policy: PolicyNetwork) -> dict:
+    """
+    The weights of the policy as float32 arrays for NumpyPolicy.from_arrays. The weights are stored as [in, out],
+    n_layers is the number of layers before the mean and log std layers.
+    """
+    layers = [policy.linear1] + list(policy.hidden_layer)
+
+    def array(tensor):
+        return tensor.detach().cpu().numpy().astype(np.float32)
+
+    arrays = {'n_layers': np.array(len(layers)),
+              'log_std_min': np.array(policy.log_std_min, dtype=np.float32),
+              'log_std_max': np.array(policy.log_std_max, dtype=np.float32),
+              'mean_weight': array(policy.mean_linear.weight).T,
+              'mean_bias': array(policy.mean_linear.bias),
+              'log_std_weight': array(policy.log_std_linear.weight).T,
+              'log_std_bias': array(policy.log_std_linear.bias)}
+    for i, layer in enumerate(layers):
+        arrays[f'weight_{i}'] = array(layer.weight).T
+        arrays[f'bias_{i}'] = array(layer.bias)
+    return arrays
+
+
+def export_numpy_policy(policy: PolicyNetwork, path: str):
+    """Write the weights of the policy to a .npz file for NumpyPolicy.load"""
+    np.savez(path, **numpy_policy_arrays(policy))
+
+
+def numpy_parity(policy: PolicyNetwork, numpy_policy: NumpyPolicy, n: int = 1024, seed: int = 0) -> dict:
+    """
+    Largest differences between the torch policy and the NumPy runner on random observations. The stochastic sample
+    uses the same noise for both.
+    """
+    rng = np.random.default_rng(seed)
+    state_dim, action_dim = numpy_policy.state_dim, numpy_policy.action_dim
+    obs = rng.standard_normal((n, state_dim)).astype(np.float32)
+    noise = rng.standard_normal((n, action_dim)).astype(np.float32)
+
+    policy = deepcopy(policy).cpu()
+    with torch.no_grad():
+        mean, log_std = policy.forward(torch.from_numpy(obs))
+        # PolicyNetwork.sample with the given noise
+        pi = mean + torch.from_numpy(noise) * log_std.exp()
+
+    np_mean, np_log_std = numpy_policy.forward(obs)
+    _, np_pi, _ = numpy_policy.sample(obs, noise=noise)
+
+    return {'forward_mean': float(np.abs(np_mean - mean.numpy()).max()),
+            'forward_log_std': float(np.abs(np_log_std - log_std.numpy()).max()),
+            'deterministic_action': float(np.abs(numpy_policy.act(obs, deterministic=True) -
+                                                 policy.act(obs, deterministic=True)).max()),
+            'stochastic_action': float(np.abs(np_pi - torch.tanh(pi).numpy()).max())}
+
+
+def model_size(module: nn.Module) -> int:
+    """Size of the serialized state dict in bytes"""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def action_latency(policy: PolicyNetwork, state_dim: int, repeat: int = 1000) -> float:
+    """Median time of one deterministic action for one observation in microseconds"""
+    obs = np.random.default_rng(0).standard_normal(state_dim).astype(np.float32)
+    for _ in range(10):
+        policy.act(obs, deterministic=True)
+
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        _start = time.perf_counter()
+        policy.act(obs, deterministic=True)
+        timings[i] = time.perf_counter() - _start
+    return float(np.median(timings) * 1e6)
+
+
+def episode_returns(policy: PolicyNetwork, env, episodes: int, max_steps: int, seeds=None) -> list:
+    """
+    Returns of episodes with the deterministic actions of the policy
+    :param seeds: The environment is seeded again with each of them before its episode, like in Evaluation
+    """
+    returns = []
+    for episode in range(episodes):
+        if seeds is not None:
+            seed_environment(env, int(seeds[episode]))
+        state, ep_reward = env.reset(), 0
+        for _step in range(max_steps):
+            state, reward, done, _ = env.step(policy.act(state, deterministic=True))
+            ep_reward += reward
+            if done:
+                break
+        returns.append(float(ep_reward))
+    return returns
+
+
+def evaluation_report(policy: PolicyNetwork, quantized: PolicyNetwork, env=None, episodes: int = 10,
+                      max_steps: int = 1000, seed: int = 1) -> dict:
+    """
+    Compare the fp32 policy with its quantized version.
+    :param env: Environment for the episode returns, they are skipped if None. The task is seeded again before every
+        episode, both policies start their episodes from the same initial states
+    :return: dict with the model sizes, the latencies per action and the episode returns
+    """
+    state_dim = policy.linear1.in_features
+    fp32 = deepcopy(policy).cpu()
+    fp32.device = torch.device('cpu')
+
+    report = {'fp32_bytes': model_size(fp32),
+              'int8_bytes': model_size(quantized),
+              'fp32_latency_us': action_latency(fp32, state_dim),
+              'int8_latency_us': action_latency(quantized, state_dim)}
+
+    # Difference of the deterministic actions on random observations
+    obs = np.random.default_rng(seed).standard_normal((1024, state_dim)).astype(np.float32)
+    report['max_action_difference'] = float(np.abs(fp32.act(obs, deterministic=True) -
+                                                   quantized.act(obs, deterministic=True)).max())
+
+    if env is not None:
+        seeds = environment_seeds(seed, episodes)
+        for name, model in (('fp32', fp32), ('int8', quantized)):
+            returns = episode_returns(model, env, episodes, max_steps, seeds=seeds)
+            report[f'{name}_returns'] = returns
+            report[f'{name}_mean_return'] = float(np.mean(returns))
+
+        # The returns are only paired if an episode repeats exactly with its seed
+        if episodes > 0 and episode_returns(fp32, env, 1, max_steps, seeds=seeds) != report['fp32_returns'][:1]:
+            logging.error("The first fp32 episode did not repeat with its seed, the fp32 and int8 returns are not "
+                          "comparable episode by episode")
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n--- {'Policy export'.ljust(70, '-')}")
+    print(f"{'model size'.ljust(25)} fp32 {report['fp32_bytes'] / 1024:10.1f} KB | "
+          f"int8 {report['int8_bytes'] / 1024:10.1f} KB")
+    print(f"{'latency per action'.ljust(25)} fp32 {report['fp32_latency_us']:10.1f} us | "
+          f"int8 {report['int8_latency_us']:10.1f} us")
+    print(f"{'max action difference'.ljust(25)} {report['max_action_difference']:.4f}")
+    if 'numpy_parity' in report:
+        print(f"{'numpy runner difference'.ljust(25)} {max(report['numpy_parity'].values()):.2e}")
+    if 'fp32_mean_return' in report:
+        print(f"{'mean episode return'.ljust(25)} fp32 {report['fp32_mean_return']:10.1f}    | "
+              f"int8 {report['int8_mean_return']:10.1f}")
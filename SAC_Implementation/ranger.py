@@ -20,6 +20,7 @@
 # supports group learning rates (thanks @SHolderbach), fixes sporadic load from saved model issues.
 # changes 8/31/19 - fix references to *self*.N_sma_threshold;
 # changed eps to 1e-5 as better default than 1e-8.
+# RangerForeach: same algorithm with multi-tensor (torch._foreach_*) ops, keyword signatures for add_/addcmul_.
 
 import math
 import torch
@@ -135,39 +136,21 @@ class Ranger(Optimizer):
                 state['step'] += 1
 
                 # compute variance mov avg
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
                 # compute mean moving avg
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
+                exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
 
-                buffered = self.radam_buffer[int(state['step'] % 10)]
-
-                if state['step'] == buffered[0]:
-                    N_sma, step_size = buffered[1], buffered[2]
-                else:
-                    buffered[0] = state['step']
-                    beta2_t = beta2 ** state['step']
-                    N_sma_max = 2 / (1 - beta2) - 1
-                    N_sma = N_sma_max - 2 * \
-                        state['step'] * beta2_t / (1 - beta2_t)
-                    buffered[1] = N_sma
-                    if N_sma > self.N_sma_threshhold:
-                        step_size = math.sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (
-                            N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** state['step'])
-                    else:
-                        step_size = 1.0 / (1 - beta1 ** state['step'])
-                    buffered[2] = step_size
+                N_sma, step_size = self._radam_terms(state['step'], beta1, beta2)
 
                 if group['weight_decay'] != 0:
-                    p_data_fp32.add_(-group['weight_decay']
-                                     * group['lr'], p_data_fp32)
+                    p_data_fp32.add_(p_data_fp32, alpha=-group['weight_decay'] * group['lr'])
 
                 # apply lr
                 if N_sma > self.N_sma_threshhold:
                     denom = exp_avg_sq.sqrt().add_(group['eps'])
-                    p_data_fp32.addcdiv_(-step_size *
-                                         group['lr'], exp_avg, denom)
+                    p_data_fp32.addcdiv_(exp_avg, denom, value=-step_size * group['lr'])
                 else:
-                    p_data_fp32.add_(-step_size * group['lr'], exp_avg)
+                    p_data_fp32.add_(exp_avg, alpha=-step_size * group['lr'])
 
                 p.data.copy_(p_data_fp32)
 
@@ -177,8 +160,107 @@ class Ranger(Optimizer):
                     # get access to slow param tensor
                     slow_p = state['slow_buffer']
                     # (fast weights - slow weights) * alpha
-                    slow_p.add_(self.alpha, p.data - slow_p)
+                    slow_p.add_(p.data - slow_p, alpha=self.alpha)
                     # copy interpolated weights to RAdam param tensor
                     p.data.copy_(slow_p)
 
         return loss
+
+    def _radam_terms(self, step, beta1, beta2):
+        """Length of the approximated SMA and the step size of RAdam, cached for the last 10 steps"""
+        buffered = self.radam_buffer[int(step % 10)]
+
+        if step == buffered[0]:
+            N_sma, step_size = buffered[1], buffered[2]
+        else:
+            buffered[0] = step
+            beta2_t = beta2 ** step
+            N_sma_max = 2 / (1 - beta2) - 1
+            N_sma = N_sma_max - 2 * \
+                step * beta2_t / (1 - beta2_t)
+            buffered[1] = N_sma
+            if N_sma > self.N_sma_threshhold:
+                step_size = math.sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (
+                    N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** step)
+            else:
+                step_size = 1.0 / (1 - beta1 ** step)
+            buffered[2] = step_size
+        return N_sma, step_size
+
+
+class RangerForeach(Ranger):
+    """
+    Ranger with multi-tensor ops: the moments, the RAdam step and the lookahead of all parameters of a group are
+    updated with one torch._foreach_* call each instead of a Python loop over the parameters.
+    Only the means of the gradient centralization are computed per parameter.
+    The parameters have to be float32, the result matches Ranger up to floating point rounding.
+    """
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+
+        for group in self.param_groups:
+            params = [p for p in group['params'] if p.grad is not None]
+            if any(p.grad.is_sparse for p in params):
+                raise RuntimeError(
+                    'Ranger optimizer does not support sparse gradients')
+
+            # Parameters which got their first gradient later have a different step and RAdam term
+            by_step = {}
+            for p in params:
+                state = self.state[p]
+                if len(state) == 0:
+                    state['step'] = 0
+                    state['exp_avg'] = torch.zeros_like(p)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
+                    state['slow_buffer'] = p.detach().clone()
+                state['step'] += 1
+                by_step.setdefault(state['step'], []).append(p)
+
+            for step, step_params in by_step.items():
+                self._foreach_update(group, step, step_params)
+
+        return loss
+
+    def _foreach_update(self, group, step, params):
+        grads = [p.grad for p in params]
+        states = [self.state[p] for p in params]
+        exp_avgs = [state['exp_avg'] for state in states]
+        exp_avg_sqs = [state['exp_avg_sq'] for state in states]
+        beta1, beta2 = group['betas']
+
+        # GC operation for Conv layers and FC layers
+        gc_grads = [grad for grad in grads if grad.dim() > self.gc_gradient_threshold]
+        if gc_grads:
+            torch._foreach_sub_(gc_grads, [grad.mean(dim=tuple(range(1, grad.dim())), keepdim=True)
+                                           for grad in gc_grads])
+
+        # variance and mean moving avg
+        torch._foreach_mul_(exp_avg_sqs, beta2)
+        torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+        torch._foreach_mul_(exp_avgs, beta1)
+        torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+
+        N_sma, step_size = self._radam_terms(step, beta1, beta2)
+
+        if group['weight_decay'] != 0:
+            torch._foreach_add_(params, params, alpha=-group['weight_decay'] * group['lr'])
+
+        # apply lr
+        if N_sma > self.N_sma_threshhold:
+            denom = torch._foreach_sqrt(exp_avg_sqs)
+            torch._foreach_add_(denom, group['eps'])
+            torch._foreach_addcdiv_(params, exp_avgs, denom, value=-step_size * group['lr'])
+        else:
+            torch._foreach_add_(params, exp_avgs, alpha=-step_size * group['lr'])
+
+        # integrated look ahead: slow weights += alpha * (fast weights - slow weights), then fast weights = slow
+        if step % group['k'] == 0:
+            slow = [state['slow_buffer'] for state in states]
+            torch._foreach_add_(slow, torch._foreach_sub(params, slow), alpha=self.alpha)
+            if hasattr(torch, '_foreach_copy_'):
+                torch._foreach_copy_(params, slow)
+            else:
+                for p, slow_p in zip(params, slow):
+                    p.copy_(slow_p)
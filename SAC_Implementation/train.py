@@ -4,6 +4,7 @@ import pickle
 import random
 import time
 from datetime import datetime
+from functools import partial
 from typing import Dict
 
 import numpy as np
@@ -12,6 +13,12 @@ import torch
 from scipy.special.cython_special import hyperu
 
 from SAC_Implementation.SACAlgorithm import SACAlgorithm
+from SAC_Implementation.VectorEnv import VectorEnv, EpisodeCollector, make_dmc_env
+from SAC_Implementation.AsyncTraining import AsyncActors, AsyncStats
+from SAC_Implementation.Checkpoint import Checkpointer, run_directory, fmin_rstate
+from SAC_Implementation.Evaluation import BackgroundEvaluator
+from SAC_Implementation.Timing import PhaseTimer
+from SAC_Implementation.policy_export import numpy_policy_arrays
 from VideoRecorder import VideoRecorder
 from plotter import Plotter
 
@@ -42,12 +49,26 @@ def prepare_hyperparameter_tuning(hyperparameter_space, max_evals=2):
         file_path = f"hp_trials/{hyperparameter_space.get('hyperparmeter_round')}_{filename}.model"
 
         trials = Trials()
+        rstate = None
+        checkpoint_dir = hyperparameter_space.get('checkpoint_dir')
+        if checkpoint_dir:
+            # The trials are saved next to the checkpoints, a resumed job skips the finished ones
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            file_path = os.path.join(checkpoint_dir, 'trials.model')
+            if hyperparameter_space.get('resume') and os.path.exists(file_path):
+                with open(file_path, 'rb') as f:
+                    trials = pickle.load(f)
+                logging.info(f"Resume the hyperparameter tuning after {len(trials.trials)} finished trials")
+            seed = int(os.environ.get('HYPEROPT_FMIN_SEED') or hyperparameter_space.get('seed'))
+            rstate = fmin_rstate(seed, len(trials.trials))
+
         best = fmin(run_sac,
                     hyperparameter_space,
                     algo=tpe.suggest,
                     trials=trials,
                     max_evals=max_evals,
-                    trials_save_file=file_path
+                    trials_save_file=file_path,
+                    rstate=rstate
                     )
 
         logging.info("WE ARE DONE. THE BEST TRIAL IS:")
@@ -74,6 +95,14 @@ def run_sac(hyperparameter_space: dict) -> Dict:
 
     set_seed(hyperparameter_space.get('seed'))
 
+    if hyperparameter_space.get('checkpoint_dir') and \
+            ((hyperparameter_space.get('actors') or 0) > 0 or (hyperparameter_space.get('num_envs') or 1) > 1):
+        logging.warning("Checkpoints are only written by the training with one environment")
+    if (hyperparameter_space.get('actors') or 0) > 0:
+        return run_sac_async(hyperparameter_space)
+    if (hyperparameter_space.get('num_envs') or 1) > 1:
+        return run_sac_vectorized(hyperparameter_space)
+
     # Initialize the environment
     env, action_dim, state_dim = initialize_environment(domain_name=hyperparameter_space.get('env_domain'),
                                                         task_name=hyperparameter_space.get('env_task'),
@@ -81,39 +110,30 @@ def run_sac(hyperparameter_space: dict) -> Dict:
                                                         frame_skip=hyperparameter_space.get('frame_skip'))
 
     # Create the SAC Algorithm
-    sac = SACAlgorithm(env=env,
-                       param={
-                           "hidden_dim": hyperparameter_space.get('hidden_dim'),
-                           "lr_critic": hyperparameter_space.get('lr_critic'),
-                           "lr_actor": hyperparameter_space.get('lr_actor'),
-                           "alpha": hyperparameter_space.get('alpha'),
-                           "tau": hyperparameter_space.get('tau'),
-                           "gamma": hyperparameter_space.get('gamma'),
-                           "sample_batch_size": hyperparameter_space.get('sample_batch_size'),
-                           "replay_buffer_size": hyperparameter_space.get('replay_buffer_size'),
-                           "gpu_device": hyperparameter_space.get('gpu_device'),
-                           "policy_function": hyperparameter_space.get('policy_function'),
-                           "init_alpha": hyperparameter_space.get('init_alpha'),
-                           "alpha_lr": hyperparameter_space.get('alpha_lr'),
-                           "alpha_beta": hyperparameter_space.get('alpha_beta'),
-                           "alpha_decay_deactivate": hyperparameter_space.get('alpha_decay_deactivate'),
-
-                           "policy_hidden_layers": hyperparameter_space.get('policy_hidden_layers'),
-                           "q_hidden_layers": hyperparameter_space.get('q_hidden_layers')
-                       })
+    sac = initialize_sac(env, hyperparameter_space)
+    timer = initialize_timer(sac, hyperparameter_space)
 
     video, plotter, recording_interval = initialize_plotting(hyperparameter_space)
-    total_step = 0
+    start_episode, total_step = 0, 0
 
     reward_velocity = 0
 
+    evaluator = initialize_evaluator(hyperparameter_space)
+    checkpointer = initialize_checkpointer(hyperparameter_space)
+    if checkpointer is not None and hyperparameter_space.get('resume') and checkpointer.exists():
+        counters = checkpointer.load(sac, plotter, env)
+        start_episode, total_step, reward_velocity = (counters['episode'], counters['total_step'],
+                                                      counters['reward_velocity'])
+        if evaluator is not None:
+            evaluator.results = counters.get('evaluations', [])
+
     try:
-        for _episode in range(hyperparameter_space.get('episodes')):
+        for _episode in range(start_episode, hyperparameter_space.get('episodes')):
             _start = time.time()
 
             logging.debug(f"Start EPISODE {_episode + 1}")
 
-            ep_reward, policy_loss_incr, q_loss_incr, alpha_loss_incr, length = 0, [], [], [], 0
+            ep_reward, length = 0, 0
             # Observe state
             current_state = env.reset()
 
@@ -123,20 +143,27 @@ def run_sac(hyperparameter_space: dict) -> Dict:
 
                 # Do the next step
                 # logging.warning("STEEEEEP 5")
-                action_mean = sac.sample_action(torch.Tensor(current_state))[0] if _episode > hyperparameter_space.get("init_rounds") \
-                    else env.action_space.sample()
+                with timer['act']:
+                    action_mean = sac.act(current_state, deterministic=True) if _episode > hyperparameter_space.get("init_rounds") \
+                        else env.action_space.sample()
 
                 # logging.warning("STEEEEEP 6")
-                s1, r, done, _ = env.step(np.array(action_mean))
+                with timer['env_step']:
+                    s1, r, done, _ = env.step(np.array(action_mean))
 
                 # The last done is fake therefore we set it to true again
-                if (step + 1) == int(hyperparameter_space.get('max_steps')):
+                timeout = (step + 1) == int(hyperparameter_space.get('max_steps'))
+                if timeout:
                     done = False
 
-                LogHelper.log_step(_episode, step, r, action_mean)
+                with timer['log_step']:
+                    LogHelper.log_step(_episode, step, r, action_mean)
 
                 # logging.warning("STEEEEEP 7")
-                sac.buffer.add(obs=current_state, action=action_mean, reward=r, next_obs=s1, done=done)
+                # done_no_max marks the end of the episode at max_steps, n-step returns must not go beyond it
+                with timer['buffer_add']:
+                    sac.buffer.add(obs=current_state, action=action_mean, reward=r, next_obs=s1, done=done,
+                                   done_no_max=timeout)
                 ep_reward += r
 
                 # logging.warning("STEEEEEP 8")
@@ -146,32 +173,27 @@ def run_sac(hyperparameter_space: dict) -> Dict:
                 current_state = s1
 
                 # logging.warning("STEEEEEP 9")
-                # if sac.buffer.length > sac.sample_batch_size:
-                if sac.buffer.length > 1000:
-                    _polo, _qlo, _alo = [], [], []
-                    # TODO REWRITE
-                    update_steps = hyperparameter_space.get('max_steps') if total_step == hyperparameter_space.get(
-                        'max_steps') else hyperparameter_space.get('num_updates')
-                    for i in range(update_steps):
-                        # Update the network
-                        _metric = sac.update(step)
-                        _polo.append(_metric[0])
-                        _qlo.append(_metric[1])
-                        _alo.append(_metric[2])
-                    policy_loss_incr.append(sum(_polo) / len(_polo))
-                    q_loss_incr.append(sum(_qlo) / len(_qlo))
-                    alpha_loss_incr.append(sum(_alo) / len(_alo))
+                # Warmup, update-to-data ratio and bursts come from the scheduler, the terminal step has no updates
+                update_steps = sac.scheduler.updates(total_step, sac.buffer.length)
+                if update_steps > 0:
+                    # Update the network, the batches of the burst are sampled at once.
+                    # The metrics are accumulated on the device by sac.metrics
+                    with timer['updates']:
+                        sac.update_many(step, update_steps)
                     length = step
 
-                if _episode % recording_interval == 0: video.record(env)
+                if _episode % recording_interval == 0:
+                    with timer['video_record']:
+                        video.record(env)
 
             if _episode % recording_interval == 0: video.save_and_reset(_episode)
 
             _end = time.time()
+            timer.end_episode(_episode)
 
-            avg_ploss = sum(policy_loss_incr) / len(policy_loss_incr) if len(policy_loss_incr) != 0 else -1
-            avg_qloss = sum(q_loss_incr) / len(q_loss_incr) if len(q_loss_incr) != 0 else -1
-            avg_aloss = sum(alpha_loss_incr) / len(alpha_loss_incr) if len(alpha_loss_incr) != 0 else -1
+            # Averages of the updates of the episode, -1 without updates
+            metrics = sac.metrics.read()
+            avg_ploss, avg_qloss, avg_aloss = metrics['policy_loss'], metrics['q_loss'], metrics['alpha']
 
             _last_ploss = plotter.get_last_ploss()
             plotter.add_to_lists(reward=ep_reward,
@@ -179,6 +201,7 @@ def run_sac(hyperparameter_space: dict) -> Dict:
                                  policy_loss=avg_ploss,
                                  q_loss=avg_qloss,
                                  a_loss=avg_aloss,
+                                 entropy=metrics['entropy'],
                                  total_steps=total_step,
                                  episode=_episode,
                                  time=_end - _start,
@@ -203,14 +226,225 @@ def run_sac(hyperparameter_space: dict) -> Dict:
                 logging.error(f"ABORT DUE TO TOO HIGH POLICY LOSS: {avg_ploss}")
                 # break
 
+            evaluate_snapshot(evaluator, sac, _episode, total_step, hyperparameter_space)
+
+            if checkpointer is not None and (_episode + 1) % hyperparameter_space.get('checkpoint_interval') == 0:
+                checkpointer.save(sac, plotter, env, {'episode': _episode + 1,
+                                                      'total_step': total_step,
+                                                      'reward_velocity': reward_velocity,
+                                                      'evaluations': evaluator.results if evaluator else []})
+
+        # The last snapshots are still evaluated
+        if evaluator is not None:
+            evaluator.close(wait=True)
+
     except KeyboardInterrupt as e:
         logging.error("KEYBOARD INTERRUPT")
         raise
     finally:
+        if evaluator is not None:
+            evaluator.close(wait=False)
+        sac.close()
         # TODO ITS DEACTIVATED
         plotter.plot()
         pass
 
+    return training_result(sac, plotter, hyperparameter_space, evaluator)
+
+
+def run_sac_vectorized(hyperparameter_space: dict) -> Dict:
+    """
+    run_sac with num_envs environments in worker processes (see VectorEnv). All environments are stepped with one
+    batched action of the policy, the episodes go to the replay buffer when they end. Every step of the environments
+    counts as num_envs steps for the scheduler, so the updates per transition stay the same as in run_sac.
+    No videos are recorded.
+    :param hyperparameter_space: Dict with the hyperparameter from the Argument parser
+    :return: Result like run_sac
+    """
+    num_envs, max_steps = int(hyperparameter_space.get('num_envs')), int(hyperparameter_space.get('max_steps'))
+    episodes = hyperparameter_space.get('episodes')
+
+    LogHelper.print_step_log(f"Initialize {num_envs} Environments: {hyperparameter_space.get('env_domain')}/"
+                             f"{hyperparameter_space.get('env_task')} ...")
+    env = VectorEnv(environment_factory(hyperparameter_space),
+                    num_envs=num_envs,
+                    seed=hyperparameter_space.get('seed'),
+                    max_steps=max_steps)
+
+    sac = initialize_sac(env, hyperparameter_space)
+    timer = initialize_timer(sac, hyperparameter_space)
+    collector = EpisodeCollector(sac.buffer, num_envs, max_steps, sac.state_dim, sac.action_dim)
+    plotter = Plotter(episodes)
+    evaluator = initialize_evaluator(hyperparameter_space)
+    low, high = env.action_space.low, env.action_space.high
+
+    episode, total_step, step = 0, 0, 0
+    _start = time.time()
+    try:
+        env.reset()
+        while episode < episodes:
+            with timer['act']:
+                if episode > hyperparameter_space.get('init_rounds'):
+                    actions = sac.act(env.obs, deterministic=True)
+                else:
+                    actions = np.random.uniform(low, high, size=(num_envs, sac.action_dim))
+
+            with timer['env_step']:
+                transitions = env.step(actions)
+            with timer['buffer_add']:
+                collector.add(transitions)
+            total_step += num_envs
+
+            update_steps = sac.scheduler.updates(total_step, sac.buffer.length, env_steps=num_envs)
+            if update_steps > 0:
+                with timer['updates']:
+                    sac.update_many(step, update_steps)
+            step += 1
+
+            if transitions.finished:
+                # The updates since the last finished episodes are shared by the episodes of this step
+                metrics = sac.metrics.read()
+                _end = time.time()
+                for _, ep_reward, length in transitions.finished[:episodes - episode]:
+                    plotter.add_to_lists(reward=ep_reward,
+                                         length=length,
+                                         policy_loss=metrics['policy_loss'],
+                                         q_loss=metrics['q_loss'],
+                                         a_loss=metrics['alpha'],
+                                         entropy=metrics['entropy'],
+                                         total_steps=total_step,
+                                         episode=episode,
+                                         time=_end - _start)
+                    evaluate_snapshot(evaluator, sac, episode, total_step, hyperparameter_space)
+                    episode += 1
+                # The phases since the last finished episodes, like the metrics
+                timer.end_episode(episode - 1)
+                _start = _end
+
+        if evaluator is not None:
+            evaluator.close(wait=True)
+
+    except KeyboardInterrupt as e:
+        logging.error("KEYBOARD INTERRUPT")
+        raise
+    finally:
+        if evaluator is not None:
+            evaluator.close(wait=False)
+        env.close()
+        sac.close()
+
+    return training_result(sac, plotter, hyperparameter_space, evaluator)
+
+
+def run_sac_async(hyperparameter_space: dict) -> Dict:
+    """
+    run_sac with asynchronous actors (see AsyncActors). The actors step their environments with the last published
+    policy weights, this process is the learner: it adds the finished episodes to the replay buffer and updates
+    continuously, utd_ratio updates of the scheduler per environment step of the actors after its warmup. The weights
+    are published every policy_sync_interval updates.
+    No videos are recorded.
+    :param hyperparameter_space: Dict with the hyperparameter from the Argument parser
+    :return: Result like run_sac with the actor steps/sec, learner updates/sec and policy lag per episode in 'async'
+    """
+    num_actors, max_steps = int(hyperparameter_space.get('actors')), int(hyperparameter_space.get('max_steps'))
+    episodes = hyperparameter_space.get('episodes')
+    sync_interval = int(hyperparameter_space.get('policy_sync_interval') or 1)
+    # Largest burst of updates between two looks at the queue
+    max_burst = 64
+
+    LogHelper.print_step_log(f"Initialize {num_actors} Actors: {hyperparameter_space.get('env_domain')}/"
+                             f"{hyperparameter_space.get('env_task')} ...")
+    make_env = environment_factory(hyperparameter_space)
+    # The learner only needs the spaces of the environment
+    probe = make_env(hyperparameter_space.get('seed'))
+    sac = initialize_sac(probe, hyperparameter_space)
+    timer = initialize_timer(sac, hyperparameter_space)
+    if hasattr(probe, 'close'):
+        probe.close()
+
+    actors = AsyncActors(make_env,
+                         num_actors=num_actors,
+                         seed=hyperparameter_space.get('seed'),
+                         max_steps=max_steps,
+                         policy=sac.policy,
+                         utd_ratio=sac.scheduler.utd_ratio,
+                         max_actor_lead=int(hyperparameter_space.get('max_actor_lead') or max_steps),
+                         random_episodes=int(hyperparameter_space.get('init_rounds')) + 1)
+    plotter = Plotter(episodes)
+    evaluator = initialize_evaluator(hyperparameter_space)
+    stats = AsyncStats()
+
+    episode, updates, bursts, published = 0, 0, 0, 0
+    _start = time.time()
+    try:
+        while episode < episodes:
+            # Wait for the actors only if there is nothing to update
+            target = sac.scheduler.utd_ratio * (actors.env_steps - actors.update_start) if actors.update_start >= 0 else 0
+            finished = actors.poll(timeout=None if updates < target else 0.01)
+
+            with timer['buffer_add']:
+                for ep in finished:
+                    sac.buffer.add_batch(obs=ep.obs, action=ep.action, reward=ep.reward, next_obs=ep.next_obs,
+                                         done=ep.done, done_no_max=ep.timeout)
+            if actors.update_start < 0 and sac.buffer.length > sac.scheduler.warmup:
+                actors.start_updates()
+
+            if finished:
+                # The updates since the last finished episodes are shared by the episodes of this poll
+                metrics = sac.metrics.read()
+                _end = time.time()
+                finished = finished[:episodes - episode]
+                stats.add(actors.env_steps, updates, [ep.version_lag for ep in finished])
+                for ep in finished:
+                    plotter.add_to_lists(reward=ep.ep_return,
+                                         length=ep.length,
+                                         policy_loss=metrics['policy_loss'],
+                                         q_loss=metrics['q_loss'],
+                                         a_loss=metrics['alpha'],
+                                         entropy=metrics['entropy'],
+                                         total_steps=actors.env_steps,
+                                         episode=episode,
+                                         time=_end - _start)
+                    evaluate_snapshot(evaluator, sac, episode, actors.env_steps, hyperparameter_space)
+                    episode += 1
+                # The phases of the learner since the last finished episodes, like the metrics
+                timer.end_episode(episode - 1)
+                _start = _end
+
+            n_updates = min(int(target - updates), max_burst)
+            if n_updates > 0:
+                # Like the steps of run_sac, every second burst skips the gradient steps
+                with timer['updates']:
+                    sac.update_many(bursts, n_updates)
+                updates += n_updates
+                bursts += 1
+                actors.set_updates(updates)
+                if updates - published >= sync_interval:
+                    actors.publish(sac.policy, updates)
+                    published = updates
+
+        if evaluator is not None:
+            evaluator.close(wait=True)
+
+    except KeyboardInterrupt as e:
+        logging.error("KEYBOARD INTERRUPT")
+        raise
+    finally:
+        if evaluator is not None:
+            evaluator.close(wait=False)
+        actors.close()
+        sac.close()
+
+    return {**training_result(sac, plotter, hyperparameter_space, evaluator), 'async': stats.as_dict()}
+
+
+def training_result(sac: SACAlgorithm, plotter: Plotter, hyperparameter_space: dict,
+                    evaluator: BackgroundEvaluator = None) -> Dict:
+    """
+    Result of a training for hyperopt and hp_evaluation
+    :param evaluator: Its evaluations are added under 'evaluations'
+    The phase times of --timing are under 'timing' (empty without).
+    """
     rew, _, q_losses, policy_losses, total_step, timing, a_losses = plotter.get_lists()
 
     # Give back the error which should be optimized by the hyperparameter tuner
@@ -223,12 +457,119 @@ def run_sac(hyperparameter_space: dict) -> Dict:
             'q_losses': q_losses,
             'policy_losses': policy_losses,
             'alpha_losses': a_losses,
+            'entropies': plotter.entropies,
             'rewards': rew,
             'total_steps': total_step,
             'time': timing,
+            'evaluations': evaluator.results if evaluator is not None else [],
+            'timing': sac.timer.as_dict(),
             'params': hyperparameter_space}
 
 
+def initialize_sac(env, hyperparameter_space: dict) -> SACAlgorithm:
+    """
+    Create the SAC Algorithm with the parameters of the Argument parser
+    :param env: Environment (or VectorEnv) with observation_space and action_space
+    """
+    return SACAlgorithm(env=env,
+                        param={
+                            "hidden_dim": hyperparameter_space.get('hidden_dim'),
+                            "lr_critic": hyperparameter_space.get('lr_critic'),
+                            "lr_actor": hyperparameter_space.get('lr_actor'),
+                            "optimizer": hyperparameter_space.get('optimizer'),
+                            "alpha": hyperparameter_space.get('alpha'),
+                            "tau": hyperparameter_space.get('tau'),
+                            "gamma": hyperparameter_space.get('gamma'),
+                            "sample_batch_size": hyperparameter_space.get('sample_batch_size'),
+                            "replay_buffer_size": hyperparameter_space.get('replay_buffer_size'),
+                            "buffer_dtype": hyperparameter_space.get('buffer_dtype'),
+                            "buffer_dir": hyperparameter_space.get('buffer_dir'),
+                            "prioritized_replay": hyperparameter_space.get('prioritized_replay'),
+                            "per_alpha": hyperparameter_space.get('per_alpha'),
+                            "per_beta": hyperparameter_space.get('per_beta'),
+                            "buffer_on_device": hyperparameter_space.get('buffer_on_device'),
+                            "prefetch_batches": hyperparameter_space.get('prefetch_batches'),
+                            "seed": hyperparameter_space.get('seed'),
+                            "n_step": hyperparameter_space.get('n_step'),
+                            "gpu_device": hyperparameter_space.get('gpu_device'),
+                            "policy_function": hyperparameter_space.get('policy_function'),
+                            "init_alpha": hyperparameter_space.get('init_alpha'),
+                            "alpha_lr": hyperparameter_space.get('alpha_lr'),
+                            "alpha_beta": hyperparameter_space.get('alpha_beta'),
+                            "alpha_decay_deactivate": hyperparameter_space.get('alpha_decay_deactivate'),
+
+                            "policy_hidden_layers": hyperparameter_space.get('policy_hidden_layers'),
+                            "q_hidden_layers": hyperparameter_space.get('q_hidden_layers'),
+                            "ensemble_critic": hyperparameter_space.get('ensemble_critic'),
+                            "num_critics": hyperparameter_space.get('num_critics'),
+                            "bf16_autocast": hyperparameter_space.get('bf16_autocast'),
+                            "compile_update": hyperparameter_space.get('compile_update'),
+
+                            "warmup": hyperparameter_space.get('warmup'),
+                            "utd_ratio": hyperparameter_space.get('utd_ratio'),
+                            "num_updates": hyperparameter_space.get('num_updates'),
+                            "burst_interval": hyperparameter_space.get('burst_interval'),
+                            "initial_burst": hyperparameter_space.get('initial_burst'),
+                            "max_steps": hyperparameter_space.get('max_steps'),
+                            "update_period": hyperparameter_space.get('update_period'),
+                            "policy_delay": hyperparameter_space.get('policy_delay')
+                        })
+
+
+def initialize_timer(sac: SACAlgorithm, hyperparameter_space: dict):
+    """
+    PhaseTimer of the training loop and the updates of sac if --timing is set, otherwise the NULL_TIMER which costs
+    nearly nothing
+    """
+    if hyperparameter_space.get('timing'):
+        # On the GPU every span waits for its kernels
+        sac.timer = PhaseTimer(synchronize=torch.cuda.synchronize if sac.device.type == 'cuda' else None)
+    return sac.timer
+
+
+def environment_factory(hyperparameter_space: dict):
+    """Picklable function seed -> environment for the worker processes"""
+    return partial(make_dmc_env,
+                   domain_name=hyperparameter_space.get('env_domain'),
+                   task_name=hyperparameter_space.get('env_task'),
+                   frame_skip=hyperparameter_space.get('frame_skip'))
+
+
+def initialize_evaluator(hyperparameter_space: dict):
+    """BackgroundEvaluator of the policy snapshots, None if eval_interval is 0"""
+    if not hyperparameter_space.get('eval_interval'):
+        return None
+    return BackgroundEvaluator(environment_factory(hyperparameter_space),
+                               seed=hyperparameter_space.get('seed'),
+                               max_steps=int(hyperparameter_space.get('max_steps')),
+                               episodes=hyperparameter_space.get('eval_episodes'),
+                               workers=hyperparameter_space.get('eval_workers'))
+
+
+def evaluate_snapshot(evaluator, sac: SACAlgorithm, episode: int, total_step: int, hyperparameter_space: dict):
+    """
+    Hand a snapshot of the policy to the evaluator every eval_interval episodes and collect the finished evaluations.
+    Both return at once.
+    """
+    if evaluator is None:
+        return
+    if (episode + 1) % hyperparameter_space.get('eval_interval') == 0:
+        evaluator.submit(numpy_policy_arrays(sac.policy), episode, total_step)
+    evaluator.poll()
+
+
+def initialize_checkpointer(hyperparameter_space: dict):
+    """Checkpointer of the run in its directory below checkpoint_dir, None without checkpoint_dir"""
+    checkpoint_dir = hyperparameter_space.get('checkpoint_dir')
+    if not checkpoint_dir:
+        return None
+
+    directory = run_directory(checkpoint_dir, hyperparameter_space)
+    if os.path.exists(directory) and not hyperparameter_space.get('resume'):
+        logging.warning(f"Overwriting the checkpoints in {directory}, use --resume to continue them")
+    return Checkpointer(directory)
+
+
 def initialize_environment(domain_name, task_name, seed, frame_skip):
     """
     Initialize the Evironment
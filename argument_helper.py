@@ -50,6 +50,13 @@ def parse(defaults: dict) -> dict:
                         default=defaults['lr-critic'],
                         # TODO Add more meaningful description
                         help='Learning Rate')
+
+    parser.add_argument('--optimizer',
+                        type=str,
+                        default=defaults['optimizer'],
+                        choices=['adam', 'ranger', 'ranger_foreach'],
+                        help='Optimizer of the policy and the Q networks')
+
     parser.add_argument('--policy-hidden-layers',
                         type=float,
                         default=defaults['policy_hidden_layers'],
@@ -60,6 +67,28 @@ def parse(defaults: dict) -> dict:
                         default=defaults['q_hidden_layers'],
                         help='Hidden layers for the Q networks')
 
+    parser.add_argument('--ensemble_critic',
+                        default=defaults['ensemble_critic'],
+                        action='store_true',
+                        help='Evaluate all critics as one ensemble with stacked weights and one optimizer')
+
+    parser.add_argument('--num_critics',
+                        default=defaults['num_critics'],
+                        type=int,
+                        help='Number of members of the ensemble critic, the target is the minimum of all')
+
+    parser.add_argument('--bf16_autocast',
+                        default=defaults['bf16_autocast'],
+                        action='store_true',
+                        help='Forward and backward passes of the updates with bfloat16 autocast, '
+                             'falls back to float32 if the Q loss is not finite or more than 100 times its running '
+                             'average')
+
+    parser.add_argument('--compile_update',
+                        default=defaults['compile_update'],
+                        action='store_true',
+                        help='Compile the gradient step of the updates with torch.compile')
+
     # #############################################################
     # Parameter for RL
     # #############################################################
@@ -125,6 +154,28 @@ def parse(defaults: dict) -> dict:
                         help='Applying an action for several step. According to tutorial: Card_pole: 8, Finka Task: 2 and a default of 4')
 
 
+    parser.add_argument('--num_envs',
+                        default=defaults['num_envs'],
+                        type=int,
+                        help='Number of environments in worker processes, stepped with batched actions')
+
+    parser.add_argument('--actors',
+                        default=defaults['actors'],
+                        type=int,
+                        help='Number of asynchronous actor processes, the training process only runs the updates. '
+                             '0 turns the asynchronous mode off')
+
+    parser.add_argument('--policy_sync_interval',
+                        default=defaults['policy_sync_interval'],
+                        type=int,
+                        help='Learner updates between two publications of the policy weights to the actors')
+
+    parser.add_argument('--max_actor_lead',
+                        default=defaults['max_actor_lead'],
+                        type=int,
+                        help='Environment steps the actors may be ahead of the update-to-data ratio, max_steps if '
+                             'not given')
+
     parser.add_argument('--seed',
                         default=defaults['seed'],
                         type=int,
@@ -141,6 +192,49 @@ def parse(defaults: dict) -> dict:
                         # TODO Add more meaningful description
                         help='')
 
+    parser.add_argument('--buffer_dtype',
+                        default=defaults['buffer_dtype'],
+                        choices=['float64', 'float32', 'float16', 'bfloat16'],
+                        type=str,
+                        help='Storage type of the replay buffer. Everything except float64 uses the compact buffer '
+                             'which does not store next_obs twice')
+
+    parser.add_argument('--buffer_dir',
+                        default=defaults['buffer_dir'],
+                        type=str,
+                        help='Keep the replay buffer in memory mapped files in this directory. An existing buffer '
+                             'in the directory is reopened')
+
+    parser.add_argument('--prioritized_replay',
+                        default=defaults['prioritized_replay'],
+                        action='store_true',
+                        help='Sample the replay buffer proportional to the TD errors')
+
+    parser.add_argument('--per_alpha',
+                        default=defaults['per_alpha'],
+                        type=float,
+                        help='Exponent of the priorities (0 = uniform sampling)')
+
+    parser.add_argument('--per_beta',
+                        default=defaults['per_beta'],
+                        type=float,
+                        help='Exponent of the importance sampling weights (1 = full correction)')
+
+    parser.add_argument('--buffer_on_device',
+                        default=defaults['buffer_on_device'],
+                        action='store_true',
+                        help='Store the replay buffer as float32 tensors on the training device')
+
+    parser.add_argument('--prefetch_batches',
+                        default=defaults['prefetch_batches'],
+                        type=int,
+                        help='Number of batches a background thread samples ahead. 0 turns prefetching off')
+
+    parser.add_argument('--n_step',
+                        default=defaults['n_step'],
+                        type=int,
+                        help='Number of steps of the returns used for the TD targets')
+
     # TODO Set higher episode times
     parser.add_argument('--episodes',
                         default=defaults['episodes'],
@@ -192,5 +286,86 @@ def parse(defaults: dict) -> dict:
                         # TODO Add more meaningful description
                         help='Specify the GPU to use. Range: 0-3')
 
+    # ############################################################
+    # Evaluation
+    # ############################################################
+
+    parser.add_argument('--eval_interval',
+                        default=defaults['eval_interval'],
+                        type=int,
+                        help='Episodes between two evaluations of the policy in background processes, 0 for none')
+
+    parser.add_argument('--eval_episodes',
+                        default=defaults['eval_episodes'],
+                        type=int,
+                        help='Deterministic evaluation episodes per policy snapshot')
+
+    parser.add_argument('--eval_workers',
+                        default=defaults['eval_workers'],
+                        type=int,
+                        help='Worker processes of the evaluation, the episodes of a snapshot run in parallel')
+
+    # ############################################################
+    # Checkpoints
+    # ############################################################
+
+    parser.add_argument('--checkpoint_dir',
+                        default=defaults['checkpoint_dir'],
+                        type=str,
+                        help='Directory for the checkpoints of the runs and the hyperopt trials, no checkpoints if '
+                             'not given')
+
+    parser.add_argument('--checkpoint_interval',
+                        default=defaults['checkpoint_interval'],
+                        type=int,
+                        help='Episodes between two checkpoints')
+
+    parser.add_argument('--resume',
+                        default=defaults['resume'],
+                        action='store_true',
+                        help='Continue the runs and the hyperparameter tuning of checkpoint_dir')
+
+    parser.add_argument('--timing',
+                        default=defaults['timing'],
+                        action='store_true',
+                        help='Measure the time of the phases of the training loop and the updates (per episode and '
+                             'update latency percentiles)')
+
+    # ############################################################
+    # Update schedule
+    # ############################################################
+
+    parser.add_argument('--warmup',
+                        default=defaults['warmup'],
+                        type=int,
+                        help='Transitions in the replay buffer before the first update')
+
+    parser.add_argument('--utd_ratio',
+                        default=defaults['utd_ratio'],
+                        type=float,
+                        help='Updates per environment step, fractional values are allowed. num_updates if not given')
+
+    parser.add_argument('--burst_interval',
+                        default=defaults['burst_interval'],
+                        type=int,
+                        help='Environment steps between two update bursts, the updates of the steps in between are '
+                             'run together')
+
+    parser.add_argument('--initial_burst',
+                        default=defaults['initial_burst'],
+                        type=int,
+                        help='Total step with a burst of as many updates, max_steps if not given and 0 for none')
+
+    parser.add_argument('--update_period',
+                        default=defaults['update_period'],
+                        type=int,
+                        help='Steps of an episode between two steps with gradient steps, the other updates only '
+                             'move the target networks')
+
+    parser.add_argument('--policy_delay',
+                        default=defaults['policy_delay'],
+                        type=int,
+                        help='Gradient steps of the critics per update of the policy and alpha')
+
     args = vars(parser.parse_args())
     return args
\ No newline at end of file
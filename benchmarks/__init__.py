@@ -0,0 +1,5 @@
+"""
+Micro benchmarks for the hot paths of the SAC implementation.
+Run them from the root of the repository, e.g. python -m benchmarks.replay_memmap
+The suite of the main ones with JSON results and a regression check is python -m benchmarks.suite (see there).
+"""
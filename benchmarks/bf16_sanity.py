@@ -0,0 +1,58 @@
+"""
+Learning curve sanity check of bfloat16 autocast: trains the same seed with main.py once in float32 and once with
+--bf16_autocast and compares the episode rewards. Needs dmc2gym and hyperopt.
+
+    python -m benchmarks.bf16_sanity --env-domain ball_in_cup --env-task catch --episodes 100 --seed 1
+"""
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+
+TRIALS_DIR = 'hp_trials'
+
+
+def train(extra_args, seed):
+    before = set(os.listdir(TRIALS_DIR))
+    # Same seed for the hyperparameter sampling of hyperopt, so both runs use the same parameters
+    env = {**os.environ, 'HYPEROPT_FMIN_SEED': str(seed)}
+    subprocess.run([sys.executable, 'main.py', '--max_evals', '1', '--seed', str(seed)] + extra_args,
+                   check=True, env=env)
+
+    new_files = sorted(set(os.listdir(TRIALS_DIR)) - before)
+    with open(os.path.join(TRIALS_DIR, new_files[-1]), 'rb') as f:
+        trials = pickle.load(f)
+    return np.array(trials.results[-1]['rewards'])
+
+
+def moving_average(a, n=10):
+    return np.convolve(a, np.ones(n) / n, mode='valid') if len(a) >= n else a
+
+
+def run(domain='ball_in_cup', task='catch', episodes=100, seed=1):
+    common = ['--env-domain', domain, '--env-task', task, '--episodes', str(episodes)]
+    fp32 = train(common, seed)
+    bf16 = train(common + ['--bf16_autocast'], seed)
+    return fp32, bf16
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the learning curves of float32 and bfloat16 autocast")
+    parser.add_argument('--env-domain', type=str, default='ball_in_cup')
+    parser.add_argument('--env-task', type=str, default='catch')
+    parser.add_argument('--episodes', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    fp32, bf16 = run(args.env_domain, args.env_task, args.episodes, args.seed)
+    fp32_avg, bf16_avg = moving_average(fp32), moving_average(bf16)
+
+    print(f"\n--- {args.env_domain}/{args.env_task}, seed {args.seed} ".ljust(75, '-'))
+    print(f"{'episode'.ljust(10)}{'fp32 reward'.rjust(15)}{'bf16 reward'.rjust(15)}   (moving average of 10)")
+    for episode in range(0, len(fp32_avg), max(1, len(fp32_avg) // 10)):
+        print(f"{str(episode).ljust(10)}{fp32_avg[episode]:15.1f}{bf16_avg[episode]:15.1f}")
+    print(f"max reward: fp32 {fp32.max():.1f} | bf16 {bf16.max():.1f}")
+    print(f"mean reward of the last 10 episodes: fp32 {fp32[-10:].mean():.1f} | bf16 {bf16[-10:].mean():.1f}")
@@ -0,0 +1,38 @@
+"""
+Update throughput of SACAlgorithm in float32 compared to bfloat16 autocast.
+
+    python -m benchmarks.bf16_update --hidden_dims 512 1024 2048
+"""
+import argparse
+
+import torch
+
+from SAC_Implementation.SACAlgorithm import SACAlgorithm
+from benchmarks.common import measure, print_results, BenchEnv, sac_param, fill_sac_buffer
+
+
+def run(hidden_dims=(512, 1024, 2048), batch_size=128, repeat=50):
+    results = {}
+    for hidden_dim in hidden_dims:
+        for bf16 in (False, True):
+            torch.manual_seed(0)
+            sac = SACAlgorithm(BenchEnv(), sac_param(hidden_dim=hidden_dim, sample_batch_size=batch_size,
+                                                     bf16_autocast=bf16))
+            fill_sac_buffer(sac)
+            # Step 0 runs the critic, the policy and the targets
+            results[f"{'bf16' if bf16 else 'fp32'} h={hidden_dim}"] = measure(lambda: sac.update(0), repeat=repeat,
+                                                                              warmup=5)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the SAC update with bfloat16 autocast")
+    parser.add_argument('--hidden_dims', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--batch_size', type=int, default=128)
+    args = parser.parse_args()
+
+    results = run(hidden_dims=args.hidden_dims, batch_size=args.batch_size)
+    print_results(results, f"SAC update, batch {args.batch_size}, {torch.get_num_threads()} threads")
+    for hidden_dim in args.hidden_dims:
+        speedup = results[f'fp32 h={hidden_dim}']['median_us'] / results[f'bf16 h={hidden_dim}']['median_us']
+        print(f"h={hidden_dim}: {speedup:.2f}x updates per second with bf16")
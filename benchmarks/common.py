@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+
+
+def measure(fn, repeat=200, warmup=10):
+    """
+    Time a function call.
+    :param fn: Function without arguments
+    :param repeat: Number of timed calls
+    :param warmup: Number of calls before the timing starts
+    :return: dict with mean, median, p90 and min in microseconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        _start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - _start
+
+    timings *= 1e6
+    return {'mean_us': float(timings.mean()),
+            'median_us': float(np.median(timings)),
+            'p90_us': float(np.percentile(timings, 90)),
+            'min_us': float(timings.min())}
+
+
+def print_results(results: dict, header: str):
+    print(f"\n--- {header.ljust(70, '-')}")
+    for name, stats in results.items():
+        print(f"{name.ljust(40)} median {stats['median_us']:10.1f}us | mean {stats['mean_us']:10.1f}us "
+              f"| p90 {stats['p90_us']:10.1f}us")
+
+
+def fill_buffer(buffer, rng=None):
+    """Fill all columns of a numpy based replay buffer with random data without going through add."""
+    rng = rng or np.random.default_rng(0)
+    for column in ('obs', 'next_obs', 'action', 'reward'):
+        if hasattr(buffer, column):
+            array = getattr(buffer, column)
+            # Chunked to keep the memory of the random numbers small
+            for start in range(0, len(array), 2 ** 16):
+                chunk = array[start:start + 2 ** 16]
+                chunk[:] = rng.standard_normal(chunk.shape)
+    buffer.done[:] = 0
+    buffer.done_no_max[:] = 0
+    buffer.idx = 0
+    buffer.full = True
+
+
+class Space:
+    """Box space with only a shape, enough for SACAlgorithm and the buffers"""
+
+    def __init__(self, dim):
+        self.shape = (dim,)
+
+
+class BenchEnv:
+    """Stand-in for a dmc2gym environment where only the dimensions are needed"""
+
+    def __init__(self, state_dim=24, action_dim=6):
+        self.observation_space = Space(state_dim)
+        self.action_space = Space(action_dim)
+
+
+def sac_param(**overrides):
+    """Parameters of SACAlgorithm with the defaults of main.py"""
+    param = {'hidden_dim': 512, 'lr_critic': 1e-3, 'lr_actor': 5e-4, 'alpha': 0.01, 'tau': 0.01, 'gamma': 0.98,
+             'sample_batch_size': 128, 'replay_buffer_size': 10 ** 5, 'gpu_device': '0', 'init_alpha': 0.1,
+             'alpha_lr': 1e-4, 'alpha_beta': 0.5, 'alpha_decay_deactivate': False,
+             'policy_hidden_layers': 1, 'q_hidden_layers': 1}
+    param.update(overrides)
+    return param
+
+
+def fill_sac_buffer(sac, n=10 ** 4, rng=None):
+    """Add n random transitions to the buffer of a SACAlgorithm"""
+    rng = rng or np.random.default_rng(0)
+    state_dim, action_dim = sac.state_dim, sac.action_dim
+    sac.buffer.add_batch(obs=rng.standard_normal((n, state_dim)),
+                         action=rng.uniform(-1, 1, (n, action_dim)),
+                         reward=rng.standard_normal(n),
+                         next_obs=rng.standard_normal((n, state_dim)),
+                         done=np.zeros(n),
+                         done_no_max=np.zeros(n))
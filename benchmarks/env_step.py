@@ -0,0 +1,52 @@
+"""
+Environment steps per second of dmc2gym tasks with uniform random actions, including the resets at the end of the
+episodes. Needs dmc2gym.
+
+    python -m benchmarks.env_step --tasks ball_in_cup/catch cheetah/run --frame_skip 4
+"""
+import argparse
+
+import numpy as np
+
+from SAC_Implementation.VectorEnv import make_dmc_env
+from benchmarks.common import measure
+
+TASKS = ('ball_in_cup/catch', 'cheetah/run', 'walker/walk')
+
+
+def run(tasks=TASKS, frame_skip=4, seed=1, repeat=1000):
+    """
+    :param tasks: domain/task of dm_control
+    :return: Stats of one step per task, with steps_per_sec
+    """
+    results = {}
+    for task in tasks:
+        domain_name, task_name = task.split('/')
+        env = make_dmc_env(seed, domain_name=domain_name, task_name=task_name, frame_skip=frame_skip)
+        rng = np.random.default_rng(seed)
+        low, high = env.action_space.low, env.action_space.high
+        env.reset()
+
+        def step():
+            _, _, done, _ = env.step(rng.uniform(low, high))
+            if done:
+                env.reset()
+
+        stats = measure(step, repeat=repeat)
+        stats['steps_per_sec'] = 1e6 / stats['mean_us']
+        results[f'{task} frame_skip={frame_skip}'] = stats
+        if hasattr(env, 'close'):
+            env.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the steps per second of dmc2gym environments")
+    parser.add_argument('--tasks', type=str, nargs='+', default=list(TASKS), help='domain/task, e.g. cheetah/run')
+    parser.add_argument('--frame_skip', type=int, default=4)
+    args = parser.parse_args()
+
+    results = run(tasks=args.tasks, frame_skip=args.frame_skip)
+    print(f"\n--- {'Environment steps'.ljust(70, '-')}")
+    for name, stats in results.items():
+        print(f"{name.ljust(40)} {stats['steps_per_sec']:10.1f} steps/s | median {stats['median_us']:10.1f}us")
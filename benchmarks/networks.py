@@ -0,0 +1,58 @@
+"""
+Forward and forward + backward pass of SoftQNetwork and PolicyNetwork (with the reparameterized sample of the
+update) for several hidden sizes and numbers of hidden layers.
+
+    python -m benchmarks.networks --hidden_dims 256 512 1024 --hidden_layers 1 2 3
+"""
+import argparse
+
+import torch
+
+from SAC_Implementation.Networks import SoftQNetwork, PolicyNetwork
+from benchmarks.common import measure, print_results
+
+
+def run(hidden_dims=(256, 512, 1024), hidden_layers=(1, 2, 3), state_dim=24, action_dim=6, batch_size=128,
+        repeat=100):
+    results = {}
+    for hidden_dim in hidden_dims:
+        for layers in hidden_layers:
+            torch.manual_seed(0)
+            q = SoftQNetwork(state_dim, action_dim, hidden_dim, 1e-3, 0, hidden_layers=layers)
+            policy = PolicyNetwork(state_dim, action_dim, hidden_dim, 1e-3, 0, hidden_layers=layers)
+            state = torch.randn(batch_size, state_dim, device=policy.device)
+            action = torch.randn(batch_size, action_dim, device=q.device)
+
+            def q_forward():
+                with torch.no_grad():
+                    q(state, action)
+
+            def q_backward():
+                q.zero_grad(set_to_none=True)
+                q(state, action).mean().backward()
+
+            def policy_forward():
+                with torch.no_grad():
+                    policy(state)
+
+            def policy_backward():
+                policy.zero_grad(set_to_none=True)
+                policy.sample(state)[2].mean().backward()
+
+            case = f'h={hidden_dim} layers={layers}'
+            results[f'SoftQNetwork forward {case}'] = measure(q_forward, repeat=repeat)
+            results[f'SoftQNetwork forward+backward {case}'] = measure(q_backward, repeat=repeat)
+            results[f'PolicyNetwork forward {case}'] = measure(policy_forward, repeat=repeat)
+            results[f'PolicyNetwork sample+backward {case}'] = measure(policy_backward, repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the forward and backward pass of the networks")
+    parser.add_argument('--hidden_dims', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--hidden_layers', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--batch_size', type=int, default=128)
+    args = parser.parse_args()
+
+    print_results(run(hidden_dims=args.hidden_dims, hidden_layers=args.hidden_layers, batch_size=args.batch_size),
+                  f"Networks, batch {args.batch_size}, {torch.get_num_threads()} threads")
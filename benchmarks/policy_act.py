@@ -0,0 +1,70 @@
+"""
+Latency of acting with a single observation: SACAlgorithm.sample_action (autograd, log probability) compared to
+the inference path PolicyNetwork.act. With --batch_sizes, acting for N observations one by one compared to one
+batched call of SACAlgorithm.act.
+
+    python -m benchmarks.policy_act --hidden_dim 512 --batch_sizes 8 64
+"""
+import argparse
+
+import numpy as np
+import torch
+
+from SAC_Implementation.Networks import PolicyNetwork
+from SAC_Implementation.SACAlgorithm import SACAlgorithm
+from benchmarks.common import measure, print_results, BenchEnv, sac_param
+
+
+def run(hidden_dim=512, state_dim=24, action_dim=6, hidden_layers=1, repeat=2000):
+    policy = PolicyNetwork(state_dim, action_dim, hidden_dim, 1e-3, 0, hidden_layers=hidden_layers)
+    # Observations of dm_control are float64
+    obs = np.random.default_rng(0).standard_normal(state_dim)
+    obs32 = obs.astype(np.float32)
+
+    def current():
+        action, _, log_pi = policy.sample(torch.Tensor(obs))
+        return action.detach().cpu().data.numpy(), log_pi
+
+    # The deterministic action of both paths is the squashed mean
+    error = np.abs(current()[0] - policy.act(obs, deterministic=True)).max()
+    assert error < 1e-5, f"act differs from sample by {error}"
+
+    return {
+        'sample (current path)': measure(current, repeat=repeat),
+        'act deterministic': measure(lambda: policy.act(obs, deterministic=True), repeat=repeat),
+        'act stochastic': measure(lambda: policy.act(obs, deterministic=False), repeat=repeat),
+        'act deterministic float32': measure(lambda: policy.act(obs32, deterministic=True), repeat=repeat),
+    }
+
+
+def run_batched(batch_sizes=(8, 64), hidden_dim=512, state_dim=24, action_dim=6, hidden_layers=1, repeat=500):
+    sac = SACAlgorithm(BenchEnv(state_dim, action_dim), sac_param(hidden_dim=hidden_dim,
+                                                                  policy_hidden_layers=hidden_layers))
+    results = {}
+    for n in batch_sizes:
+        obs = np.random.default_rng(0).standard_normal((n, state_dim)).astype(np.float32)
+        out = np.empty((n, action_dim), dtype=np.float32)
+
+        def one_by_one():
+            for i in range(n):
+                sac.act(obs[i], deterministic=False, out=out[i])
+
+        results[f'{n} x act(obs)'] = measure(one_by_one, repeat=repeat)
+        results[f'act(obs_batch) N={n}'] = measure(lambda: sac.act(obs, deterministic=False, out=out), repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the acting latency of the policy")
+    parser.add_argument('--hidden_dim', type=int, default=512)
+    parser.add_argument('--hidden_layers', type=int, default=1)
+    parser.add_argument('--batch_sizes', type=int, nargs='*', default=[],
+                        help='Also compare acting one by one with batched acting for these numbers of observations')
+    args = parser.parse_args()
+
+    print_results(run(hidden_dim=args.hidden_dim, hidden_layers=args.hidden_layers),
+                  f"Acting with one observation, hidden {args.hidden_dim}, {torch.get_num_threads()} threads")
+    if args.batch_sizes:
+        print_results(run_batched(batch_sizes=args.batch_sizes, hidden_dim=args.hidden_dim,
+                                  hidden_layers=args.hidden_layers),
+                      f"Acting with many observations, hidden {args.hidden_dim}")
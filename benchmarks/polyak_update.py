@@ -0,0 +1,53 @@
+"""
+Soft update of the target networks: the former per parameter loop compared to the foreach ops of soft_update and
+SoftQNetwork.update_params.
+
+    python -m benchmarks.polyak_update --hidden_dims 512 1024 2048
+"""
+import argparse
+from copy import deepcopy
+
+import torch
+
+from SAC_Implementation.Networks import SoftQNetwork, soft_update
+from benchmarks.common import measure, print_results
+
+
+def loop_update(target, params, tau):
+    """The former SoftQNetwork.update_params"""
+    for param, target_param in zip(params, target.parameters()):
+        target_param.data.copy_(
+            tau * param.data + (1 - tau) * target_param.data
+        )
+
+
+def run(hidden_dims=(512, 1024, 2048), state_dim=24, action_dim=6, hidden_layers=1, tau=0.01, repeat=200):
+    results = {}
+    for hidden_dim in hidden_dims:
+        q = SoftQNetwork(state_dim, action_dim, hidden_dim, 1e-3, 0, hidden_layers=hidden_layers)
+        q_target = deepcopy(q)
+
+        # Both variants have to produce the same parameters
+        q_check = deepcopy(q_target)
+        loop_update(q_target, q.parameters(), tau)
+        soft_update(q_check.parameters(), q.parameters(), tau)
+        error = max((a - b).abs().max().item() for a, b in zip(q_target.parameters(), q_check.parameters()))
+        assert error < 1e-6, f"soft_update differs from the loop by {error}"
+
+        results[f'loop h={hidden_dim}'] = measure(lambda: loop_update(q_target, q.parameters(), tau), repeat=repeat)
+        results[f'foreach h={hidden_dim}'] = measure(lambda: soft_update(q_target.parameters(), q.parameters(), tau),
+                                                     repeat=repeat)
+        # What SACAlgorithm.update calls for every target network
+        results[f'update_params h={hidden_dim}'] = measure(lambda: q_target.update_params(q.parameters(), tau),
+                                                           repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Polyak update of the target networks")
+    parser.add_argument('--hidden_dims', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--hidden_layers', type=int, default=1)
+    args = parser.parse_args()
+
+    print_results(run(hidden_dims=args.hidden_dims, hidden_layers=args.hidden_layers),
+                  f"Polyak update, {torch.get_num_threads()} threads")
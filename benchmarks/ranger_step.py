@@ -0,0 +1,67 @@
+"""
+Step time of the optimizers of the networks: optim.Adam, Ranger and RangerForeach. Checks first that RangerForeach
+follows Ranger over several lookahead periods.
+
+    python -m benchmarks.ranger_step --hidden_dims 256 512 1024
+"""
+import argparse
+import contextlib
+import io
+from copy import deepcopy
+
+import torch
+import torch.optim as optim
+
+from SAC_Implementation.Networks import SoftQNetwork
+from SAC_Implementation.ranger import Ranger, RangerForeach
+from benchmarks.common import measure, print_results
+
+
+def quiet(optimizer_class, params, **kwargs):
+    # Ranger prints its configuration
+    with contextlib.redirect_stdout(io.StringIO()):
+        return optimizer_class(params, **kwargs)
+
+
+def check_parity(network, steps=25, batch_size=128):
+    reference, candidate = deepcopy(network), deepcopy(network)
+    reference_optimizer = quiet(Ranger, reference.parameters(), lr=1e-3)
+    candidate_optimizer = quiet(RangerForeach, candidate.parameters(), lr=1e-3)
+
+    generator = torch.Generator().manual_seed(0)
+    state_dim = network.linear1.in_features - 1
+    for _ in range(steps):
+        state = torch.randn(batch_size, state_dim, generator=generator)
+        action = torch.randn(batch_size, 1, generator=generator)
+        for net, optimizer in ((reference, reference_optimizer), (candidate, candidate_optimizer)):
+            optimizer.zero_grad()
+            net(state, action).pow(2).mean().backward()
+            optimizer.step()
+
+    return max((a - b).abs().max().item() for a, b in zip(reference.parameters(), candidate.parameters()))
+
+
+def run(hidden_dims=(256, 512, 1024), state_dim=24, action_dim=6, hidden_layers=1, repeat=200):
+    error = check_parity(SoftQNetwork(state_dim, 1, 64, 1e-3, 0, hidden_layers=hidden_layers))
+    assert error < 1e-5, f"RangerForeach differs from Ranger by {error}"
+    print(f"RangerForeach matches Ranger after 25 steps, max difference {error:.2e}")
+
+    results = {}
+    for hidden_dim in hidden_dims:
+        for name, optimizer_class in (('Adam', optim.Adam), ('Ranger', Ranger), ('RangerForeach', RangerForeach)):
+            network = SoftQNetwork(state_dim, action_dim, hidden_dim, 1e-3, 0, hidden_layers=hidden_layers)
+            network(torch.randn(128, state_dim), torch.randn(128, action_dim)).mean().backward()
+            optimizer = quiet(optimizer_class, network.parameters(), lr=1e-3)
+            # The gradients stay the same, only the step is timed
+            results[f'{name} h={hidden_dim}'] = measure(optimizer.step, repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the step of the optimizers")
+    parser.add_argument('--hidden_dims', type=int, nargs='+', default=[256, 512, 1024])
+    parser.add_argument('--hidden_layers', type=int, default=1)
+    args = parser.parse_args()
+
+    print_results(run(hidden_dims=args.hidden_dims, hidden_layers=args.hidden_layers),
+                  f"Optimizer step, {torch.get_num_threads()} threads")
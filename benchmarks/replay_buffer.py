@@ -0,0 +1,40 @@
+"""
+ReplayBuffer.add of one transition and ReplayBuffer.sample at several capacities.
+
+    python -m benchmarks.replay_buffer --capacities 10000 100000 1000000 --batch_size 128
+"""
+import argparse
+
+import numpy as np
+
+from SAC_Implementation.ReplayBuffer import ReplayBuffer
+from benchmarks.common import measure, print_results, fill_buffer
+
+
+def run(capacities=(10 ** 4, 10 ** 5, 10 ** 6), obs_dim=24, action_dim=6, batch_size=128, repeat=500):
+    rng = np.random.default_rng(0)
+    # Observations of dm_control are float64
+    obs, next_obs = rng.standard_normal(obs_dim), rng.standard_normal(obs_dim)
+    action = rng.uniform(-1, 1, action_dim)
+
+    results = {}
+    for capacity in capacities:
+        # add goes around the ring of a small buffer, it costs the same as in a full one
+        adding = ReplayBuffer(obs_dim, action_dim, capacity)
+        results[f'add capacity={capacity}'] = measure(
+            lambda: adding.add(obs=obs, action=action, reward=0.5, next_obs=next_obs, done=False), repeat=repeat)
+
+        sampling = ReplayBuffer(obs_dim, action_dim, capacity)
+        fill_buffer(sampling, rng)
+        results[f'sample capacity={capacity}'] = measure(lambda: sampling.sample(batch_size), repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark adding to and sampling from the replay buffer")
+    parser.add_argument('--capacities', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--batch_size', type=int, default=128)
+    args = parser.parse_args()
+
+    print_results(run(capacities=args.capacities, batch_size=args.batch_size),
+                  f"Replay buffer add and sample, batch {args.batch_size}")
@@ -0,0 +1,46 @@
+"""
+Sampling latency of the memory mapped replay buffer compared to the in-memory one.
+
+    python -m benchmarks.replay_memmap --capacity 1000000 --directory /tmp/replay_bench
+"""
+import argparse
+import shutil
+import tempfile
+
+from SAC_Implementation.ReplayBuffer import ReplayBuffer, MemmapReplayBuffer
+from benchmarks.common import measure, print_results, fill_buffer
+
+
+def run(capacity=10 ** 6, obs_dim=8, action_dim=2, batch_size=128, directory=None, repeat=500):
+    cleanup = directory is None
+    directory = directory or tempfile.mkdtemp(prefix='replay_bench_')
+
+    try:
+        in_memory = ReplayBuffer(obs_dim, action_dim, capacity)
+        fill_buffer(in_memory)
+
+        mapped = MemmapReplayBuffer(obs_dim, action_dim, capacity, directory=directory, dtype='float64')
+        fill_buffer(mapped)
+        mapped.flush()
+
+        results = {
+            'ReplayBuffer.sample': measure(lambda: in_memory.sample(batch_size), repeat=repeat),
+            'MemmapReplayBuffer.sample': measure(lambda: mapped.sample(batch_size), repeat=repeat),
+        }
+    finally:
+        if cleanup:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the memory mapped replay buffer")
+    parser.add_argument('--capacity', type=int, default=10 ** 6)
+    parser.add_argument('--batch_size', type=int, default=128)
+    parser.add_argument('--directory', type=str, default=None,
+                        help='Directory for the mapped files, a temporary one if not set')
+    args = parser.parse_args()
+
+    print_results(run(capacity=args.capacity, batch_size=args.batch_size, directory=args.directory),
+                  f"Replay sampling, capacity {args.capacity}, batch {args.batch_size}")
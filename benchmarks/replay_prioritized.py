@@ -0,0 +1,44 @@
+"""
+Cost of one prioritized replay round trip (sample + update_priorities) compared to uniform sampling.
+
+    python -m benchmarks.replay_prioritized --capacity 1000000 --batch_size 128
+"""
+import argparse
+
+import numpy as np
+
+from SAC_Implementation.ReplayBuffer import ReplayBuffer, PrioritizedReplayBuffer
+from benchmarks.common import measure, print_results, fill_buffer
+
+
+def run(capacity=10 ** 6, obs_dim=8, action_dim=2, batch_size=128, repeat=500):
+    rng = np.random.default_rng(0)
+
+    uniform = ReplayBuffer(obs_dim, action_dim, capacity)
+    fill_buffer(uniform, rng)
+
+    prioritized = PrioritizedReplayBuffer(obs_dim, action_dim, capacity)
+    fill_buffer(prioritized, rng)
+    prioritized.tree.update(np.arange(capacity), rng.random(capacity) ** prioritized.alpha)
+
+    def round_trip():
+        idxs = prioritized.sample(batch_size)[-1]
+        prioritized.update_priorities(idxs, rng.random(batch_size))
+
+    return {
+        'ReplayBuffer.sample': measure(lambda: uniform.sample(batch_size), repeat=repeat),
+        'PrioritizedReplayBuffer.sample': measure(lambda: prioritized.sample(batch_size), repeat=repeat),
+        'sample + update_priorities': measure(round_trip, repeat=repeat),
+        'SumTree.find': measure(lambda: prioritized.tree.find(rng.random(batch_size) * prioritized.tree.total),
+                                repeat=repeat),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the prioritized replay buffer")
+    parser.add_argument('--capacity', type=int, default=10 ** 6)
+    parser.add_argument('--batch_size', type=int, default=128)
+    args = parser.parse_args()
+
+    print_results(run(capacity=args.capacity, batch_size=args.batch_size),
+                  f"Prioritized replay, capacity {args.capacity}, batch {args.batch_size}")
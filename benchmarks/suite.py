@@ -0,0 +1,203 @@
+"""
+The benchmarks of the hot paths as one suite. run writes the results with the metadata of the machine to a JSON
+file, compare flags the cases which got slower than a threshold between two such files.
+
+    python -m benchmarks.suite run --output bench_before.json
+    python -m benchmarks.suite run --output bench_after.json
+    python -m benchmarks.suite compare bench_before.json bench_after.json --threshold 0.1
+
+No GPU is needed, with CUDA the networks run on the GPU like in the training (cuda_available in the metadata).
+--quick runs fewer sizes and repetitions, only results of the same mode are comparable.
+A benchmark whose dependency is missing (e.g. dmc2gym for env_step) is skipped and listed in the results.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import torch
+
+from benchmarks import env_step, networks, polyak_update, ranger_step, replay_buffer, update_step
+
+# The statistic of measure which is compared
+METRIC = 'median_us'
+
+
+def suite(quick=False):
+    """The benchmarks as name -> function without arguments which returns the results of its cases"""
+    if quick:
+        return {'replay_buffer': partial(replay_buffer.run, capacities=(10 ** 4, 10 ** 5), repeat=200),
+                'networks': partial(networks.run, hidden_dims=(256, 512), hidden_layers=(1, 2), repeat=20),
+                'update_step': partial(update_step.run, hidden_dims=(256,), repeat=20),
+                'ranger_step': partial(ranger_step.run, hidden_dims=(256, 512), repeat=50),
+                'polyak_update': partial(polyak_update.run, hidden_dims=(256, 512), repeat=50),
+                'env_step': partial(env_step.run, tasks=env_step.TASKS[:1], repeat=200)}
+    return {'replay_buffer': partial(replay_buffer.run, capacities=(10 ** 4, 10 ** 5, 10 ** 6)),
+            'networks': partial(networks.run, hidden_dims=(256, 512, 1024), hidden_layers=(1, 2, 3)),
+            'update_step': partial(update_step.run, hidden_dims=(256, 512, 1024)),
+            'ranger_step': partial(ranger_step.run, hidden_dims=(256, 512, 1024)),
+            'polyak_update': partial(polyak_update.run, hidden_dims=(256, 512, 1024)),
+            'env_step': partial(env_step.run)}
+
+
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_metadata(quick=False) -> dict:
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'hostname': platform.node(),
+            'platform': platform.platform(),
+            'cpu': _cpu_model(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'cuda_available': torch.cuda.is_available(),
+            'quick': quick}
+
+
+def run_suite(only=None, quick=False) -> dict:
+    """
+    :param only: Names of the benchmarks to run, all if None
+    :return: dict with the metadata, the results per benchmark and case and the skipped benchmarks
+    """
+    benchmarks = suite(quick)
+    unknown = set(only or ()) - set(benchmarks)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {sorted(unknown)}, the suite has {list(benchmarks)}")
+
+    output = {'metadata': machine_metadata(quick), 'results': {}, 'skipped': {}}
+    for name, benchmark in benchmarks.items():
+        if only and name not in only:
+            continue
+        _start = time.time()
+        try:
+            output['results'][name] = benchmark()
+        except ImportError as e:
+            logging.warning(f"Skipping {name}: {e}")
+            output['skipped'][name] = str(e)
+            continue
+        logging.info(f"{name} done in {time.time() - _start:.1f}s")
+    return output
+
+
+def compare(baseline: dict, candidate: dict, threshold=0.1, metric=METRIC):
+    """
+    Compare the cases which are in both results.
+    :param threshold: Relative slowdown of a case which is a regression, 0.1 = 10% slower
+    :return: List of (benchmark, case, baseline, candidate, ratio, status) with the status ok, faster, regression,
+        missing (only in the baseline) or new (only in the candidate)
+    """
+    rows = []
+    for name, cases in baseline['results'].items():
+        for case, stats in cases.items():
+            new = candidate['results'].get(name, {}).get(case)
+            if new is None:
+                rows.append((name, case, stats[metric], None, None, 'missing'))
+                continue
+            ratio = new[metric] / stats[metric]
+            if ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 / (1 + threshold):
+                status = 'faster'
+            else:
+                status = 'ok'
+            rows.append((name, case, stats[metric], new[metric], ratio, status))
+    for name, cases in candidate['results'].items():
+        for case, stats in cases.items():
+            if case not in baseline['results'].get(name, {}):
+                rows.append((name, case, None, stats[metric], None, 'new'))
+    return rows
+
+
+def _machine_differences(baseline: dict, candidate: dict):
+    keys = ('cpu', 'cpu_count', 'torch_threads', 'torch', 'numpy', 'quick')
+    return [f"{key}: {baseline['metadata'].get(key)} -> {candidate['metadata'].get(key)}" for key in keys
+            if baseline['metadata'].get(key) != candidate['metadata'].get(key)]
+
+
+def print_comparison(rows, metric=METRIC):
+    print(f"\n--- {f'Comparison of {metric}'.ljust(70, '-')}")
+    for name, case, old, new, ratio, status in rows:
+        label = f"{name}: {case}".ljust(60)
+        if new is None:
+            print(f"{label} {old:10.1f}us ->    missing")
+        elif old is None:
+            print(f"{label}        new -> {new:10.1f}us")
+        else:
+            marker = {'regression': 'REGRESSION', 'faster': 'faster'}.get(status, '')
+            print(f"{label} {old:10.1f}us -> {new:10.1f}us {ratio:6.2f}x {marker}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite of the SAC hot paths")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the suite and write the results as JSON')
+    run_parser.add_argument('--output', type=str, default='benchmark_results.json')
+    run_parser.add_argument('--only', type=str, nargs='+', default=None, help='Run only these benchmarks')
+    run_parser.add_argument('--quick', action='store_true', help='Fewer sizes and repetitions')
+    run_parser.add_argument('--threads', type=int, default=None, help='Threads of torch, its default if not given')
+
+    compare_parser = commands.add_parser('compare', help='Compare two results and flag the regressions')
+    compare_parser.add_argument('baseline', type=str)
+    compare_parser.add_argument('candidate', type=str)
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative slowdown which counts as a regression, 0.1 = 10%% slower')
+    compare_parser.add_argument('--metric', type=str, default=METRIC, choices=['median_us', 'mean_us', 'p90_us',
+                                                                              'min_us'])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    if args.command == 'run':
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        output = run_suite(only=args.only, quick=args.quick)
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        logging.info(f"Results of {len(output['results'])} benchmarks written to {args.output}, "
+                     f"skipped: {list(output['skipped']) or 'none'}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    for difference in _machine_differences(baseline, candidate):
+        logging.warning(f"The results come from different setups, {difference}")
+
+    rows = compare(baseline, candidate, threshold=args.threshold, metric=args.metric)
+    print_comparison(rows, metric=args.metric)
+    regressions = [row for row in rows if row[-1] == 'regression']
+    compared = [row for row in rows if row[-2] is not None]
+    print(f"\n{len(regressions)} of {len(compared)} cases are more than {args.threshold:.0%} slower")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
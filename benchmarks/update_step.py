@@ -0,0 +1,39 @@
+"""
+Time of SACAlgorithm.update (sampling, targets, critic, policy, alpha and Polyak update), eager and with the
+gradient step compiled by torch.compile.
+
+    python -m benchmarks.update_step --hidden_dims 256 512 --compile
+"""
+import argparse
+
+import torch
+
+from SAC_Implementation.SACAlgorithm import SACAlgorithm
+from benchmarks.common import measure, print_results, BenchEnv, sac_param, fill_sac_buffer
+
+
+def run(hidden_dims=(256, 512), batch_size=128, compile_update=False, repeat=100, **overrides):
+    results = {}
+    for hidden_dim in hidden_dims:
+        for compiled in ((False, True) if compile_update else (False,)):
+            # Every instance compiles its own step, the cache of the previous one is not needed
+            torch._dynamo.reset()
+            torch.manual_seed(0)
+            sac = SACAlgorithm(BenchEnv(), sac_param(hidden_dim=hidden_dim, sample_batch_size=batch_size,
+                                                     compile_update=compiled, **overrides))
+            fill_sac_buffer(sac)
+            # Step 0 runs the gradient step, the warmup includes the compilation
+            results[f"{'compiled' if compiled else 'eager'} h={hidden_dim}"] = measure(lambda: sac.update(0),
+                                                                                       repeat=repeat, warmup=10)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark SACAlgorithm.update")
+    parser.add_argument('--hidden_dims', type=int, nargs='+', default=[256, 512])
+    parser.add_argument('--batch_size', type=int, default=128)
+    parser.add_argument('--compile', action='store_true', help='Also time the update with torch.compile')
+    args = parser.parse_args()
+
+    print_results(run(hidden_dims=args.hidden_dims, batch_size=args.batch_size, compile_update=args.compile),
+                  f"SAC update, batch {args.batch_size}, {torch.get_num_threads()} threads")
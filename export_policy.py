@@ -0,0 +1,70 @@
+"""
+Export the policy of a trained SACAlgorithm from a hyperopt trials file (see hp_trials/).
+
+    python export_policy.py hp_trials/<round>_<date>.model --output exported --episodes 10
+"""
+import argparse
+import json
+import logging
+import os
+
+from SAC_Implementation import policy_export
+from SAC_Implementation.NumpyPolicy import NumpyPolicy
+
+NUMPY_TOLERANCE = 1e-4
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the policy of a trained SAC agent")
+    parser.add_argument('trials_file', type=str, help='*.model file of the hyperparameter tuning')
+    parser.add_argument('--trial', type=int, default=None, help='Index of the trial, the best one if not set')
+    parser.add_argument('--output', type=str, default='exported', help='Directory of the exported files')
+    parser.add_argument('--episodes', type=int, default=10,
+                        help='Episodes to compare the returns of the exported policies, 0 to skip the environment')
+    parser.add_argument('--log_level', type=str, default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=args.log_level)
+    os.makedirs(args.output, exist_ok=True)
+
+    result = policy_export.load_trial(args.trials_file, args.trial)
+    params, policy = result['params'], result['model'].policy
+
+    quantized_path = os.path.join(args.output, 'policy_int8.pt')
+    policy_export.save_quantized_policy(policy, quantized_path)
+    quantized = policy_export.load_quantized_policy(quantized_path)
+    logging.info(f"Saved the int8 policy to {quantized_path}")
+
+    numpy_path = os.path.join(args.output, 'policy.npz')
+    policy_export.export_numpy_policy(policy, numpy_path)
+    numpy_policy = NumpyPolicy.load(numpy_path)
+    logging.info(f"Saved the policy for the NumPy runner to {numpy_path}")
+
+    env = None
+    if args.episodes > 0:
+        # Only needed for the returns, dmc2gym is imported by train
+        from SAC_Implementation.train import initialize_environment
+
+        env, _, _ = initialize_environment(domain_name=params.get('env_domain'),
+                                           task_name=params.get('env_task'),
+                                           seed=params.get('seed'),
+                                           frame_skip=params.get('frame_skip'))
+
+    report = policy_export.evaluation_report(policy, quantized, env=env, episodes=args.episodes,
+                                             max_steps=params.get('max_steps') or 1000, seed=params.get('seed') or 1)
+
+    # Dynamic quantization does not pay off for small layers on every CPU
+    if report['int8_latency_us'] > report['fp32_latency_us']:
+        logging.warning(f"The int8 policy is slower than the fp32 one on this machine "
+                        f"({report['int8_latency_us']:.1f} us vs {report['fp32_latency_us']:.1f} us per action), "
+                        f"deploy {quantized_path} only for its size")
+
+    # The NumPy runner has to reproduce the torch policy
+    report['numpy_parity'] = policy_export.numpy_parity(policy, numpy_policy)
+    if max(report['numpy_parity'].values()) > NUMPY_TOLERANCE:
+        logging.error(f"The NumPy runner differs from the torch policy: {report['numpy_parity']}")
+    with open(os.path.join(args.output, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    policy_export.print_report(report)
+
+    if max(report['numpy_parity'].values()) > NUMPY_TOLERANCE:
+        raise SystemExit(1)
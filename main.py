@@ -34,9 +34,18 @@ parameter = {
     "hidden_dim": 512,
     "lr-actor": 5e-4,
     "lr-critic": 1e-3,
+    # adam, ranger or ranger_foreach (Ranger with multi-tensor ops)
+    "optimizer": "adam",
 
     "policy_hidden_layers": 1,
     "q_hidden_layers": 1,
+    # One batched ensemble module for all critics instead of two separate Q networks
+    "ensemble_critic": False,
+    "num_critics": 2,
+    # Run the forward and backward passes of the updates in bfloat16
+    "bf16_autocast": False,
+    # Compile the gradient step of the updates with torch.compile
+    "compile_update": False,
 
     # Parameter for RL
     "gamma": 0.98,
@@ -48,15 +57,55 @@ parameter = {
     "env_task": "catch",
     "seed": 1,
     "frame-skip": 4,
+    # Number of environments stepped in parallel worker processes (1 = one environment in the training loop)
+    "num_envs": 1,
+    # Number of asynchronous actor processes, the training process only updates (0 = off)
+    "actors": 0,
+    # Learner updates between two publications of the policy weights to the actors
+    "policy_sync_interval": 10,
+    # Environment steps the actors may be ahead of the update-to-data ratio, max_steps if None
+    "max_actor_lead": None,
 
     # Parameter for running RL
     "replay_buffer_size": 10 ** 6,
+    # float64 keeps the plain buffer, float32/float16/bfloat16 use the compact one
+    "buffer_dtype": "float64",
+    # Directory for a memory mapped replay buffer which survives restarts. None keeps it in RAM
+    "buffer_dir": None,
+    # Prioritized experience replay
+    "prioritized_replay": False,
+    "per_alpha": 0.6,
+    "per_beta": 0.4,
+    # Keep the replay buffer as tensors on the training device
+    "buffer_on_device": False,
+    # Number of batches sampled ahead in a background thread (0 = off)
+    "prefetch_batches": 0,
+    # Number of steps of the TD targets
+    "n_step": 1,
     "sample_batch_size": 128,
     "episodes": 300,
     "max_steps": 128,
     # Hyperparameter-tuning
     "max_evals": 5,
 
+    # Evaluation of policy snapshots in background processes every eval_interval episodes (0 = off)
+    "eval_interval": 0,
+    # Deterministic episodes per snapshot
+    "eval_episodes": 10,
+    # Worker processes of the evaluation, the episodes of a snapshot run in parallel
+    "eval_workers": 2,
+
+    # Checkpoints of the training, None for none. The runs get a directory below it, the hyperopt trials are saved
+    # there as well
+    "checkpoint_dir": None,
+    # Episodes between two checkpoints
+    "checkpoint_interval": 10,
+    # Continue the runs of checkpoint_dir
+    "resume": False,
+
+    # Time of every phase of the training loop and the updates per episode, in the result under 'timing'
+    "timing": False,
+
     # ID of the GPU to use
     "gpu_device": "0",
 
@@ -69,7 +118,21 @@ parameter = {
     # Initial sampling
     # Number of rounds which are sampled random
     "init_rounds": -1,
-    "num_updates": 1
+    "num_updates": 1,
+
+    # Update schedule (see UpdateScheduler), the defaults are the former fixed schedule
+    # Transitions in the replay buffer before the first update
+    "warmup": 1000,
+    # Updates per environment step, can be fractional. num_updates if None
+    "utd_ratio": None,
+    # Environment steps between two update bursts
+    "burst_interval": 1,
+    # Total step with a burst of as many updates, max_steps if None and 0 for none
+    "initial_burst": None,
+    # Steps of an episode between two steps with gradient steps
+    "update_period": 2,
+    # Gradient steps of the critics per update of the policy and alpha
+    "policy_delay": 1
 }
 
 # HYPERPARAMETER training.
@@ -81,17 +144,19 @@ hyperparameter_space = {
     # "hidden_dim": hp.choice('hidden_dim', [512, 1024, 2048]),
 }
 
-args = parse(defaults=parameter)
+# The worker processes (environments, actors, evaluation) import this module again, they must not start a training
+if __name__ == '__main__':
+    args = parse(defaults=parameter)
 
-set_seed(args.get('seed'))
-# Setup the logging
-setup_logging(args)
-# The import must be done down here to allow the logging configuration
-from SAC_Implementation import train
+    set_seed(args.get('seed'))
+    # Setup the logging
+    setup_logging(args)
+    # The import must be done down here to allow the logging configuration
+    from SAC_Implementation import train
 
-# START training. Set Max Eval to 1 to just train one episode.
-train.prepare_hyperparameter_tuning({**args, **hyperparameter_space},
-                                    max_evals=args['max_evals'])
+    # START training. Set Max Eval to 1 to just train one episode.
+    train.prepare_hyperparameter_tuning({**args, **hyperparameter_space},
+                                        max_evals=args['max_evals'])
 
 ##
 
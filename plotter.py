@@ -22,15 +22,18 @@ class Plotter:
         self.policy_losses = []
         self.q_losses = []
         self.a_losses = []
+        self.entropies = []
         self.total_steps = []
         self.time = []
 
-    def add_to_lists(self, reward, length, policy_loss, q_loss, a_loss, total_steps, episode, time, log="INFO"):
+    def add_to_lists(self, reward, length, policy_loss, q_loss, a_loss, total_steps, episode, time, log="INFO",
+                     entropy=-1):
         self.rewards.append(reward)
         self.lengths.append(length)
         self.policy_losses.append(policy_loss)
         self.q_losses.append(q_loss)
         self.a_losses.append(a_loss)
+        self.entropies.append(entropy)
         self.total_steps.append(total_steps)
         self.time.append(time)
 